@@ -1,5 +1,11 @@
+import json
+
 from django.contrib import admin
 from django.forms import ModelForm
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import ugettext_lazy
 from django.contrib import messages
 from django.core.exceptions import ValidationError
@@ -8,6 +14,7 @@ from django import forms
 from tinymce.widgets import TinyMCE
 
 from .models import Signature, Petition, Organization, PytitionUser, PetitionTemplate, Permission, SlugModel
+from .models import RequestProfile
 from .views import send_confirmation_email
 
 
@@ -203,6 +210,13 @@ class PetitionAdmin(admin.ModelAdmin):
          })
     )
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The list only shows titles and signature numbers
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.only(*Petition.SUMMARY_FIELDS)
+        return queryset
+
     def non_confirmed_signature_number(self, petition):
         return petition.get_signature_number(confirmed=False)
     non_confirmed_signature_number.short_description = ugettext_lazy('Unconfirmed signatures')
@@ -338,3 +352,54 @@ class PetitionTemplateAdmin(admin.ModelAdmin):
 @admin.register(Permission)
 class PermissionAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('date', 'user', 'method', 'path', 'view', 'status', 'duration_ms', 'sql_count', 'sql_duration_ms')
+    list_filter = ('view', )
+    fields = ('date', 'user', 'method', 'path', 'view', 'status', 'duration_ms', 'sql_count', 'sql_duration_ms',
+              'download_link', 'sql_queries', 'profile_report')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/download', self.admin_site.admin_view(self.download_view),
+                 name='petition_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, profile_id):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment;filename=profile-{}.prof'.format(profile.id)
+        return response
+
+    def duration_ms(self, profile):
+        return round(profile.duration * 1000, 1)
+    duration_ms.short_description = ugettext_lazy('Duration (ms)')
+
+    def sql_duration_ms(self, profile):
+        return round(profile.sql_duration * 1000, 1)
+    sql_duration_ms.short_description = ugettext_lazy('SQL duration (ms)')
+
+    def download_link(self, profile):
+        return format_html('<a href="{}">{}</a>', reverse('admin:petition_requestprofile_download', args=[profile.id]),
+                           ugettext_lazy('Download the profile (pstats format)'))
+    download_link.short_description = ugettext_lazy('Profile')
+
+    def sql_queries(self, profile):
+        return format_html_join('', '<pre>{} ms: {}</pre>', ((round(query['time'] * 1000, 1), query['sql'])
+                                                            for query in json.loads(profile.queries)))
+    sql_queries.short_description = ugettext_lazy('SQL queries')
+
+    def profile_report(self, profile):
+        return format_html('<pre>{}</pre>', profile.report)
+    profile_report.short_description = ugettext_lazy('Report')
@@ -0,0 +1,133 @@
+"""
+User and organization autocomplete
+
+The invite and transfer dialogs search users and organizations at each
+keystroke. On PostgreSQL, the searches use the pg_trgm trigram indexes created
+by the migrations, and are ranked by prefix match then trigram similarity. On
+the other databases, they use an in-memory index of the sorted lowercase names
+and words, searched by prefix, which is rebuilt when a user or an organization
+changes in this process and at least every settings.AUTOCOMPLETE_INDEX_TIMEOUT
+seconds. At most settings.AUTOCOMPLETE_LIMIT results are returned, and they
+are cached for settings.AUTOCOMPLETE_CACHE_TIMEOUT seconds.
+"""
+import bisect
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+USER_FIELDS = ('username', 'first_name', 'last_name')
+ORG_FIELDS = ('slugname', 'name')
+
+# Ranks of the matches, the lowest first
+EXACT, PREFIX, NAME_PREFIX, WORD_PREFIX = range(4)
+
+
+class PrefixIndex:
+    """Sorted (token, rank, key) entries searched by bisection on the token"""
+    def __init__(self, entries, values):
+        self.entries = sorted(entries)
+        self.tokens = [entry[0] for entry in self.entries]
+        self.values = values
+
+    def search(self, query, limit):
+        query = query.lower()
+        ranks = {}
+        for i in range(bisect.bisect_left(self.tokens, query), len(self.tokens)):
+            token, rank, key = self.entries[i]
+            if not token.startswith(query):
+                break
+            if token == query and rank == PREFIX:
+                rank = EXACT
+            ranks[key] = min(rank, ranks.get(key, rank))
+        keys = sorted(ranks, key=lambda key: (ranks[key], key))[:limit]
+        return [self.values[key] for key in keys]
+
+
+def user_index():
+    entries, values = [], {}
+    for user in get_user_model().objects.values(*USER_FIELDS).iterator():
+        key = user['username']
+        values[key] = user
+        entries.append((key.lower(), PREFIX, key))
+        for name in (user['first_name'], user['last_name']):
+            if name:
+                entries.append((name.lower(), NAME_PREFIX, key))
+    return PrefixIndex(entries, values)
+
+
+def org_index():
+    from .models import Organization
+    entries, values = [], {}
+    for org in Organization.objects.values(*ORG_FIELDS).iterator():
+        key = org['slugname']
+        values[key] = org
+        entries.append((org['name'].lower(), PREFIX, key))
+        entries.append((key.lower(), NAME_PREFIX, key))
+        for word in org['name'].lower().split()[1:]:
+            entries.append((word, WORD_PREFIX, key))
+    return PrefixIndex(entries, values)
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(kind):
+    builder = {'users': user_index, 'orgs': org_index}[kind]
+    with _lock:
+        built = _indexes.get(kind)
+        if built is None or built[0] + settings.AUTOCOMPLETE_INDEX_TIMEOUT < time.monotonic():
+            built = (time.monotonic(), builder())
+            _indexes[kind] = built
+    return built[1]
+
+
+def invalidate(kind=None):
+    with _lock:
+        if kind is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(kind, None)
+
+
+def trigram_search(queryset, fields, query, limit):
+    from django.contrib.postgres.search import TrigramSimilarity
+    from django.db.models.functions import Greatest
+    matches = Q()
+    for field in fields:
+        matches |= Q(**{field + '__icontains': query})
+    similarity = Greatest(*[TrigramSimilarity(field, query) for field in fields])
+    prefix = Case(When(**{fields[0] + '__istartswith': query}, then=Value(0)), default=Value(1),
+                  output_field=IntegerField())
+    return list(queryset.filter(matches).annotate(prefix=prefix, similarity=similarity)
+                .order_by('prefix', '-similarity', fields[0]).values(*fields)[:limit])
+
+
+def search(kind, query, limit=None):
+    """
+    The users ({'username', 'first_name', 'last_name'}) or organizations ({'slugname', 'name'})
+    best matching query, kind being 'users' or 'orgs'
+    """
+    query = query.strip()
+    if not query:
+        return []
+    limit = limit or settings.AUTOCOMPLETE_LIMIT
+    key = 'autocomplete:{}:{}:{}'.format(kind, limit, hashlib.md5(query.lower().encode()).hexdigest())
+    results = cache.get(key)
+    if results is None:
+        if connection.vendor == 'postgresql':
+            from .models import Organization
+            if kind == 'users':
+                results = trigram_search(get_user_model().objects, USER_FIELDS, query, limit)
+            else:
+                results = trigram_search(Organization.objects, ORG_FIELDS[::-1], query, limit)
+        else:
+            results = get_index(kind).search(query, limit)
+        cache.set(key, results, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return results
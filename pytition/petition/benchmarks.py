@@ -0,0 +1,220 @@
+"""
+View-level benchmarks
+
+Main views are requested with Django's test client against a dataset built by
+the gen_dataset command. For each view, the number of SQL queries, the wall time,
+the size of the rows read from the database and the peak memory allocated by
+Python are recorded, and compared with the budgets of the baseline committed in
+benchmarks.json.
+
+Run them with ``./manage.py bench_views``, the petition tests also check the
+query counts.
+"""
+import itertools
+import json
+import math
+import os
+import statistics
+import time
+import tracemalloc
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Permission, Petition, Signature
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'benchmarks.json')
+
+# The dataset is part of the baseline: query counts depend on it
+DATASET = {
+    'prefix': 'bench',
+    'seed': 0,
+    'users': 20,
+    'orgs': 3,
+    'petitions': 60,
+    'signatures': 5000,
+}
+
+SETTINGS = {
+    'INDEX_PAGE': 'HOME',
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+    'BACKGROUND_IO_WORKERS': 0,
+    'DATABASE_REPLICAS': [],
+}
+
+
+class Context:
+    """Objects and clients shared by the benchmarks"""
+    def __init__(self):
+        prefix = DATASET['prefix']
+        petitions = Petition.objects.filter(title__startswith=prefix + ' petition ', published=True)
+        self.petition = self.most_signed(petitions.filter(user__isnull=False))
+        self.org_petition = self.most_signed(petitions.filter(org__isnull=False))
+        self.anonymous = Client(HTTP_HOST='localhost')
+        self.owner = Client(HTTP_HOST='localhost')
+        self.owner.force_login(self.petition.user.user)
+        admin = Permission.objects.filter(organization=self.org_petition.org, can_modify_permissions=True).first()
+        self.org_admin = Client(HTTP_HOST='localhost')
+        self.org_admin.force_login(admin.user.user)
+        self.signatures = itertools.count()
+        self.unconfirmed = iter(list(Signature.objects.filter(petition=self.petition, confirmed=False)
+                                     .values_list('confirmation_hash', flat=True)))
+
+    @staticmethod
+    def most_signed(petitions):
+        return petitions.annotate(signatures=Count('signature')).order_by('-signatures', 'id').first()
+
+
+def slug_show_petition(ctx):
+    slug = ctx.petition.slugmodel_set.first().slug
+    return ctx.anonymous.get(reverse('slug_show_petition', args=[ctx.petition.user.user.username, slug]))
+
+
+def create_signature(ctx):
+    i = next(ctx.signatures)
+    data = {'first_name': 'Bench', 'last_name': 'Mark', 'email': 'bench{}@example.org'.format(i)}
+    # A new signer and IP address each time, not to be throttled nor to pile unread messages up in the
+    # cookie until they overflow to the session
+    return Client(HTTP_HOST='localhost').post(reverse('create_signature', args=[ctx.petition.id]), data,
+                                              REMOTE_ADDR='10.0.{}.{}'.format(i >> 8 & 255, i & 255))
+
+
+def confirm(ctx):
+    return Client(HTTP_HOST='localhost').get(reverse('confirm', args=[ctx.petition.id, next(ctx.unconfirmed)]))
+
+
+def get_csv_signature(ctx):
+    response = ctx.owner.get(reverse('get_csv_signature', args=[ctx.petition.id]))
+    # Streaming responses are only produced when they are consumed
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+BENCHMARKS = {
+    'index': lambda ctx: ctx.anonymous.get(reverse('index')),
+    'search': lambda ctx: ctx.anonymous.get(reverse('search'), {'q': 'climate'}),
+    'detail': lambda ctx: ctx.anonymous.get(reverse('detail', args=[ctx.petition.id])),
+    'slug_show_petition': slug_show_petition,
+    'create_signature': create_signature,
+    'confirm': confirm,
+    'show_signatures': lambda ctx: ctx.owner.get(reverse('show_signatures', args=[ctx.petition.id])),
+    'get_csv_signature': get_csv_signature,
+    'user_dashboard': lambda ctx: ctx.owner.get(reverse('user_dashboard')),
+    'org_dashboard': lambda ctx: ctx.org_admin.get(reverse('org_dashboard', args=[ctx.org_petition.org.slugname])),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def load_dataset():
+    if not Petition.objects.filter(title__startswith=DATASET['prefix'] + ' petition ').exists():
+        call_command('gen_dataset', *['--{}={}'.format(key, value) for key, value in DATASET.items()])
+
+
+def measure(benchmark, ctx):
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = benchmark(ctx)
+        elapsed = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise AssertionError("{} returned {}".format(response.request['PATH_INFO'], response.status_code))
+    return len(queries), elapsed * 1000
+
+
+def measure_memory(benchmark, ctx):
+    # Tracing allocations slows Python down, so it is not done while timing
+    tracemalloc.start()
+    try:
+        benchmark(ctx)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def row_size(row):
+    return sum(len(value.encode()) if isinstance(value, str) else len(value) if isinstance(value, bytes) else 8
+               for value in row if value is not None)
+
+
+def measure_transfer(benchmark, ctx):
+    """Size of the rows returned by the SELECT queries of the benchmark, in kB
+
+    The queries are run again once captured, as the rows cannot be seen from
+    an execute wrapper.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        benchmark(ctx)
+    size = 0
+    with connection.cursor() as cursor:
+        for query in queries:
+            if query['sql'].lstrip().upper().startswith('SELECT'):
+                cursor.execute(query['sql'])
+                size += sum(row_size(row) for row in cursor.fetchall())
+    return size / 1024
+
+
+def run_benchmarks(repeat=5, names=None):
+    """
+    Run each benchmark once to warm caches up, then repeat times.
+    Return {name: {'queries': max, 'time_ms': median, 'db_kb': rows read, 'memory_kb': peak}}
+    """
+    results = {}
+    with override_settings(**SETTINGS):
+        load_dataset()
+        ctx = Context()
+        for name, benchmark in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            benchmark(ctx)
+            runs = [measure(benchmark, ctx) for _ in range(repeat)]
+            results[name] = {
+                'queries': max(queries for queries, elapsed in runs),
+                'time_ms': round(statistics.median(elapsed for queries, elapsed in runs), 1),
+                'db_kb': round(measure_transfer(benchmark, ctx)),
+                'memory_kb': round(measure_memory(benchmark, ctx)),
+            }
+    return results
+
+
+def load_baseline(path=BASELINE_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=1.5, only_queries=False):
+    """
+    Return the list of exceeded budgets, as strings.
+    Query counts must not grow, time, rows read and memory may grow up to tolerance
+    times the baseline. Those depend on the machine, only_queries leaves them out.
+    """
+    errors = []
+    for name, result in results.items():
+        budget = baseline.get(name)
+        if budget is None:
+            errors.append("{}: no baseline".format(name))
+            continue
+        if result['queries'] > budget['queries']:
+            errors.append("{}: {} queries, budget is {}".format(name, result['queries'], budget['queries']))
+        if only_queries:
+            continue
+        for key, unit in [('time_ms', 'ms'), ('db_kb', 'kB'), ('memory_kb', 'kB')]:
+            if key in budget and result[key] > budget[key] * tolerance:
+                errors.append("{}: {} {}, budget is {:.1f} {}".format(name, result[key], unit,
+                                                                     budget[key] * tolerance, unit))
+    return errors
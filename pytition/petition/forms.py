@@ -5,6 +5,7 @@ from django.contrib.auth.forms import UserCreationForm, UsernameField
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from django.utils.html import mark_safe, strip_tags
+from django.db import IntegrityError, connection, transaction
 
 from .models import Signature, PetitionTemplate, Petition, Organization, PytitionUser, SlugModel
 from .widgets import SwitchField
@@ -12,6 +13,7 @@ from .helpers import send_welcome_mail
 
 import uuid
 import html
+from contextlib import nullcontext
 from tinymce.widgets import TinyMCE
 from colorfield.fields import ColorWidget
 
@@ -37,13 +39,39 @@ class SignatureForm(ModelForm):
         else:
             self.fields['subscribed_to_mailinglist'].label = self.instance.petition.newsletter_text
 
+    def clean_email(self):
+        # Signatures are deduplicated by email
+        return self.cleaned_data['email'].lower()
+
+    def pending_signature(self):
+        return Signature.objects.filter(petition_id=self.instance.petition_id, email=self.cleaned_data['email'],
+                                        confirmed=False).first()
+
     def save(self, commit=True):
+        """
+        Return the pending signature of this email, unchanged, if there is one: a signature sent
+        again (double click, retried request) must not replace the data its owner will confirm
+        with the link already sent to them. Return a new pending signature otherwise.
+        """
+        pending = self.pending_signature()
+        if pending is not None:
+            return pending
         object = super().save(commit=False)
-        hashstring = str(uuid.uuid4())
-        object.confirmation_hash = hashstring
         object.confirmed = False
+        object.confirmation_hash = str(uuid.uuid4())
         if commit:
-            object.save()
+            # A savepoint keeps the current transaction usable if the INSERT fails. Not in autocommit
+            # mode, where SQLite would not wait for the lock of a transaction which read first
+            savepoint = transaction.atomic() if connection.in_atomic_block else nullcontext()
+            try:
+                with savepoint:
+                    object.save()
+            except IntegrityError:
+                # Sent twice at once, the unique constraint kept the first one
+                pending = self.pending_signature()
+                if pending is None:
+                    raise
+                return pending
         return object
 
 
@@ -208,7 +236,7 @@ class PytitionUserCreationForm(UserCreationForm):
         return cleaned_data
 
     def send_success_email(self):
-        send_welcome_mail(self.cleaned_data)
+        send_welcome_mail(self.cleaned_data, background=True)
 
 class UpdateInfoForm(UserCreationForm):
     class Meta:
@@ -1,24 +1,48 @@
+import contextvars
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import lxml
 from lxml.html.clean import Cleaner
 from django.http import Http404, HttpResponseForbidden
 from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.core.mail import get_connection, EmailMultiAlternatives, EmailMessage
 from django.utils.translation import ugettext as _
 from django.contrib.auth.models import User
+from django.db import connection as db_connection
+from django.db.models import Q
+
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+_background_executor = None
+_background_executor_lock = threading.Lock()
+
+# Insert objects by batches which fit in the database limits
+# Django 2.2 does not cap batch_size to them, which fails with SQLite
+def bulk_create(model, objs, batch_size=1000):
+    if not objs:
+        return []
+    max_batch_size = db_connection.ops.bulk_batch_size(model._meta.concrete_fields, objs)
+    return model.objects.bulk_create(objs, batch_size=min(batch_size, max_batch_size or batch_size))
 
 # Remove all moderated instances of Petition
+# Filtered in the database, so that only the displayed page of petitions is loaded
 def remove_user_moderated(petitions):
-    petitions = [p for p in petitions if not p.is_moderated]
-    return petitions
+    return petitions.filter(Q(user__isnull=True) | Q(user__moderated=False), moderated=False)
 
 # Remove all javascripts from HTML code
 def sanitize_html(unsecure_html_content):
     cleaner = Cleaner(inline_style=False, scripts=True, javascript=True,
-                      safe_attrs=lxml.html.defs.safe_attrs | set(['style']),
+                      safe_attrs=lxml.html.defs.safe_attrs | set(['style', 'srcset', 'sizes']),
                       frames=False, embedded=False,
                       meta=True, links=True, page_structure=True, remove_tags=['body'])
     try:
@@ -54,9 +78,9 @@ def check_user_in_orga(user, orga):
 
 
 # Return a 404 if a petition does not exist
-def petition_from_id(id):
+def petition_from_id(id, summary=False):
     from .models import Petition
-    petition = Petition.by_id(id)
+    petition = Petition.by_id(id, summary)
     if petition is None:
         raise Http404(_("Petition does not exist"))
     else:
@@ -90,29 +114,103 @@ def footer_content_processor(request):
         footer_content = render_to_string(settings.FOOTER_TEMPLATE)
     return {'footer_content': footer_content}
 
-# Send Confirmation email
-def send_confirmation_email(request, signature):
-    petition = signature.petition
-    url = request.build_absolute_uri("/petition/{}/confirm/{}".format(petition.id, signature.confirmation_hash))
+def get_background_executor():
+    global _background_executor
+    with _background_executor_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_IO_WORKERS,
+                                                      thread_name_prefix="pytition-io")
+    return _background_executor
+
+
+# Wait for the pending background tasks, a new pool is created on next use
+def shutdown_background_executor(wait=True):
+    global _background_executor
+    with _background_executor_lock:
+        executor, _background_executor = _background_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _run_background_task(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", func.__name__)
+    finally:
+        db_connection.close()
+
+
+# Run slow I/O (SMTP, newsletter HTTP calls) out of the request/response cycle
+# when settings.BACKGROUND_IO_WORKERS is set, otherwise run it right away
+# Everything depending on the request (translations, URLs) must be computed by the caller
+def run_in_background(func, *args, **kwargs):
+    if not settings.BACKGROUND_IO_WORKERS:
+        return func(*args, **kwargs)
+    # The context carries the current trace span over to the worker thread
+    context = contextvars.copy_context()
+    return get_background_executor().submit(context.run, _run_background_task, func, *args, **kwargs)
+
+
+def send_email_message(msg):
+    attributes = {'mail.recipients': len(msg.recipients())}
+    with tracing.start_as_current_span('smtp.send', tracing.KIND_CLIENT, attributes), \
+            metrics.mail_duration.time(), get_connection() as connection:
+        msg.connection = connection
+        msg.send(fail_silently=False)
+
+
+def confirmation_url(request, signature):
+    return request.build_absolute_uri("/petition/{}/confirm/{}".format(signature.petition_id,
+                                                                       signature.confirmation_hash))
+
+
+def confirmation_email(signature, url):
     html_message = render_to_string("petition/confirmation_email.html", {'firstname': signature.first_name, 'url': url})
     message = strip_tags(html_message)
-    with get_connection() as connection:
-        msg = EmailMultiAlternatives(_("Confirm your signature to our petition"),
-                           message, to=[signature.email], connection=connection,
-                           reply_to=[petition.confirmation_email_reply])
-        msg.attach_alternative(html_message, "text/html")
-        msg.send(fail_silently=False)
+    msg = EmailMultiAlternatives(_("Confirm your signature to our petition"),
+                                 message, to=[signature.email],
+                                 reply_to=[signature.petition.confirmation_email_reply])
+    msg.attach_alternative(html_message, "text/html")
+    return msg
+
+
+def confirmation_email_key(signature):
+    return 'signature:email:{}:{}'.format(signature.petition_id, hashlib.md5(signature.email.encode()).hexdigest())
+
+
+def confirmation_email_is_due(signature):
+    # A single confirmation email per email address and petition every SIGNATURE_EMAIL_WINDOW seconds
+    return cache.add(confirmation_email_key(signature), True, settings.SIGNATURE_EMAIL_WINDOW)
+
+
+def confirmation_email_was_sent(signature):
+    # Whether a confirmation email was sent for this email address and petition within SIGNATURE_EMAIL_WINDOW
+    return cache.get(confirmation_email_key(signature)) is not None
+
+
+# Send Confirmation email
+@tracing.traced()
+def send_confirmation_email(request, signature, background=False):
+    msg = confirmation_email(signature, confirmation_url(request, signature))
+    if background:
+        run_in_background(send_email_message, msg)
+    else:
+        send_email_message(msg)
 
 # Send welcome mail on account creation
-def send_welcome_mail(user_infos):
+@tracing.traced()
+def send_welcome_mail(user_infos, background=False):
     html_message = render_to_string("registration/confirmation_email.html", user_infos)
     message = strip_tags(html_message)
-    with get_connection() as connection:
-        msg = EmailMultiAlternatives(_("Account created !"),
-                                     message, to=[user_infos["email"]], connection=connection,
-                                     reply_to=[settings.DEFAULT_NOREPLY_MAIL])
-        msg.attach_alternative(html_message, "text/html")
-        msg.send(fail_silently=False)
+    msg = EmailMultiAlternatives(_("Account created !"),
+                                 message, to=[user_infos["email"]],
+                                 reply_to=[settings.DEFAULT_NOREPLY_MAIL])
+    msg.attach_alternative(html_message, "text/html")
+    if background:
+        run_in_background(send_email_message, msg)
+    else:
+        send_email_message(msg)
 
 
 
@@ -126,6 +224,13 @@ def petition_detail_meta(request, petition_id):
 
 
 def subscribe_to_newsletter(petition, email):
+    attributes = {'newsletter.method': petition.newsletter_subscribe_method}
+    with tracing.start_as_current_span('newsletter.subscribe', tracing.KIND_CLIENT, attributes), \
+            metrics.newsletter_duration.time(method=petition.newsletter_subscribe_method):
+        _subscribe_to_newsletter(petition, email)
+
+
+def _subscribe_to_newsletter(petition, email):
     if petition.newsletter_subscribe_method in ["POST", "GET"]:
         if petition.newsletter_subscribe_http_url == '':
             return
@@ -0,0 +1,205 @@
+"""
+Uploaded images
+
+Images uploaded from the editor are checked while they are streamed (size,
+format, number of pixels) and their metadata (EXIF, GPS position...) is
+stripped before they are served. Then, in the background (or by
+``manage.py process_images`` without settings.BACKGROUND_IO_WORKERS), resized
+variants are generated in settings.IMAGE_VARIANT_FORMAT. The <img> tags of the
+petitions using them get a srcset attribute, so that browsers download the
+variant fitting the screen.
+"""
+import os
+import re
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.db import transaction
+from django.utils.html import escape
+from django.utils.translation import ugettext as _
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+# The only image info kept, everything else (EXIF, XMP, comments...) is metadata
+KEPT_INFO = ('icc_profile', 'transparency')
+# Room for the multipart headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+SRC_RE = re.compile(r'\ssrc\s*=\s*("[^"]*"|\'[^\']*\')', re.IGNORECASE)
+WIDTH_RE = re.compile(r'\swidth\s*=\s*["\']?(\d+)', re.IGNORECASE)
+TAG_END_RE = re.compile(r'(\s*/?>)$')
+SRCSET_RE = re.compile(r'\s(?:srcset|sizes)\s*=\s*("[^"]*"|\'[^\']*\')', re.IGNORECASE)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Stop reading the upload as soon as it is larger than settings.IMAGE_UPLOAD_MAX_SIZE"""
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.received = 0
+        self.too_large = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.too_large = content_length > settings.IMAGE_UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD
+
+    def new_file(self, *args, **kwargs):
+        if self.too_large:
+            raise StopUpload(connection_reset=True)
+        self.received = 0
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.too_large = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def check_image(file):
+    """Raise InvalidImage if file is not an acceptable image, return its format otherwise"""
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except Exception:
+        raise InvalidImage(_("This file is not an image."))
+    finally:
+        file.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise InvalidImage(_("Unsupported image format: {}.").format(image_format))
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise InvalidImage(_("This image is too large: {}x{} pixels.").format(width, height))
+    return image_format
+
+
+def variant_name(name, width):
+    stem, ext = os.path.splitext(name)
+    return "{}-{}w.{}".format(stem, width, settings.IMAGE_VARIANT_FORMAT.lower())
+
+
+def variant_widths(width):
+    widths = [w for w in settings.IMAGE_VARIANT_WIDTHS if w < width]
+    return widths + [width]
+
+
+def _save(image, path, image_format, **options):
+    # Replaced at once, not to serve a partially written file
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, image_format, **options)
+    os.replace(tmp_path, path)
+
+
+def strip_metadata(name):
+    """Strip the metadata of the uploaded image, return it or None if it is animated
+
+    name is relative to MEDIA_ROOT. Animated images are left untouched.
+    """
+    path = FileSystemStorage().path(name)
+    with Image.open(path) as image:
+        if getattr(image, 'is_animated', False):
+            return None
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    image.info = {key: value for key, value in image.info.items() if key in KEPT_INFO}
+    save_options = {'icc_profile': image.info['icc_profile']} if 'icc_profile' in image.info else {}
+    if image_format == 'JPEG':
+        save_options['quality'] = 95
+    _save(image, path, image_format, **save_options)
+    return image
+
+
+def generate_variants(name, image=None):
+    """Generate the variants of an image whose metadata is stripped, and add them to the petitions using it"""
+    storage = FileSystemStorage()
+    if image is None:
+        with Image.open(storage.path(name)) as image:
+            if getattr(image, 'is_animated', False):
+                return []
+            image.load()
+    save_options = {'icc_profile': image.info['icc_profile']} if 'icc_profile' in image.info else {}
+    variants = []
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    for width in variant_widths(image.width):
+        variant = image.copy()
+        variant.thumbnail((width, image.height), Image.LANCZOS)
+        _save(variant, storage.path(variant_name(name, width)), settings.IMAGE_VARIANT_FORMAT,
+              quality=settings.IMAGE_VARIANT_QUALITY, **save_options)
+        variants.append(variant_name(name, width))
+    update_petitions(storage.url(name))
+    return variants
+
+
+def process_image(name):
+    """Strip the metadata of the uploaded image and generate its variants"""
+    image = strip_metadata(name)
+    if image is None:
+        return []
+    return generate_variants(name, image)
+
+
+def srcset(url):
+    """The srcset attribute for an image of MEDIA_URL, None if it has no variant yet"""
+    if not url.startswith(settings.MEDIA_URL):
+        return None
+    storage = FileSystemStorage()
+    name = unquote(url[len(settings.MEDIA_URL):])
+    try:
+        with Image.open(storage.path(name)) as image:
+            widths = variant_widths(image.width)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        return None
+    candidates = ["{} {}w".format(storage.url(variant_name(name, width)), width) for width in widths
+                  if storage.exists(variant_name(name, width))]
+    return ", ".join(candidates) or None
+
+
+def add_srcset(html):
+    """Add srcset and sizes attributes to the <img> tags of html pointing to processed images"""
+    if not html:
+        return html
+
+    def replace(match):
+        tag = match.group()
+        src = SRC_RE.search(tag)
+        if not src:
+            return tag
+        candidates = srcset(src.group(1)[1:-1])
+        if not candidates:
+            return tag
+        width = WIDTH_RE.search(tag)
+        if width:
+            sizes = "(max-width: {0}px) 100vw, {0}px".format(width.group(1))
+        else:
+            sizes = settings.IMAGE_SIZES
+        head, end = TAG_END_RE.split(SRCSET_RE.sub('', tag))[:2]
+        return '{} srcset="{}" sizes="{}"{}'.format(head, escape(candidates), escape(sizes), end)
+
+    return IMG_RE.sub(replace, html)
+
+
+def update_petitions(url):
+    # Petitions saved before their images were processed, saved again for their
+    # media references and static pages to be updated too
+    from .models import Petition, PetitionTemplate
+    for model in (Petition.objects, PetitionTemplate.objects):
+        for pk in model.filter(text__contains=url).values_list('pk', flat=True):
+            with transaction.atomic():
+                instance = model.select_for_update().get(pk=pk)
+                text = add_srcset(instance.text)
+                if text != instance.text:
+                    instance.text = text
+                    instance.save(update_fields=['text'])
@@ -0,0 +1,54 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from petition.models import Petition, Signature
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Archive the signatures of petitions into compressed files
+
+    ./manage.py archive_petition 1 2
+    > Archive Petition:1 and Petition:2
+    ./manage.py archive_petition --auto
+    > Archive unpublished petitions without signature for settings.ARCHIVE_AFTER_DAYS days
+    ./manage.py archive_petition --auto --older-than 365
+    > Same with a custom number of days
+
+    Signatures are written to a gzipped CSV file under settings.ARCHIVE_ROOT,
+    their counts are kept on the petition and they are deleted by batches.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('petitions', nargs='*', type=int)
+        parser.add_argument('--auto', action='store_true')
+        parser.add_argument('--older-than', type=int, default=settings.ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.PURGE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.PURGE_PAUSE_S)
+
+    def handle(self, *args, **options):
+        petition_ids = list(options['petitions'])
+        if options['auto']:
+            if not options['older_than']:
+                logger.error("You must either set ARCHIVE_AFTER_DAYS or use --older-than")
+                return
+            since = timezone.now() - timedelta(days=options['older_than'])
+            recently_signed = Signature.objects.values('petition').annotate(last=Max('date'))\
+                .filter(last__gte=since).values('petition')
+            petition_ids += Petition.objects.filter(published=False, archived=False, last_modification_date__lt=since)\
+                .exclude(pk__in=recently_signed).values_list('id', flat=True)
+
+        # Petitions whose archiving was interrupted are resumed
+        petition_ids += Petition.objects.filter(archived=True, signature__isnull=False).distinct()\
+            .values_list('id', flat=True)
+
+        for petition in Petition.objects.filter(pk__in=petition_ids):
+            logger.info("Archiving petition %d", petition.id)
+            petition.archive(batch_size=options['batch_size'], pause=options['pause'])
+            logger.info("Petition %d archived in %s: %d signatures, %d confirmed", petition.id, petition.archive_file,
+                        petition.archived_signatures, petition.archived_confirmed_signatures)
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.mail.backends import locmem
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from petition.benchmarks import percentile
+from petition.helpers import shutdown_background_executor
+from petition.models import Petition
+
+
+class DelayedEmailBackend(locmem.EmailBackend):
+    """In-memory email backend simulating a slow SMTP server"""
+    delay = 0
+
+    def send_messages(self, messages):
+        time.sleep(self.delay)
+        return super().send_messages(messages)
+
+
+class Command(BaseCommand):
+    """Compare signing throughput and latency with synchronous and background emails
+
+    ./manage.py bench_signing
+    > Sign 200 times with 8 concurrent clients against a 200ms SMTP server
+    ./manage.py bench_signing -n 500 -c 16 --smtp-delay 0.5 --workers 8
+
+    Signatures are done in-process through the WSGI handler, on a temporary
+    petition which is deleted at the end.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--number', '-n', type=int, default=200)
+        parser.add_argument('--concurrency', '-c', type=int, default=8)
+        parser.add_argument('--smtp-delay', type=float, default=0.2)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def sign(self, url, i):
+        client = Client(HTTP_HOST='localhost')
+        data = {'first_name': 'Bench', 'last_name': 'Mark', 'email': 'bench{}@example.org'.format(i)}
+        start = time.perf_counter()
+        try:
+            response = client.post(url, data, REMOTE_ADDR='10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255))
+            ok = response.status_code == 302
+        finally:
+            connection.close()
+        return time.perf_counter() - start, ok
+
+    def run(self, url, options, workers):
+        email_backend = '{}.{}'.format(__name__, DelayedEmailBackend.__name__)
+        DelayedEmailBackend.delay = options['smtp_delay']
+        with override_settings(BACKGROUND_IO_WORKERS=workers, EMAIL_BACKEND=email_backend):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(lambda i: self.sign(url, i), range(options['number'])))
+            elapsed = time.perf_counter() - start
+            shutdown_background_executor()
+        latencies = [latency for latency, ok in results]
+        errors = len([ok for latency, ok in results if not ok])
+        return {'rps': len(results) / elapsed,
+                'p50': percentile(latencies, 50) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'errors': errors}
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user('bench-signing-{}'.format(int(time.time())))
+        try:
+            petition = Petition.objects.create(title="Benchmark", published=True, user=user.pytitionuser)
+            url = reverse('create_signature', args=[petition.id])
+            self.stdout.write("{:<12} {:>10} {:>10} {:>10} {:>8}".format("mode", "req/s", "p50 (ms)", "p99 (ms)",
+                                                                       "errors"))
+            for mode, workers in [("synchronous", 0), ("background", options['workers'])]:
+                result = self.run(url, options, workers)
+                self.stdout.write("{:<12} {rps:>10.1f} {p50:>10.1f} {p99:>10.1f} {errors:>8}".format(mode, **result))
+        finally:
+            user.delete()
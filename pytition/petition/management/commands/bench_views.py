@@ -0,0 +1,49 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from petition.benchmarks import BASELINE_FILE, BENCHMARKS, compare, load_baseline, run_benchmarks, save_baseline
+
+
+class Command(BaseCommand):
+    """Benchmark the main views against the committed baseline
+
+    ./manage.py bench_views
+    > Run all benchmarks and fail if a budget is exceeded
+    ./manage.py bench_views detail create_signature --repeat 20
+    > Only benchmark some views
+    ./manage.py bench_views --update-baseline
+    > Record the results as the new baseline, to be committed
+
+    The benchmark dataset is generated in a transaction which is rolled back at
+    the end, so that the database is left untouched.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('views', nargs='*', choices=[[]] + list(BENCHMARKS))
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--tolerance', type=float, default=1.5)
+        parser.add_argument('--only-queries', action='store_true')
+        parser.add_argument('--baseline', type=str, default=BASELINE_FILE)
+        parser.add_argument('--update-baseline', action='store_true')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = run_benchmarks(options['repeat'], options['views'])
+            transaction.set_rollback(True)
+
+        baseline = {} if options['update_baseline'] else load_baseline(options['baseline'])
+        self.stdout.write("{:<20} {:>8} {:>10} {:>10} {:>12}".format("view", "queries", "time (ms)", "rows (kB)",
+                                                                    "memory (kB)"))
+        for name, result in results.items():
+            budget = baseline.get(name)
+            self.stdout.write("{:<20} {queries:>8} {time_ms:>10.1f} {db_kb:>10} {memory_kb:>12}".format(name, **result))
+            if budget:
+                self.stdout.write("{:<20} {queries:>8} {time_ms:>10.1f} {db_kb:>10} {memory_kb:>12}".format(
+                    "  baseline", **dict({'db_kb': '-'}, **budget)))
+
+        if options['update_baseline']:
+            save_baseline(results, options['baseline'])
+            self.stdout.write("Baseline saved to {}".format(options['baseline']))
+            return
+        errors = compare(results, baseline, options['tolerance'], options['only_queries'])
+        if errors:
+            raise CommandError("Budgets exceeded:\n" + "\n".join(errors))
@@ -0,0 +1,44 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from petition import signature_buffer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Write the signatures of settings.SIGNATURE_BUFFER to the database and send their confirmation emails
+
+    ./manage.py flush_signatures
+    > Write all the buffered signatures, then exit
+    ./manage.py flush_signatures --loop --interval 1
+    > Write the buffered signatures as they come, checking the buffer every second
+
+    Run it with --loop along with the web server on each host, for instance as a systemd service.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep waiting for new signatures")
+        parser.add_argument('--interval', type=float, default=1, help="Seconds between two checks of the buffer")
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if not signature_buffer.is_enabled():
+            raise CommandError("SIGNATURE_BUFFER is not set")
+        batch_size = options['batch_size'] or settings.SIGNATURE_BUFFER_BATCH_SIZE
+        while True:
+            try:
+                while signature_buffer.flush(batch_size) == batch_size:
+                    pass
+            except Exception:
+                if not options['loop']:
+                    raise
+                # The batch stays in the buffer and is written again at the next round
+                logger.exception("Cannot flush the signature buffer")
+                close_old_connections()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        logger.info("%d signatures left in the buffer", signature_buffer.pending())
@@ -0,0 +1,232 @@
+import logging
+import multiprocessing
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, call_command
+from django.db import connection, connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from petition.helpers import bulk_create
+from petition.models import Moderation, ModerationReason, Organization, Permission, Petition, PytitionUser, \
+    Signature, SlugModel
+
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = ["Alice", "Bob", "Camille", "Dominique", "Elie", "Fatou", "Gabriel", "Hugo", "Ines", "Jules",
+               "Karim", "Léa", "Manon", "Nathan", "Oscar", "Paul", "Quentin", "Rose", "Sacha", "Tom"]
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau",
+              "Simon", "Laurent", "Lefebvre", "Michel", "Garcia", "David", "Bertrand", "Roux", "Vincent", "Fournier"]
+WORDS = ["climate", "school", "river", "forest", "bike", "lanes", "library", "water", "park", "tram", "rights",
+         "housing", "health", "air", "quality", "animals", "garden", "market", "night", "trains"]
+
+
+def signature_counts(total, number, alpha, rng):
+    """
+    Split total signatures among number petitions following a power law:
+    the petition of rank r gets a share proportional to 1 / r ** alpha.
+    Ranks are shuffled so that popular petitions are spread over owners.
+    """
+    weights = [1 / (rank ** alpha) for rank in range(1, number + 1)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for i in range(total - sum(counts)):
+        counts[i % number] += 1
+    rng.shuffle(counts)
+    return counts
+
+
+def generate_signatures(job):
+    """
+    Create the signatures of some petitions, possibly in a worker process.
+    Each petition has its own random generator so that the dataset does not
+    depend on the number of workers.
+    """
+    seed, prefix, petitions, options = job
+    # Keep the generated dates instead of the insertion time
+    date = Signature._meta.get_field('date')
+    date.auto_now_add = False
+    try:
+        return _generate_signatures(seed, prefix, petitions, options)
+    finally:
+        date.auto_now_add = True
+
+
+def _generate_signatures(seed, prefix, petitions, options):
+    now = timezone.now()
+    created = 0
+    batch = []
+    for index, petition_id, number, start_date in petitions:
+        rng = random.Random("{}-{}".format(seed, index))
+        lifetime = (now - start_date).total_seconds()
+        for i in range(number):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            batch.append(Signature(
+                first_name=first_name,
+                last_name=last_name,
+                email="{}.{}.{}.{}@example.org".format(slugify(first_name), slugify(last_name), prefix, i),
+                confirmation_hash="{:032x}".format(rng.getrandbits(128)),
+                confirmed=rng.random() < options['confirmed_ratio'],
+                subscribed_to_mailinglist=rng.random() < options['subscribed_ratio'],
+                date=start_date + timedelta(seconds=rng.random() * lifetime),
+                petition_id=petition_id))
+            if len(batch) >= options['batch_size']:
+                created += flush(batch)
+    created += flush(batch)
+    return created
+
+
+def generate_signatures_process(job):
+    try:
+        return generate_signatures(job)
+    finally:
+        connection.close()
+
+
+def flush(batch):
+    with transaction.atomic():
+        bulk_create(Signature, batch, len(batch))
+    number = len(batch)
+    del batch[:]
+    return number
+
+
+class Command(BaseCommand):
+    """Generate a large and reproducible dataset for load tests and benchmarks
+
+    ./manage.py gen_dataset
+    > Generate 100 users, 10 orgs, 1000 petitions and 100000 signatures
+    ./manage.py gen_dataset --petitions 10000 --signatures 10000000 --workers 8 --seed 42
+    > Generate 10M signatures with 8 processes, the same seed gives the same dataset
+
+    Signatures are spread over petitions following a power law (--alpha), a few
+    petitions get most of them as in real life. Objects are created with bulk_create,
+    bypassing save() and signals, and hourly statistics are rebuilt at the end.
+    Users are named <prefix>-user-<n>, they all have the same --password.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', type=str, default='gen')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', type=str, default='pytition')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orgs', type=int, default=10)
+        parser.add_argument('--members', type=int, default=5)
+        parser.add_argument('--petitions', type=int, default=1000)
+        parser.add_argument('--signatures', type=int, default=100000)
+        parser.add_argument('--alpha', type=float, default=1.1)
+        parser.add_argument('--org-ratio', type=float, default=0.3)
+        parser.add_argument('--published-ratio', type=float, default=0.9)
+        parser.add_argument('--confirmed-ratio', type=float, default=0.8)
+        parser.add_argument('--subscribed-ratio', type=float, default=0.3)
+        parser.add_argument('--reported-ratio', type=float, default=0.01)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1)
+
+    def handle(self, *args, **options):
+        prefix, rng = options['prefix'], random.Random(options['seed'])
+        if User.objects.filter(username__startswith=prefix + '-user-').exists():
+            logger.error("A dataset with prefix %s already exists, choose another --prefix", prefix)
+            return
+        users = self.create_users(prefix, options)
+        orgs = self.create_orgs(prefix, users, rng, options)
+        petitions = self.create_petitions(prefix, users, orgs, rng, options)
+        self.create_reports(petitions, rng, options)
+        self.create_signatures(prefix, petitions, rng, options)
+        call_command('rollup_signatures', *[petition.id for petition in petitions])
+
+    def create_users(self, prefix, options):
+        usernames = ['{}-user-{}'.format(prefix, i) for i in range(options['users'])]
+        password = make_password(options['password'])
+        bulk_create(User, [User(username=username, password=password,
+                                first_name=username, email='{}@example.org'.format(username))
+                           for username in usernames], batch_size=options['batch_size'])
+        users = User.objects.filter(username__startswith=prefix + '-user-')
+        bulk_create(PytitionUser, [PytitionUser(user=user) for user in users], batch_size=options['batch_size'])
+        logger.info("%d users created", len(usernames))
+        return list(PytitionUser.objects.filter(user__username__startswith=prefix + '-user-').order_by('id')
+                    .select_related('user'))
+
+    def create_orgs(self, prefix, users, rng, options):
+        names = ['{} org {}'.format(prefix, i) for i in range(options['orgs'])]
+        bulk_create(Organization, [Organization(name=name, slugname=slugify(name)) for name in names])
+        orgs = list(Organization.objects.filter(name__startswith=prefix + ' org ').order_by('id'))
+        permissions = []
+        for org in orgs:
+            members = rng.sample(users, min(options['members'], len(users)))
+            for i, member in enumerate(members):
+                permission = Permission(organization=org, user=member, can_view_signatures=True)
+                if i == 0:
+                    for field in Permission._meta.fields:
+                        if field.name.startswith('can_'):
+                            setattr(permission, field.name, True)
+                permissions.append(permission)
+        bulk_create(Permission, permissions, batch_size=options['batch_size'])
+        logger.info("%d organizations created", len(orgs))
+        return orgs
+
+    def create_petitions(self, prefix, users, orgs, rng, options):
+        now = timezone.now()
+        hasher = get_hasher()
+        # Not to change the rest of the dataset of a seed
+        publication_rng = random.Random('{}-publication'.format(options['seed']))
+        petitions = []
+        for i in range(options['petitions']):
+            title = '{} petition {}: {}'.format(prefix, i, ' '.join(rng.sample(WORDS, 4)))
+            creation_date = now - timedelta(seconds=rng.randint(3600, 365 * 24 * 3600))
+            petition = Petition(title=title, text='<p>{}</p>'.format(' '.join(rng.choices(WORDS, k=200))),
+                                published=rng.random() < options['published_ratio'],
+                                salt=hasher.salt().decode('utf-8'),
+                                creation_date=creation_date, last_modification_date=creation_date)
+            if petition.published:
+                # Published within the first days, for the sitemaps and feeds
+                publication_date = creation_date + timedelta(seconds=publication_rng.randint(0, 3 * 24 * 3600))
+                petition.publication_date = min(publication_date, now)
+            if orgs and rng.random() < options['org_ratio']:
+                petition.org = rng.choice(orgs)
+                owner = {'orgslugname': petition.org.slugname}
+            else:
+                petition.user = rng.choice(users)
+                owner = {'username': petition.user.user.username}
+            petition.canonical_url = reverse("slug_show_petition", kwargs=dict(owner, petitionname=slugify(title)))
+            petitions.append(petition)
+        bulk_create(Petition, petitions, batch_size=options['batch_size'])
+        petitions = list(Petition.objects.filter(title__startswith='{} petition '.format(prefix)).order_by('id')
+                         .only('id', 'title', 'creation_date', 'publication_date', 'user', 'org'))
+        bulk_create(SlugModel, [SlugModel(slug=slugify(petition.title), petition=petition,
+                                          user_id=petition.user_id, org_id=petition.org_id)
+                                for petition in petitions], batch_size=options['batch_size'])
+        logger.info("%d petitions created", len(petitions))
+        return petitions
+
+    def create_reports(self, petitions, rng, options):
+        reasons = list(ModerationReason.objects.all()) or [None]
+        reports = []
+        for petition in petitions:
+            if rng.random() < options['reported_ratio']:
+                reports += [Moderation(petition=petition, reason=rng.choice(reasons))
+                            for _ in range(rng.randint(1, 5))]
+        bulk_create(Moderation, reports, batch_size=options['batch_size'])
+        logger.info("%d moderation reports created", len(reports))
+
+    def create_signatures(self, prefix, petitions, rng, options):
+        counts = signature_counts(options['signatures'], len(petitions), options['alpha'], rng)
+        # Published petitions are signed once published
+        jobs = [(index, petition.id, counts[index], petition.publication_date or petition.creation_date)
+                for index, petition in enumerate(petitions)]
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            logger.warning("SQLite does not support concurrent writes, using a single process")
+            workers = 1
+        if workers > 1:
+            chunks = [(options['seed'], prefix, jobs[i::workers], options) for i in range(workers)]
+            # Forked processes must not share the parent's database connections
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                created = sum(pool.map(generate_signatures_process, chunks))
+        else:
+            created = generate_signatures((options['seed'], prefix, jobs, options))
+        logger.info("%d signatures created", created)
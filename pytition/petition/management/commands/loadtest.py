@@ -0,0 +1,182 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from petition.benchmarks import percentile
+from petition.models import Petition, Signature
+
+CONFIRM_URL_RE = re.compile(r'https?://\S+/confirm/[^\s"<]+')
+
+
+def client_ip(i):
+    # Each client has its own IP address, not to be throttled
+    return '10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255)
+
+
+class InProcessClient:
+    """Requests done through the WSGI handler, confirmation links read from the locmem outbox"""
+    def __init__(self, i):
+        self.client = Client(HTTP_HOST='localhost', REMOTE_ADDR=client_ip(i))
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data).status_code
+
+    def confirmation_path(self, petition, email):
+        for message in list(mail.outbox):
+            if email in message.to:
+                match = CONFIRM_URL_RE.search(message.body)
+                if match:
+                    return urlsplit(match.group()).path
+        return None
+
+
+class HTTPClient:
+    """Requests done to a running instance, confirmation links read from the database"""
+    def __init__(self, base_url, i):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['X-Forwarded-For'] = client_ip(i)
+
+    def get(self, path):
+        return self.session.get(urljoin(self.base_url, path), allow_redirects=False).status_code
+
+    def post(self, path, data):
+        url = urljoin(self.base_url, path)
+        data = dict(data, csrfmiddlewaretoken=self.session.cookies.get('csrftoken', ''))
+        return self.session.post(url, data, headers={'Referer': url}, allow_redirects=False).status_code
+
+    def confirmation_path(self, petition, email):
+        confirmation_hash = Signature.objects.filter(petition=petition, email=email)\
+            .values_list('confirmation_hash', flat=True).first()
+        if confirmation_hash:
+            return reverse('confirm', args=[petition.id, confirmation_hash])
+        return None
+
+
+class Command(BaseCommand):
+    """Simulate a signing spike with concurrent clients
+
+    ./manage.py loadtest
+    > 200 flows with 16 concurrent clients, in-process on a temporary petition
+    ./manage.py loadtest -n 2000 -c 64 --petition 12
+    > 2000 flows on Petition:12
+    ./manage.py loadtest --url http://localhost:8000
+    > Against a running instance, which must use the same database and be able
+    > to send emails (the console or file EMAIL_BACKEND will do)
+
+    Each flow views the petition, signs it and opens the confirmation link. In-process,
+    emails go to the locmem outbox and SQL queries are counted. Latency percentiles
+    and errors are reported for each step.
+    """
+    steps = ['view', 'sign', 'confirm']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flows', '-n', type=int, default=200)
+        parser.add_argument('--clients', '-c', type=int, default=16)
+        parser.add_argument('--petition', type=int)
+        parser.add_argument('--url', type=str)
+        parser.add_argument('--confirm-timeout', type=float, default=10)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.queries = 0
+        user = None
+        if options['petition']:
+            petition = Petition.objects.get(pk=options['petition'])
+        else:
+            user = User.objects.create_user('loadtest-{}'.format(int(time.time())))
+            petition = Petition.objects.create(title="Load test", published=True, user=user.pytitionuser)
+        try:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                mail.outbox = []
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+                    list(pool.map(lambda i: self.flow(petition, i), range(options['flows'])))
+                elapsed = time.perf_counter() - start
+            self.report(petition, elapsed)
+        finally:
+            if user:
+                user.delete()
+
+    def step(self, name, func, expected):
+        start = time.perf_counter()
+        try:
+            status = func()
+        except Exception:
+            status = None
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.latencies[name].append(latency)
+            if status != expected:
+                self.errors[name] += 1
+        return status == expected
+
+    def flow(self, petition, i):
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        if self.options['url']:
+            client = HTTPClient(self.options['url'], i)
+        else:
+            client = InProcessClient(i)
+        email = 'loadtest{}@example.org'.format(i)
+        data = {'first_name': 'Load', 'last_name': 'Test', 'email': email}
+        try:
+            with connection.execute_wrapper(count_queries):
+                if not self.step('view', lambda: client.get(reverse('detail', args=[petition.id])), 200):
+                    return
+                if not self.step('sign', lambda: client.post(reverse('create_signature', args=[petition.id]), data),
+                                 302):
+                    return
+                self.step('confirm', lambda: client.get(self.wait_for_confirmation(client, petition, email)), 302)
+        finally:
+            connection.close()
+            with self.lock:
+                self.queries += queries[0]
+
+    def wait_for_confirmation(self, client, petition, email):
+        deadline = time.perf_counter() + self.options['confirm_timeout']
+        while time.perf_counter() < deadline:
+            path = client.confirmation_path(petition, email)
+            if path:
+                return path
+            time.sleep(0.05)
+        raise TimeoutError("No confirmation link for {}".format(email))
+
+    def report(self, petition, elapsed):
+        flows = self.options['flows']
+        requests_done = sum(len(latencies) for latencies in self.latencies.values())
+        self.stdout.write("{:<10} {:>8} {:>8} {:>10} {:>10} {:>10}".format("step", "requests", "errors", "p50 (ms)",
+                                                                       "p95 (ms)", "p99 (ms)"))
+        for name in self.steps:
+            latencies = self.latencies[name]
+            self.stdout.write("{:<10} {:>8} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                name, len(latencies), self.errors[name], percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000))
+        self.stdout.write("{} flows in {:.1f}s: {:.1f} flows/s, {:.1f} requests/s".format(
+            flows, elapsed, flows / elapsed, requests_done / elapsed))
+        if not self.options['url']:
+            self.stdout.write("{} SQL queries, {:.1f} per flow".format(self.queries, self.queries / flows))
+        signatures = Signature.objects.filter(petition=petition, email__startswith='loadtest')
+        self.stdout.write("{} signatures, {} confirmed".format(signatures.count(),
+                                                               signatures.filter(confirmed=True).count()))
@@ -1,26 +1,63 @@
-from petition.models import Petition
-from django.core.management.base import BaseCommand
+import logging
+import os
+import time
+
 from django.conf import settings
-from pathlib import Path
+from django.core.management.base import BaseCommand
+
+from petition.media import find_orphans, variant_stem
+from petition.models import MediaReference
+
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    """find orphans medias in mediaroot
+    """Find the files of MEDIA_ROOT used by no petition nor template, archives excluded
+
+    ./manage.py medias_orphan
+    > List them
+    ./manage.py medias_orphan --delete
+    > Delete the ones older than 24 hours, which are not being used in a petition being edited
+    ./manage.py medias_orphan --delete --min-age 168 --batch-size 100 --pause 1
     """
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true')
+        parser.add_argument('--min-age', type=float, default=24, help="in hours")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0, help="between batches, in seconds")
+
     def handle(self, *args, **options):
-        mediaroot = Path(settings.MEDIA_ROOT)
-        all_petition = list(Petition.objects.all())
-        if all_petition:
-            last_petition = all_petition[-1]
-
-        for media in mediaroot.glob('**/*.*'):
-            media = str(media)
-            if all_petition:
-                for petition in all_petition:
-                    if media in petition.text or media in petition.twitter_image:
-                        break
-                    if petition == last_petition:
-                        print(media)
-            else:
-                print(media)
-            
+        orphans = find_orphans(options['batch_size'])
+        if not options['delete']:
+            for name in orphans:
+                self.stdout.write(name)
+            return
+
+        # An image and its variants are deleted together
+        groups = {}
+        for name in orphans:
+            groups.setdefault(variant_stem(name) or os.path.splitext(name)[0], []).append(name)
+        groups = list(groups.values())
+
+        deadline = time.time() - options['min_age'] * 3600
+        deleted = 0
+        for start in range(0, len(groups), options['batch_size']):
+            batch = groups[start:start + options['batch_size']]
+            # Files used since they were listed are kept
+            originals = [name for group in batch for name in group if variant_stem(name) is None]
+            used = set(MediaReference.objects.filter(media__in=originals).values_list('media', flat=True))
+            for group in batch:
+                if used.intersection(group):
+                    continue
+                for name in group:
+                    path = os.path.join(settings.MEDIA_ROOT, name)
+                    try:
+                        if os.path.getmtime(path) > deadline:
+                            continue
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                    deleted += 1
+            if options['pause']:
+                time.sleep(options['pause'])
+        logger.info("%d orphan medias deleted", deleted)
@@ -83,11 +83,11 @@ class Command(BaseCommand):
             id = options['delete_petition']
             petition = Petition.objects.get(pk=id)
             title = petition.title
-            petition.delete()
-            print("Petition \'{title}\' deleted".format(title=title))
+            petition.soft_delete()
+            print("Petition \'{title}\' deleted, its signatures will be purged by purge_deleted".format(title=title))
 
         if options['delete_user']:
             username = options['delete_user']
             user = PytitionUser.objects.get(user__username=username)
-            user.delete()
-            print("User \'{name}\' deleted".format(name=username))
\ No newline at end of file
+            user.drop()
+            print("User \'{name}\' deleted, its petitions will be purged by purge_deleted".format(name=username))
\ No newline at end of file
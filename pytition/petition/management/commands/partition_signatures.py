@@ -0,0 +1,118 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from petition.models import Petition, Signature
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Move the signature table to a table hash-partitioned by petition (PostgreSQL >= 11 only)
+
+    ./manage.py partition_signatures prepare --partitions 32
+    > Create the partitioned table and mirror new writes into it
+    ./manage.py partition_signatures copy --batch-size 5000 --pause 0.1
+    > Copy existing signatures by batches
+    ./manage.py partition_signatures copy --from-id 1250000
+    > Resume an interrupted copy after the last id it logged
+    ./manage.py partition_signatures status
+    > Show the copy progress
+    ./manage.py partition_signatures swap
+    > Replace the signature table with the partitioned one
+
+    Pytition keeps working during prepare and copy. swap locks the signature table
+    for a moment, the old table is kept as <table>_unpartitioned and can be dropped
+    once everything is fine.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['prepare', 'copy', 'status', 'swap'])
+        parser.add_argument('--partitions', type=int, default=16)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.1)
+        parser.add_argument('--from-id', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            logger.error("Partitioning is only supported with PostgreSQL")
+            return
+        self.table = Signature._meta.db_table
+        self.new_table = self.table + '_partitioned'
+        getattr(self, options['action'])(**options)
+
+    def run_sql(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description:
+                return cursor.fetchall()
+
+    def prepare(self, **options):
+        table, new_table = self.table, self.new_table
+        with transaction.atomic():
+            self.run_sql("CREATE TABLE {new} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY HASH (petition_id)"
+                         .format(new=new_table, old=table))
+            # Unique constraints of a partitioned table must include the partition key
+            self.run_sql("ALTER TABLE {new} ADD PRIMARY KEY (id, petition_id)".format(new=new_table))
+            self.run_sql("ALTER TABLE {new} ADD FOREIGN KEY (petition_id) REFERENCES {petition} (id) "
+                         "DEFERRABLE INITIALLY DEFERRED".format(new=new_table, petition=Petition._meta.db_table))
+            self.run_sql("CREATE UNIQUE INDEX ON {new} (petition_id, email, confirmed)".format(new=new_table))
+            for i in range(options['partitions']):
+                self.run_sql("CREATE TABLE {new}_{i} PARTITION OF {new} FOR VALUES WITH (MODULUS {n}, REMAINDER {i})"
+                             .format(new=new_table, i=i, n=options['partitions']))
+            # Mirror the writes done during the copy into the partitioned table
+            self.run_sql("""
+                CREATE FUNCTION {new}_mirror() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        DELETE FROM {new} WHERE id = OLD.id AND petition_id = OLD.petition_id;
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        INSERT INTO {new} SELECT NEW.*;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql""".format(new=new_table))
+            self.run_sql("CREATE TRIGGER {new}_mirror AFTER INSERT OR UPDATE OR DELETE ON {old} "
+                         "FOR EACH ROW EXECUTE PROCEDURE {new}_mirror()".format(new=new_table, old=table))
+        logger.info("%s created with %d partitions, now run the copy", new_table, options['partitions'])
+
+    def copy(self, **options):
+        last_id = self.run_sql("SELECT max(id) FROM {old}".format(old=self.table))[0][0] or 0
+        start = options['from_id']
+        copied = 0
+        while start < last_id:
+            end = start + options['batch_size']
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Locking the source rows orders the copy with concurrent updates mirrored by the trigger
+                cursor.execute("INSERT INTO {new} SELECT * FROM {old} WHERE id > %s AND id <= %s FOR SHARE "
+                               "ON CONFLICT DO NOTHING".format(new=self.new_table, old=self.table), [start, end])
+                copied += cursor.rowcount
+            logger.info("Signatures up to id %d copied (%d rows)", min(end, last_id), copied)
+            start = end
+            time.sleep(options['pause'])
+
+    def status(self, **options):
+        old = self.run_sql("SELECT count(*) FROM {old}".format(old=self.table))[0][0]
+        new = self.run_sql("SELECT count(*) FROM {new}".format(new=self.new_table))[0][0]
+        self.stdout.write("{}: {} rows, {}: {} rows".format(self.table, old, self.new_table, new))
+
+    def swap(self, **options):
+        table, new_table = self.table, self.new_table
+        with transaction.atomic():
+            self.run_sql("LOCK TABLE {old} IN ACCESS EXCLUSIVE MODE".format(old=table))
+            missing = self.run_sql("SELECT count(*) FROM {old} o WHERE NOT EXISTS (SELECT 1 FROM {new} n "
+                                   "WHERE n.id = o.id AND n.petition_id = o.petition_id)"
+                                   .format(old=table, new=new_table))[0][0]
+            if missing:
+                logger.error("%d signatures are not copied yet, run the copy first", missing)
+                transaction.set_rollback(True)
+                return
+            self.run_sql("DROP TRIGGER {new}_mirror ON {old}".format(new=new_table, old=table))
+            self.run_sql("DROP FUNCTION {new}_mirror()".format(new=new_table))
+            self.run_sql("ALTER TABLE {old} RENAME TO {old}_unpartitioned".format(old=table))
+            self.run_sql("ALTER TABLE {new} RENAME TO {old}".format(new=new_table, old=table))
+            # The id sequence must not be dropped with the old table
+            self.run_sql("ALTER SEQUENCE {old}_id_seq OWNED BY {old}.id".format(old=table))
+        logger.info("%s is now partitioned, %s_unpartitioned can be dropped", table, table)
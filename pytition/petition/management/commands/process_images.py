@@ -0,0 +1,51 @@
+import logging
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from PIL import Image
+
+from petition.images import ALLOWED_FORMATS, process_image, variant_name, variant_widths
+from petition.media import list_media, variant_stem
+
+logger = logging.getLogger(__name__)
+
+
+def is_processed(name):
+    # Its smallest variant exists, images narrower than every IMAGE_VARIANT_WIDTHS only have one at their width
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        with Image.open(path) as image:
+            width = image.width
+    except (OSError, ValueError):
+        return False
+    return os.path.exists(os.path.join(settings.MEDIA_ROOT, variant_name(name, variant_widths(width)[0])))
+
+
+class Command(BaseCommand):
+    """Strip the metadata and generate the variants of the images which have none yet
+
+    Run it from cron when settings.BACKGROUND_IO_WORKERS is 0, uploads then only strip the metadata.
+
+    ./manage.py process_images
+    > Process the images of MEDIA_ROOT which have no variant yet
+    ./manage.py process_images --force
+    > Process them all again, after changing IMAGE_VARIANT_WIDTHS for instance
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true')
+
+    def handle(self, *args, **options):
+        extensions = {'.jpg', '.jpeg'} | {'.' + image_format.lower() for image_format in ALLOWED_FORMATS}
+        for name in sorted(list_media()):
+            if os.path.splitext(name)[1].lower() not in extensions or variant_stem(name) is not None:
+                continue
+            if not options['force'] and is_processed(name):
+                continue
+            try:
+                variants = process_image(name)
+            except Exception as e:
+                logger.error("Cannot process %s: %s", name, e)
+                continue
+            logger.info("%s: %d variants", name, len(variants))
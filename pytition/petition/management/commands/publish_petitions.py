@@ -0,0 +1,41 @@
+import datetime
+import logging
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from petition import publisher
+from petition.models import SignatureStat
+from petition.sitemaps import visible_petitions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Render the pages of the published petitions to settings.STATIC_PETITIONS_ROOT
+
+    ./manage.py publish_petitions
+    > Render all the published petitions, and remove the pages of the other ones
+    ./manage.py publish_petitions --active-since 10
+    > Render the petitions signed or confirmed during the last 10 minutes, to update their counters
+
+    Pages are rendered again when petitions change, but not when they are signed:
+    run it with --active-since every few minutes (e.g. from cron) for the counters to follow.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--active-since', type=int, metavar='MINUTES')
+
+    def handle(self, *args, **options):
+        if not publisher.is_enabled():
+            raise CommandError("STATIC_PETITIONS_ROOT is not set")
+        if options['active_since'] is not None:
+            since = timezone.now() - datetime.timedelta(minutes=options['active_since'])
+            # The statistics are hourly
+            hour = since.replace(minute=0, second=0, microsecond=0)
+            ids = set(SignatureStat.objects.filter(hour__gte=hour).values_list('petition_id', flat=True))
+            stale = set()
+        else:
+            ids = set(visible_petitions().values_list('id', flat=True))
+            stale = publisher.published_ids() - ids
+        for petition_id in sorted(ids | stale):
+            publisher.update(petition_id)
+        logger.info("%d petitions published, %d removed", len(ids), len(stale))
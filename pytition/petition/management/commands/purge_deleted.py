@@ -0,0 +1,44 @@
+import logging
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from petition.models import Petition
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Purge deleted petitions and their signatures by batches
+
+    ./manage.py purge_deleted
+    > Purge all deleted petitions
+    ./manage.py purge_deleted --batch-size 5000 --pause 0.5 --max-batches 10
+    > Delete at most 10 batches of 5000 signatures, sleeping 0.5s between batches
+
+    Deleted petitions are hidden right away, this command does the actual deletion
+    without holding long locks on the signature table. With --max-batches, it can be
+    run periodically and resumes where it stopped.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PURGE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.PURGE_PAUSE_S)
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        deleted = {}
+        batches = []
+
+        def progress(petition, count):
+            batches.append(count)
+            deleted[petition.id] = deleted.get(petition.id, 0) + count
+            logger.info("Petition %d: %d signatures deleted", petition.id, deleted[petition.id])
+
+        for petition in Petition.all_objects.filter(deleted=True).only('id', 'deleted'):
+            max_batches = options['max_batches']
+            if max_batches is not None:
+                max_batches -= len(batches)
+                if max_batches <= 0:
+                    break
+            if petition.purge(batch_size=options['batch_size'], pause=options['pause'],
+                              max_batches=max_batches, progress=progress):
+                logger.info("Petition %d purged", petition.id)
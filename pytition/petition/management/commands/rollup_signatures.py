@@ -0,0 +1,43 @@
+import logging
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+
+from petition.helpers import bulk_create
+from petition.models import Petition, Signature, SignatureStat
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Rebuild the hourly signature statistics from the Signature table
+
+    ./manage.py rollup_signatures
+    > Rebuild statistics of all petitions
+    ./manage.py rollup_signatures 1 2
+    > Rebuild statistics of Petition:1 and Petition:2
+
+    Statistics are normally maintained when signatures are written, this is only
+    needed to backfill existing petitions. As the confirmation date is not stored,
+    rebuilt confirmations are accounted for at the signature date.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('petitions', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        petitions = Petition.objects.all()
+        if options['petitions']:
+            petitions = petitions.filter(pk__in=options['petitions'])
+        for petition_id in petitions.values_list('id', flat=True):
+            rows = Signature.objects.filter(petition_id=petition_id)\
+                .annotate(hour=TruncHour('date')).values('hour')\
+                .annotate(new=Count('id'),
+                          confirmed=Count('id', filter=Q(confirmed=True)),
+                          subscribed=Count('id', filter=Q(subscribed_to_mailinglist=True)))
+            stats = [SignatureStat(petition_id=petition_id, hour=row['hour'], new=row['new'],
+                                   confirmed=row['confirmed'], subscribed=row['subscribed']) for row in rows]
+            with transaction.atomic():
+                SignatureStat.objects.filter(petition_id=petition_id).delete()
+                bulk_create(SignatureStat, stats)
+            logger.info("%d hourly statistics rebuilt for petition %d", len(stats), petition_id)
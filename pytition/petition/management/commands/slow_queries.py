@@ -0,0 +1,49 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from petition.slow_queries import read_log
+
+
+class Command(BaseCommand):
+    """Report the slow SQL queries logged by SlowQueryMiddleware, grouped by fingerprint
+
+    ./manage.py slow_queries
+    > The 20 queries which took the most time overall
+    ./manage.py slow_queries --sort max --top 5 --since 24
+    > The 5 slowest queries of the last 24 hours
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--log', type=str, default=settings.SLOW_QUERY_LOG)
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--sort', choices=['total', 'count', 'max'], default='total')
+        parser.add_argument('--since', type=float, help="number of hours")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['since']) if options['since'] else None
+        groups = defaultdict(lambda: {'count': 0, 'total': 0, 'max': 0, 'views': Counter(), 'sites': Counter()})
+        for entry in read_log(options['log']):
+            if since and parse_datetime(entry['date']) < since:
+                continue
+            group = groups[entry['fingerprint']]
+            group['count'] += 1
+            group['total'] += entry['duration_ms']
+            group['max'] = max(group['max'], entry['duration_ms'])
+            group['views'][entry.get('view') or '-'] += 1
+            if entry['stack']:
+                group['sites'][entry['stack'][-1]] += 1
+
+        ranking = sorted(groups.items(), key=lambda item: item[1][options['sort']], reverse=True)
+        for fingerprint, group in ranking[:options['top']]:
+            self.stdout.write("{count} queries, {total:.1f} ms total, {mean:.1f} ms mean, {max:.1f} ms max".format(
+                mean=group['total'] / group['count'], **group))
+            self.stdout.write("  views: {}".format(", ".join("{} ({})".format(view, count)
+                                                             for view, count in group['views'].most_common(3))))
+            if group['sites']:
+                self.stdout.write("  from: {}".format(group['sites'].most_common(1)[0][0]))
+            self.stdout.write("  {}".format(fingerprint[:500]))
+            self.stdout.write("")
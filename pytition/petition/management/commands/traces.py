@@ -0,0 +1,78 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from petition.tracing import read_traces
+
+
+def span_attributes(span):
+    return {attribute['key']: list(attribute['value'].values())[0] for attribute in span.get('attributes', [])}
+
+
+class Command(BaseCommand):
+    """Show the traces recorded when settings.TRACING_ENABLED is set
+
+    ./manage.py traces
+    > The last 20 traces, with their duration and number of spans
+    ./manage.py traces --name "POST create_signature" --last 1 --timeline
+    > The timeline of the last signature
+    ./manage.py traces 4bf92f3577b34da6a3ce929d0e0e4736
+    > The timeline of a trace
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('trace_ids', nargs='*')
+        parser.add_argument('--file', type=str, default=settings.TRACING_FILE)
+        parser.add_argument('--name', type=str, help="only the traces of this root span")
+        parser.add_argument('--last', type=int, default=20)
+        parser.add_argument('--timeline', action='store_true')
+
+    def handle(self, *args, **options):
+        traces = defaultdict(list)
+        for span in read_traces(options['file']):
+            traces[span['traceId']].append(span)
+
+        if options['trace_ids']:
+            selected = options['trace_ids']
+        else:
+            selected = [trace_id for trace_id, spans in traces.items() if self.root(spans)]
+            if options['name']:
+                selected = [trace_id for trace_id in selected if self.root(traces[trace_id])['name'] == options['name']]
+            selected = selected[-options['last']:]
+
+        for trace_id in selected:
+            spans = traces.get(trace_id)
+            if not spans:
+                self.stdout.write("Unknown trace {}".format(trace_id))
+                continue
+            root = self.root(spans) or min(spans, key=lambda span: int(span['startTimeUnixNano']))
+            self.stdout.write("{} {} {:.1f} ms, {} spans".format(trace_id, root['name'], self.duration(root),
+                                                                 len(spans)))
+            if options['trace_ids'] or options['timeline']:
+                self.timeline(spans, root)
+
+    @staticmethod
+    def root(spans):
+        return next((span for span in spans if 'parentSpanId' not in span), None)
+
+    @staticmethod
+    def duration(span):
+        return (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+
+    def timeline(self, spans, root):
+        children = defaultdict(list)
+        for span in spans:
+            children[span.get('parentSpanId')].append(span)
+        start = int(root['startTimeUnixNano'])
+
+        def show(span, depth):
+            attributes = span_attributes(span)
+            detail = attributes.get('db.statement') or attributes.get('http.status_code') or ''
+            self.stdout.write("  {:>9.1f} ms {:>9.1f} ms  {}{} {}".format(
+                (int(span['startTimeUnixNano']) - start) / 1e6, self.duration(span), '  ' * depth, span['name'],
+                str(detail)[:100]).rstrip())
+            for child in sorted(children[span['spanId']], key=lambda child: int(child['startTimeUnixNano'])):
+                show(child, depth + 1)
+
+        show(root, 0)
+        self.stdout.write("")
@@ -0,0 +1,104 @@
+"""
+Uploaded media
+
+Uploads are stored under settings.MEDIA_UPLOAD_DIR by the SHA-256 hash of
+their content, so that an image uploaded many times is stored once. The files
+of MEDIA_ROOT used by the petitions and templates are recorded in the
+MediaReference table when they are saved, which makes finding the orphan
+files a lookup in an index. See the medias_orphan management command.
+"""
+import hashlib
+import os
+import re
+from pathlib import Path
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+# Fields of Petition and PetitionTemplate which may use media
+REFERENCE_FIELDS = ('text', 'side_text', 'footer_text', 'footer_links', 'sign_form_footer', 'twitter_image')
+
+MEDIA_URL_CHARS = r'[^\s"\'<>()]+'
+
+
+def content_name(digest, extension):
+    if not re.match(r'^\.[A-Za-z0-9]{1,10}$', extension):
+        extension = ''
+    return "{}/{}/{}{}".format(settings.MEDIA_UPLOAD_DIR, digest[:2], digest, extension.lower())
+
+
+def store(file, extension):
+    """Store an uploaded file by the hash of its content
+
+    Return its name relative to MEDIA_ROOT and whether it was not stored yet.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    name = content_name(digest.hexdigest(), extension)
+    storage = FileSystemStorage()
+    if storage.exists(name):
+        return name, False
+    saved = storage.save(name, file)
+    if saved != name:
+        # The same file was just stored by another upload
+        storage.delete(saved)
+        return name, False
+    return name, True
+
+
+def referenced_names(contents):
+    """The names relative to MEDIA_ROOT of the media used in contents (HTML, URLs...)"""
+    media_re = re.compile(re.escape(settings.MEDIA_URL) + '(' + MEDIA_URL_CHARS + ')')
+    names = set()
+    for content in contents:
+        for match in media_re.finditer(content or ''):
+            names.add(unquote(match.group(1)))
+    return names
+
+
+def instance_names(instance):
+    return referenced_names(getattr(instance, field) for field in REFERENCE_FIELDS)
+
+
+def variant_stem(name):
+    """The name of the original image of a variant, without its extension, None if name is not a variant"""
+    match = re.match(r'(.*)-\d+w\.{}$'.format(re.escape(settings.IMAGE_VARIANT_FORMAT.lower())), name)
+    return match.group(1) if match else None
+
+
+def list_media():
+    """The names of the files of MEDIA_ROOT which may be used by petitions
+
+    Archives, hidden files and directories (.gitignore...) and the files being
+    written (.tmp) are excluded.
+    """
+    mediaroot = Path(settings.MEDIA_ROOT)
+    archives = Path(settings.ARCHIVE_ROOT)
+    for directory, subdirectories, files in os.walk(mediaroot):
+        directory = Path(directory)
+        subdirectories[:] = [name for name in subdirectories
+                             if not name.startswith('.') and directory / name != archives]
+        for name in files:
+            if not name.startswith('.') and not name.endswith('.tmp'):
+                yield str((directory / name).relative_to(mediaroot))
+
+
+def find_orphans(batch_size=500):
+    """The files of MEDIA_ROOT used by no petition nor template, along with their variants
+
+    Variants of images still in use are not orphans, even if they are not referenced yet.
+    """
+    from .models import MediaReference
+    names = sorted(list_media())
+    originals = [name for name in names if variant_stem(name) is None]
+    orphans = set()
+    for start in range(0, len(originals), batch_size):
+        batch = originals[start:start + batch_size]
+        used = set(MediaReference.objects.filter(media__in=batch).values_list('media', flat=True))
+        orphans.update(name for name in batch if name not in used)
+    used_stems = {os.path.splitext(name)[0] for name in originals if name not in orphans}
+    orphans.update(name for name in names if variant_stem(name) is not None and variant_stem(name) not in used_stems)
+    return sorted(orphans)
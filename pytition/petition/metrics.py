@@ -0,0 +1,139 @@
+"""
+Prometheus metrics
+
+A minimal in-process registry of counters and histograms, rendered in the
+Prometheus text exposition format by the metrics view. Metrics are kept per
+process: with several uwsgi processes, each one exposes its own values.
+"""
+import bisect
+import ipaddress
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.type)]
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            lines += self.samples(labels, value)
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+    def samples(self, labels, value):
+        return ['{}{} {}'.format(self.name, format_labels(self.labelnames, labels), value)]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            # A new list, as rendering reads them out of the lock
+            counts = list(counts)
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        counts, total = self.values.get(self.key(labels), ([0], 0))
+        return sum(counts)
+
+    def samples(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            lines.append('{}_bucket{} {}'.format(self.name, format_labels(self.labelnames, labels, [('le', le)]),
+                                                 cumulative))
+        lines.append('{}_sum{} {}'.format(self.name, format_labels(self.labelnames, labels), total))
+        lines.append('{}_count{} {}'.format(self.name, format_labels(self.labelnames, labels), cumulative))
+        return lines
+
+
+def is_allowed(ip, allowed):
+    # allowed is a list of addresses or networks, such as settings.METRICS_ALLOWED_IPS
+    try:
+        ip = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(network, strict=False) for network in allowed)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+requests_total = Counter('pytition_requests_total', "HTTP requests", ['view', 'method', 'status'])
+request_duration = Histogram('pytition_request_duration_seconds', "HTTP request duration", ['view'])
+sql_queries_total = Counter('pytition_sql_queries_total', "SQL queries", ['view'])
+sql_duration_total = Counter('pytition_sql_duration_seconds_total', "Time spent in SQL queries", ['view'])
+mail_duration = Histogram('pytition_mail_send_duration_seconds', "Email sending duration")
+newsletter_duration = Histogram('pytition_newsletter_subscribe_duration_seconds', "Newsletter subscription duration",
+                                ['method'])
+admission_wait = Histogram('pytition_admission_wait_seconds', "Wait for a slot of the admission control", ['view'])
+admission_shed_total = Counter('pytition_admission_shed_total', "Requests refused by the admission control", ['view'])
@@ -0,0 +1,305 @@
+import cProfile
+import fcntl
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from . import metrics, slow_queries, tracing
+from .routers import read_from_replica, enable_replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_PIN_COOKIE = 'pytition_primary'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def execute_wrapper(wrapper):
+    # Install an execute wrapper on every database connection of the current thread
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+    return stack
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve the anonymous reads of settings.DATABASE_REPLICA_VIEWS from the read replicas.
+    A client whose request wrote something (signed, confirmed, edited...), whatever its
+    method, is pinned to the primary database for settings.DATABASE_REPLICA_PIN_SECONDS
+    so that it reads its own writes.
+    """
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = []
+
+        def record_write(execute, sql, params, many, context):
+            if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+                writes.append(sql)
+            return execute(sql, params, many, context)
+
+        # Writes only go to the primary database
+        with read_from_replica(False), connections[DEFAULT_DB_ALIAS].execute_wrapper(record_write):
+            response = self.get_response(request)
+        if settings.DATABASE_REPLICAS and writes:
+            response.set_cookie(PRIMARY_PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                                httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        enable_replica_reads(self.can_use_replica(request))
+
+    @staticmethod
+    def can_use_replica(request):
+        if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+            return False
+        if PRIMARY_PIN_COOKIE in request.COOKIES:
+            return False
+        if request.user.is_authenticated:
+            return False
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        return url_name in settings.DATABASE_REPLICA_VIEWS
+
+
+class HostSlots:
+    """
+    A semaphore shared by all the processes and threads of the host: a slot is the lock
+    (flock) of one of count files of directory, held by an open file. The locks of a
+    process which dies are released by the system.
+    """
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, directory, count):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, 'slot-{}.lock'.format(i)) for i in range(count)]
+
+    def acquire(self, timeout):
+        """Return the held slot, None if none got free within timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            start = random.randrange(len(self.paths))
+            for path in self.paths[start:] + self.paths[:start]:
+                slot = open(path, 'a')
+                try:
+                    fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    slot.close()
+                    continue
+                return slot
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    @staticmethod
+    def release(slot):
+        fcntl.flock(slot, fcntl.LOCK_UN)
+        slot.close()
+
+
+class AdmissionControlMiddleware:
+    """
+    Limit the number of anonymous requests to the public write views of
+    settings.ADMISSION_CONTROL_VIEWS (signing, confirming, reporting) processed at once by
+    all the processes of the host to settings.ADMISSION_CONTROL_CONCURRENCY. A request waits
+    settings.ADMISSION_CONTROL_QUEUE_TIMEOUT seconds at most for its turn, then is answered
+    a 503 asking to retry after settings.ADMISSION_CONTROL_RETRY_AFTER seconds, so that a
+    viral petition leaves workers to the authenticated users, which are never limited.
+    """
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL_CONCURRENCY:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slots = HostSlots(settings.ADMISSION_CONTROL_LOCK_DIR, settings.ADMISSION_CONTROL_CONCURRENCY)
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            slot = getattr(request, '_admission_slot', None)
+            if slot is not None:
+                self.slots.release(slot)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = request.resolver_match.url_name
+        if view not in settings.ADMISSION_CONTROL_VIEWS or request.user.is_authenticated:
+            return None
+        start = time.perf_counter()
+        request._admission_slot = self.slots.acquire(timeout=settings.ADMISSION_CONTROL_QUEUE_TIMEOUT)
+        metrics.admission_wait.observe(time.perf_counter() - start, view=view)
+        if request._admission_slot is not None:
+            return None
+        metrics.admission_shed_total.inc(view=view)
+        response = HttpResponse(render_to_string('petition/retry_later.html'), status=503)
+        response['Retry-After'] = str(settings.ADMISSION_CONTROL_RETRY_AFTER)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Count requests and SQL queries and measure their duration, per view,
+    when settings.METRICS_ENABLED is set. See the metrics view.
+    """
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = {'queries': 0, 'duration': 0}
+
+        def record_query(execute, *args):
+            start = time.perf_counter()
+            try:
+                return execute(*args)
+            finally:
+                sql['queries'] += 1
+                sql['duration'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with execute_wrapper(record_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view = request.resolver_match.view_name if request.resolver_match else 'none'
+        metrics.requests_total.inc(view=view, method=request.method, status=response.status_code)
+        metrics.request_duration.observe(duration, view=view)
+        metrics.sql_queries_total.inc(sql['queries'], view=view)
+        metrics.sql_duration_total.inc(sql['duration'], view=view)
+        return response
+
+
+class TracingMiddleware:
+    """
+    Trace each request, and each SQL query in a child span, when settings.TRACING_ENABLED
+    is set. See petition.tracing.
+    """
+    def __init__(self, get_response):
+        if not settings.TRACING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        def trace_query(execute, sql, params, many, context):
+            attributes = {'db.system': context['connection'].vendor, 'db.statement': sql}
+            with tracing.start_as_current_span('db.query', tracing.KIND_CLIENT, attributes):
+                return execute(sql, params, many, context)
+
+        attributes = {'http.method': request.method, 'http.target': request.get_full_path()}
+        with tracing.start_as_current_span(request.method, tracing.KIND_SERVER, attributes) as span:
+            with execute_wrapper(trace_query):
+                response = self.get_response(request)
+            if request.resolver_match:
+                span.update_name("{} {}".format(request.method, request.resolver_match.view_name))
+                span.set_attribute('http.route', request.resolver_match.view_name)
+            span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.set_status(tracing.STATUS_ERROR)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests of staff users which ask for it with the PROFILING_PARAMETER
+    query parameter or the PROFILING_HEADER header, when settings.PROFILING_ENABLED is set.
+    Profiles are stored along with the SQL queries and listed in the admin site.
+    """
+    PROFILING_PARAMETER = 'profile'
+    PROFILING_HEADER = 'HTTP_X_PYTITION_PROFILE'
+    TOP_FUNCTIONS = 80
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({'sql': sql, 'params': repr(params)[:500], 'time': time.perf_counter() - start})
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with execute_wrapper(record_query):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        profile = self.save_profile(request, response, profiler, duration, queries)
+        response['X-Pytition-Profile'] = reverse('admin:petition_requestprofile_change', args=[profile.id])
+        return response
+
+    def wants_profile(self, request):
+        if self.PROFILING_PARAMETER not in request.GET and self.PROFILING_HEADER not in request.META:
+            return False
+        return request.user.is_authenticated and request.user.is_staff
+
+    def save_profile(self, request, response, profiler, duration, queries):
+        from .models import RequestProfile
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats('cumulative').print_stats(self.TOP_FUNCTIONS)
+        profile = RequestProfile.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view=request.resolver_match.view_name if request.resolver_match else '',
+            status=response.status_code,
+            duration=duration,
+            sql_count=len(queries),
+            sql_duration=sum(query['time'] for query in queries),
+            report=report.getvalue(),
+            queries=json.dumps(queries),
+            stats=marshal.dumps(stats.stats))
+        RequestProfile.prune()
+        return profile
+
+
+class SlowQueryMiddleware:
+    """
+    Log the SQL queries longer than settings.SLOW_QUERY_THRESHOLD_MS along with
+    the view and the Pytition code which issued them, see petition.slow_queries.
+    """
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD_MS is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+
+        def log_slow_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                duration = time.perf_counter() - start
+                if duration >= threshold:
+                    slow_queries.record(sql, duration, request)
+
+        with execute_wrapper(log_slow_query):
+            return self.get_response(request)
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0013_auto_20210607_1924'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignatureStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('new', models.IntegerField(default=0)),
+                ('confirmed', models.IntegerField(default=0)),
+                ('subscribed', models.IntegerField(default=0)),
+                ('petition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='petition.Petition')),
+            ],
+            options={
+                'unique_together': {('petition', 'hour')},
+            },
+        ),
+    ]
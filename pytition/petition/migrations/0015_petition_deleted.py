@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0014_signaturestat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='deleted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
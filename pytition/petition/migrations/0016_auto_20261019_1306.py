@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0015_petition_deleted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='archive_file',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='archived_confirmed_signatures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='archived_signatures',
+            field=models.IntegerField(default=0),
+        ),
+    ]
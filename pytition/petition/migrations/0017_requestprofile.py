@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('petition', '0016_auto_20261019_1306'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=2000)),
+                ('view', models.CharField(blank=True, max_length=200)),
+                ('status', models.IntegerField()),
+                ('duration', models.FloatField()),
+                ('sql_count', models.IntegerField()),
+                ('sql_duration', models.FloatField()),
+                ('report', models.TextField()),
+                ('queries', models.TextField()),
+                ('stats', models.BinaryField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
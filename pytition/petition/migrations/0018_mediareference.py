@@ -0,0 +1,51 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:29
+
+import re
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of petition.media at the time of this migration
+REFERENCE_FIELDS = ('text', 'side_text', 'footer_text', 'footer_links', 'sign_form_footer', 'twitter_image')
+
+MEDIA_URL_CHARS = r'[^\s"\'<>()]+'
+
+
+def instance_names(instance):
+    media_re = re.compile(re.escape(settings.MEDIA_URL) + '(' + MEDIA_URL_CHARS + ')')
+    names = set()
+    for content in (getattr(instance, field) for field in REFERENCE_FIELDS):
+        for match in media_re.finditer(content or ''):
+            names.add(unquote(match.group(1)))
+    return names
+
+
+def populate_references(apps, schema_editor):
+    MediaReference = apps.get_model('petition', 'MediaReference')
+    for model, owner in (('Petition', 'petition'), ('PetitionTemplate', 'template')):
+        instances = apps.get_model('petition', model).objects.only(*REFERENCE_FIELDS)
+        for instance in instances.iterator():
+            MediaReference.objects.bulk_create([MediaReference(media=name, **{owner: instance})
+                                                for name in instance_names(instance)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0017_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaReference',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media', models.CharField(db_index=True, max_length=500)),
+                ('petition', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='petition.Petition')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='petition.PetitionTemplate')),
+            ],
+        ),
+        migrations.RunPython(populate_references, migrations.RunPython.noop),
+    ]
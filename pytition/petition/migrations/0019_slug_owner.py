@@ -0,0 +1,59 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.urls import reverse
+
+
+def populate_owners(apps, schema_editor):
+    # Set the owner of the slugs, dropping the duplicates of an owner,
+    # and the canonical URL of the petitions
+    SlugModel = apps.get_model('petition', 'SlugModel')
+    Petition = apps.get_model('petition', 'Petition')
+    seen = set()
+    for slug in SlugModel.objects.select_related('petition').order_by('id').iterator():
+        owner = (slug.petition.user_id, slug.petition.org_id)
+        if owner != (None, None) and (owner, slug.slug) in seen:
+            slug.delete()
+            continue
+        seen.add((owner, slug.slug))
+        SlugModel.objects.filter(pk=slug.pk).update(user=owner[0], org=owner[1])
+    for petition in Petition.objects.select_related('user__user', 'org').iterator():
+        slug = SlugModel.objects.filter(petition=petition).order_by('id').first()
+        if slug is None:
+            url = reverse('detail', kwargs={'petition_id': petition.id})
+        elif petition.org_id is not None:
+            url = reverse('slug_show_petition', kwargs={'orgslugname': petition.org.slugname,
+                                                        'petitionname': slug.slug})
+        elif petition.user_id is not None:
+            url = reverse('slug_show_petition', kwargs={'username': petition.user.user.username,
+                                                        'petitionname': slug.slug})
+        else:
+            continue
+        Petition.objects.filter(pk=petition.pk).update(canonical_url=url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0018_mediareference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='canonical_url',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='slugmodel',
+            name='org',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='petition.Organization'),
+        ),
+        migrations.AddField(
+            model_name='slugmodel',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='petition.PytitionUser'),
+        ),
+        migrations.RunPython(populate_owners, migrations.RunPython.noop),
+    ]
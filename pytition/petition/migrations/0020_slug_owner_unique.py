@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0019_slug_owner'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='slugmodel',
+            unique_together={('user', 'slug'), ('org', 'slug')},
+        ),
+    ]
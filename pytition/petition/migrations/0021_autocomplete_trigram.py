@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db import migrations
+
+# Trigram indexes for the icontains lookups of the autocomplete, which
+# PostgreSQL runs as UPPER(column::text) LIKE UPPER(...)
+INDEXES = (
+    ('petition_autocomplete_username', settings.AUTH_USER_MODEL, 'username'),
+    ('petition_autocomplete_first_name', settings.AUTH_USER_MODEL, 'first_name'),
+    ('petition_autocomplete_last_name', settings.AUTH_USER_MODEL, 'last_name'),
+    ('petition_autocomplete_org_name', 'petition.Organization', 'name'),
+    ('petition_autocomplete_org_slugname', 'petition.Organization', 'slugname'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, model, column in INDEXES:
+        table = apps.get_model(model)._meta.db_table
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS {} ON {} USING gin (UPPER({}::text) gin_trgm_ops)'
+                              .format(name, schema_editor.quote_name(table), schema_editor.quote_name(column)))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, model, column in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('petition', '0020_slug_owner_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
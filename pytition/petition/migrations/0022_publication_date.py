@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-19 18:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_publication_date(apps, schema_editor):
+    # Best guess for the petitions published so far
+    Petition = apps.get_model('petition', 'Petition')
+    Petition.objects.filter(published=True).update(publication_date=F('creation_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0021_autocomplete_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='publication_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='petition',
+            index=models.Index(fields=['published', '-publication_date'], name='petition_pe_publish_2682cc_idx'),
+        ),
+        migrations.RunPython(populate_publication_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min
+from django.db.models.functions import Lower
+
+
+def normalize_emails(apps, schema_editor):
+    # Signatures are deduplicated by their lowercased email: merge the signatures of an email, which
+    # may only differ by their case, keeping the first confirmed one and the last pending one (the
+    # last link sent), then lowercase the remaining emails
+    Signature = apps.get_model('petition', 'Signature')
+    signatures = Signature.objects.annotate(lowered=Lower('email'))
+    duplicates = signatures.values('petition_id', 'confirmed', 'lowered')\
+        .annotate(count=Count('id'), first=Min('id'), last=Max('id')).filter(count__gt=1)
+    for duplicate in list(duplicates):
+        kept = duplicate['first'] if duplicate['confirmed'] else duplicate['last']
+        signatures.filter(petition_id=duplicate['petition_id'], confirmed=duplicate['confirmed'],
+                          lowered=duplicate['lowered']).exclude(pk=kept).delete()
+    Signature.objects.filter(email__regex=r'[A-Z]').update(email=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0022_publication_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petition', '0023_signature_email'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='signature',
+            constraint=models.UniqueConstraint(fields=('petition', 'email', 'confirmed'), name='unique_signature'),
+        ),
+    ]
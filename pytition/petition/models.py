@@ -8,7 +8,9 @@ from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.hashers import get_hasher
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest, TruncHour
 from django.urls import reverse
 from django.utils import timezone
 
@@ -16,8 +18,18 @@ from tinymce import models as tinymce_models
 from colorfield.fields import ColorField
 
 from .helpers import sanitize_html
-
+from .media import REFERENCE_FIELDS, instance_names
+from .slugs import clear_slug_cache
+from . import sitemaps
+from . import publisher
+from . import autocomplete
+
+import csv
+import gzip
 import html
+import os
+import time
+import uuid
 
 
 # ----------------------------------- PytitionUser ----------------------------
@@ -28,22 +40,24 @@ class PytitionUser(models.Model):
     moderated = models.BooleanField(default=False)
 
     def drop(self):
+        # Petitions are detached and soft deleted so that their signatures
+        # are purged by batches instead of being cascade deleted here
         with transaction.atomic():
             orgs = list(self.organization_set.all())
-            petitions = list(self.petition_set.all())
-            templates = list(self.petitiontemplate_set.all())
+            Petition.soft_delete_queryset(self.petition_set.all())
             self.delete()
             for org in orgs:
                 if org.members.count() == 0:
+                    Petition.soft_delete_queryset(org.petition_set.all())
                     org.delete()
-            for petition in petitions:
-                petition.delete()
-            for template in templates:
-                template.delete()
 
     def moderate(self, do_moderate=True):
         self.moderated = do_moderate
         self.save()
+        # Their petitions are hidden or shown again
+        sitemaps.invalidate_all()
+        for petition_id in Petition.objects.filter(user=self).values_list('id', flat=True):
+            publisher.schedule(petition_id)
 
     @property
     def is_authenticated(self):
@@ -145,8 +159,76 @@ class Organization(models.Model):
         super(Organization, self).save(*args, **kwargs)
 
 
+# ------------------------------- Dirty fields --------------------------------
+class DirtyFieldsMixin:
+    """
+    Track the columns changed since the instance was loaded or last saved, so that
+    save() only writes them (UPDATE ... SET of the dirty columns) and does not
+    write at all when nothing changed. The post_save receivers get the written
+    columns as update_fields and may skip their work. New instances and explicit
+    update_fields are saved as usual.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._field_values()
+        return instance
+
+    def _field_values(self, fields=None):
+        deferred = self.get_deferred_fields()
+        return {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields
+                if f.attname not in deferred and (fields is None or f.name in fields or f.attname in fields)}
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        # Deferred fields are loaded through here
+        if hasattr(self, '_loaded_values'):
+            self._loaded_values.update(self._field_values(fields))
+
+    def get_dirty_fields(self):
+        """The names of the columns changed since loaded, None if the instance was never loaded nor saved"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or self.pk is None:
+            return None
+        current = self._field_values()
+        return [f.name for f in self._meta.concrete_fields if not f.primary_key and f.attname in current
+                and (f.attname not in loaded or current[f.attname] != loaded[f.attname])]
+
+    def is_dirty(self):
+        return self.get_dirty_fields() != []
+
+    def save(self, *args, **kwargs):
+        if not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            dirty = self.get_dirty_fields()
+            if dirty == []:
+                return
+            if dirty is not None:
+                kwargs['update_fields'] = dirty
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = self._field_values()
+        else:
+            self._loaded_values.update(self._field_values(update_fields))
+
+
 # ----------------------------------- Petition --------------------------------
-class Petition(models.Model):
+class PetitionQuerySet(models.QuerySet):
+    def summary(self):
+        """
+        Only load the columns needed to list petitions (see Petition.SUMMARY_FIELDS),
+        leaving the texts and the newsletter settings out, with the owners.
+        """
+        return self.only(*Petition.SUMMARY_FIELDS).select_related('user__user', 'org')
+
+
+class PetitionManager(models.Manager.from_queryset(PetitionQuerySet)):
+    # Petitions waiting to be purged are hidden everywhere
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted=False)
+
+
+class Petition(DirtyFieldsMixin, models.Model):
     NO =           "no gradient"
     RIGHT =        "to right"
     BOTTOM =       "to bottom"
@@ -212,7 +294,30 @@ class Petition(models.Model):
     paper_signatures_enabled = models.BooleanField(default=False)
     creation_date = models.DateTimeField(blank=True)
     last_modification_date = models.DateTimeField(blank=True)
+    # First publication, for the feeds
+    publication_date = models.DateTimeField(blank=True, null=True)
     moderated = models.BooleanField(default=False)
+    deleted = models.BooleanField(default=False)
+    archived = models.BooleanField(default=False)
+    archive_file = models.CharField(max_length=500, blank=True)
+    archived_signatures = models.IntegerField(default=0)
+    archived_confirmed_signatures = models.IntegerField(default=0)
+    # Path of the petition, from its first slug, see update_canonical_url()
+    canonical_url = models.CharField(max_length=500, blank=True)
+
+    ARCHIVE_FIELDS = ['first_name', 'last_name', 'phone', 'email', 'subscribed_to_mailinglist', 'confirmed', 'date']
+
+    objects = PetitionManager()
+    all_objects = PetitionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['published', '-publication_date'])]
+
+    # Columns of the petition lists and counters: owner, url, picture, description and signature number
+    SUMMARY_FIELDS = ('title', 'user', 'org', 'twitter_image', 'twitter_description', 'published', 'moderated',
+                      'deleted', 'creation_date', 'last_modification_date', 'paper_signatures',
+                      'paper_signatures_enabled', 'archived', 'archive_file', 'archived_signatures',
+                      'archived_confirmed_signatures', 'canonical_url', 'publication_date')
 
     @property
     def is_moderated(self):
@@ -253,39 +358,48 @@ class Petition(models.Model):
         # Add a slug corectly
         with transaction.atomic():
             slugtext = slugify(slugtext)
-            # Check if there is another similar slug for the same user/org
-            same_slugs = SlugModel.objects.filter(slug=slugtext)
-            if len(same_slugs) == 0:
-                slug = SlugModel.objects.create(slug=slugtext, petition=self)
-            else:
-                alread_used = False
-                for s in same_slugs:
-                    if self.owner_type == "org":
-                        if s.petition.owner_type == "org":
-                            if self.org == s.petition.org:
-                                alread_used = True
-                    else:
-                        if s.petition.owner_type == "user":
-                            if self.user == s.petition.user:
-                                alread_used = True
-                if alread_used:
-                    raise ValueError('This slug is already used')
-                else:
-                    slug = SlugModel.objects.create(slug=slugtext, petition=self)
+            # Slugs are unique per user/org, see SlugModel
+            if SlugModel.objects.filter(slug=slugtext, user=self.user_id, org=self.org_id).exists():
+                raise ValueError('This slug is already used')
+            SlugModel.objects.create(slug=slugtext, petition=self)
 
     def del_slug(self, slug):
         # Delete a given slug
         s = SlugModel.objects.filter(slug=slug, petition=self).first()
+        s.petition = self
         s.delete()
 
+    def move_slugs(self):
+        # Give the slugs to the new owner, except those it already uses
+        slugs = self.slugmodel_set.exclude(user=self.user_id, org=self.org_id)
+        if not slugs.exists():
+            return
+        with transaction.atomic():
+            taken = SlugModel.objects.filter(user=self.user_id, org=self.org_id).exclude(petition=self)
+            self.slugmodel_set.filter(slug__in=taken.values('slug')).delete()
+            self.slugmodel_set.update(user=self.user_id, org=self.org_id)
+        clear_slug_cache()
+        self.update_canonical_url()
+
     @classmethod
-    def by_id(cls, id):
+    def by_id(cls, id, summary=False):
+        petitions = Petition.objects.summary() if summary else Petition.objects
         try:
-            return Petition.objects.get(pk=id)
+            return petitions.get(pk=id)
         except Petition.DoesNotExist:
             return None
 
     def get_signature_number(self, confirmed=None):
+        if self.archived and self.archive_file:
+            if confirmed is None:
+                nb_electronic_signatures = self.archived_signatures
+            elif confirmed:
+                nb_electronic_signatures = self.archived_confirmed_signatures
+            else:
+                nb_electronic_signatures = self.archived_signatures - self.archived_confirmed_signatures
+            if self.paper_signatures_enabled:
+                return nb_electronic_signatures + self.paper_signatures
+            return nb_electronic_signatures
         signatures = self.signature_set
         if confirmed is not None:
             signatures = signatures.filter(confirmed=confirmed)
@@ -301,14 +415,135 @@ class Petition(models.Model):
         return signature_number > 0
 
     def confirm_signature(self, conf_hash):
-        signature = Signature.objects.filter(petition=self.id).get(confirmation_hash=conf_hash)
-        if signature:
-            # Now confirm the signature corresponding to this hash
-            signature.confirm()
-            signature.save()
-            return _("Thank you for confirming your signature!")
-        else:
-            return None
+        """
+        Confirm the signature of this confirmation hash, and return Signature.CONFIRMED,
+        ALREADY_CONFIRMED, ALREADY_SIGNED (another signature of this email is confirmed) or INVALID.
+        The confirmation is a single conditional UPDATE, guarded by the unique constraint on the
+        signatures of an email, so that concurrent confirmations succeed only once.
+        """
+        signatures = Signature.objects.filter(petition_id=self.id)
+        signature = signatures.filter(confirmation_hash=conf_hash).values('id').first()
+        if signature is None:
+            return Signature.INVALID
+        try:
+            with transaction.atomic():
+                confirmed = signatures.filter(pk=signature['id'], confirmed=False).update(confirmed=True)
+        except IntegrityError:
+            return Signature.ALREADY_SIGNED
+        if not confirmed:
+            return Signature.ALREADY_CONFIRMED
+        SignatureStat.increment(self.id, timezone.now(), confirmed=1)
+        return Signature.CONFIRMED
+
+    def signature_stats(self, since=None, until=None):
+        # Hourly signature statistics, read from the rollup table only
+        stats = self.signaturestat_set.all()
+        if since is not None:
+            stats = stats.filter(hour__gte=SignatureStat.truncate(since))
+        if until is not None:
+            stats = stats.filter(hour__lte=until)
+        return stats.order_by('hour')
+
+    @classmethod
+    def soft_delete_queryset(cls, petitions):
+        # Hide petitions right away and detach them from their owner,
+        # purge() takes care of actually deleting them later on
+        ids = list(petitions.values_list('id', flat=True))
+        SlugModel.objects.filter(petition__in=ids).delete()
+        cls.all_objects.filter(pk__in=ids).update(deleted=True, published=False, user=None, org=None)
+        sitemaps.invalidate_all()
+        for petition_id in ids:
+            publisher.schedule(petition_id)
+
+    def soft_delete(self):
+        Petition.soft_delete_queryset(Petition.objects.filter(pk=self.pk))
+        self.deleted = True
+        self.published = False
+
+    def purge(self, batch_size=1000, pause=0, max_batches=None, progress=None):
+        """
+        Delete the signatures of a soft deleted petition by batches of batch_size,
+        sleeping pause seconds between batches, then delete the petition itself.
+        progress is called with the petition and the number of signatures deleted by each batch.
+        Return True once the petition is gone, False if max_batches was reached before.
+        """
+        if not self.deleted:
+            raise ValueError("Only deleted petitions can be purged")
+        if self.delete_signatures(batch_size, pause, max_batches, progress):
+            self.delete()
+            return True
+        return False
+
+    def delete_signatures(self, batch_size=1000, pause=0, max_batches=None, progress=None, signatures=None,
+                          keep_stats=False):
+        # Delete signatures by batches to avoid long locks on the signature table,
+        # and from the hourly statistics unless keep_stats is set
+        # Return True once all of them are deleted
+        if signatures is None:
+            signatures = Signature.objects.filter(petition_id=self.id)
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            ids = list(signatures.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return True
+            with transaction.atomic():
+                if not keep_stats:
+                    SignatureStat.discount(signatures.filter(pk__in=ids))
+                signatures.filter(pk__in=ids).delete()
+            batches += 1
+            if progress:
+                progress(self, len(ids))
+            if pause:
+                time.sleep(pause)
+        return False
+
+    @property
+    def archive_path(self):
+        return os.path.join(settings.ARCHIVE_ROOT, self.archive_file)
+
+    def archive(self, batch_size=1000, pause=0, progress=None):
+        """
+        Move the signatures of this petition to a gzipped CSV file under settings.ARCHIVE_ROOT,
+        keep their counts on the petition and delete them from the database by batches.
+        New signatures are refused as soon as the archiving starts.
+        It is safe to run it again if it has been interrupted.
+        """
+        if not self.archived:
+            self.archived = True
+            Petition.all_objects.filter(pk=self.pk).update(archived=True)
+        signatures = Signature.objects.filter(petition_id=self.id)
+        if not self.archive_file:
+            relpath = "{}-{}.csv.gz".format(self.id, uuid.uuid4().hex)
+            path = os.path.join(settings.ARCHIVE_ROOT, relpath)
+            os.makedirs(os.path.dirname(path), mode=settings.FILE_UPLOAD_DIRECTORY_PERMISSIONS, exist_ok=True)
+            total, confirmed = 0, 0
+            with gzip.open(path + ".tmp", "wt", newline='') as archive:
+                writer = csv.writer(archive)
+                writer.writerow(Petition.ARCHIVE_FIELDS)
+                for signature in signatures.order_by('id').values_list(*Petition.ARCHIVE_FIELDS).iterator(chunk_size=batch_size):
+                    writer.writerow(signature)
+                    total += 1
+                    confirmed += signature[Petition.ARCHIVE_FIELDS.index('confirmed')]
+            os.chmod(path + ".tmp", settings.FILE_UPLOAD_PERMISSIONS)
+            os.rename(path + ".tmp", path)
+            self.archive_file = relpath
+            self.archived_signatures = total
+            self.archived_confirmed_signatures = confirmed
+            Petition.all_objects.filter(pk=self.pk).update(archive_file=relpath, archived_signatures=total,
+                                                           archived_confirmed_signatures=confirmed)
+        # Archived signatures are still counted
+        return self.delete_signatures(batch_size, pause, progress=progress, keep_stats=True)
+
+    def archived_signature_rows(self, only_confirmed=False):
+        # Read the archived signatures back, as lists of strings, header first
+        with gzip.open(self.archive_path, "rt", newline='') as archive:
+            reader = csv.reader(archive)
+            header = next(reader)
+            yield header
+            confirmed = header.index('confirmed')
+            for row in reader:
+                if not only_confirmed or row[confirmed] == 'True':
+                    yield row
 
     def publish(self):
         self.published = True
@@ -398,7 +633,10 @@ class Petition(models.Model):
 
     @property
     def url(self):
-        slugs = self.slugmodel_set.all()
+        return self.canonical_url or self.get_canonical_url()
+
+    def get_canonical_url(self):
+        slugs = self.slugmodel_set.order_by('id')[:1]
         if len(slugs) == 0:
             # If there is no slug, ugly url
             return reverse('detail', kwargs={'petition_id': self.id})
@@ -417,15 +655,36 @@ class Petition(models.Model):
                 # This is a BUG!
                 raise ValueError(_("This petition is buggy. Sorry about that!"))
 
+    def update_canonical_url(self):
+        # Written directly, the slugs and the owner are not part of the petition row
+        url = self.get_canonical_url()
+        if url != self.canonical_url:
+            Petition.all_objects.filter(pk=self.pk).update(canonical_url=url)
+            self.canonical_url = url
+            if hasattr(self, '_loaded_values'):
+                self._loaded_values['canonical_url'] = url
+            if self.published:
+                sitemaps.invalidate_petition(self, ['canonical_url'])
+                publisher.schedule(self.id)
+
     def save(self, *args, **kwargs):
-        if (self.org is None and self.user is None):
+        if (self.org_id is None and self.user_id is None):
             raise Exception("You need to provide a user or org as owner")
-        elif (self.org is not None and self.user is not None):
+        elif (self.org_id is not None and self.user_id is not None):
             raise Exception("A petition can have only one owner")
         else:
             if not self.salt:
                 hasher = get_hasher()
                 self.salt = hasher.salt().decode('utf-8')
+        first_publication = self.published and self.publication_date is None
+        if first_publication:
+            self.publication_date = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'last_modification_date'}
+            if first_publication:
+                kwargs['update_fields'].add('publication_date')
+        elif not self.is_dirty():
+            return
         self.last_modification_date = timezone.now()
         super(Petition, self).save(*args, **kwargs)
 
@@ -435,6 +694,12 @@ class Petition(models.Model):
 
 # --------------------------------- Signature ---------------------------------
 class Signature(models.Model):
+    # Outcomes of Petition.confirm_signature
+    CONFIRMED = "confirmed"
+    ALREADY_CONFIRMED = "already confirmed"
+    ALREADY_SIGNED = "already signed"
+    INVALID = "invalid"
+
     first_name = models.CharField(max_length=50, verbose_name=ugettext_lazy("First name"))
     last_name = models.CharField(max_length=50, verbose_name=ugettext_lazy("Last name"))
     phone = models.CharField(max_length=20, blank=True, verbose_name=ugettext_lazy("Phone number"))
@@ -446,6 +711,10 @@ class Signature(models.Model):
     date = models.DateTimeField(blank=True, auto_now_add=True, verbose_name=ugettext_lazy("Date"))
     ipaddress = models.TextField(blank=True, null=True)
 
+    class Meta:
+        # At most one pending and one confirmed signature per email address
+        constraints = [models.UniqueConstraint(fields=['petition', 'email', 'confirmed'], name='unique_signature')]
+
     def clean(self):
         if self.petition.already_signed(self.email):
             if self.petition.signature_set.filter(email = self.email).get(confirmed = True).id != self.id:
@@ -453,13 +722,33 @@ class Signature(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
+        created = self.pk is None
+        just_confirmed = getattr(self, '_just_confirmed', False) or (created and self.confirmed)
         if self.confirmed:
             # invalidating other signatures from same email
-            Signature.objects.filter(petition=self.petition).filter(email=self.email)\
-                .exclude(id=self.id).delete()
+            others = Signature.objects.filter(petition_id=self.petition_id).filter(email=self.email)\
+                .exclude(id=self.id)
+            SignatureStat.discount(others)
+            others.delete()
         super().save(*args, **kwargs)
+        self._just_confirmed = False
+        if created or just_confirmed:
+            SignatureStat.record(self, created=created, confirmed=just_confirmed)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            SignatureStat.discount(Signature.objects.filter(petition_id=self.petition_id, pk=self.pk))
+            return super().delete(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Filter updates on the petition too, so that a signature table partitioned
+        # by petition (see the partition_signatures command) only scans one partition
+        base_qs = base_qs.filter(petition_id=self.petition_id)
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
 
     def confirm(self):
+        if not self.confirmed:
+            self._just_confirmed = True
         self.confirmed = True
 
     def __str__(self):
@@ -471,8 +760,73 @@ class Signature(models.Model):
                                                     self.last_name))
 
 
+# ------------------------------- SignatureStat -------------------------------
+class SignatureStat(models.Model):
+    """
+    Hourly rollup of signature activity of a petition.
+    Counters are incremented from the signature write path so that
+    dashboards never have to aggregate the Signature table.
+    Deleted signatures are taken out of the new and subscribed counters of the
+    hour they were made, confirmations stay counted at the hour they happened.
+    """
+    petition = models.ForeignKey(Petition, on_delete=models.CASCADE)
+    hour = models.DateTimeField(db_index=True)
+    new = models.IntegerField(default=0)
+    confirmed = models.IntegerField(default=0)
+    subscribed = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('petition', 'hour')
+
+    @staticmethod
+    def truncate(date):
+        return date.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def increment(cls, petition_id, date, new=0, confirmed=0, subscribed=0):
+        hour = cls.truncate(date)
+        counters = {'new': F('new') + new, 'confirmed': F('confirmed') + confirmed,
+                    'subscribed': F('subscribed') + subscribed}
+        # The row of the hour usually exists already
+        if not cls.objects.filter(petition_id=petition_id, hour=hour).update(**counters):
+            stat, _ = cls.objects.get_or_create(petition_id=petition_id, hour=hour)
+            cls.objects.filter(pk=stat.pk).update(**counters)
+
+    @classmethod
+    def discount(cls, signatures):
+        """Take this queryset of signatures, about to be deleted, out of the statistics"""
+        rows = signatures.annotate(hour=TruncHour('date', tzinfo=timezone.utc)).values('petition_id', 'hour')\
+            .annotate(new=Count('id'), subscribed=Count('id', filter=Q(subscribed_to_mailinglist=True)))
+        for row in rows:
+            cls.objects.filter(petition_id=row['petition_id'], hour=row['hour'])\
+                .update(new=Greatest(F('new') - row['new'], 0),
+                        subscribed=Greatest(F('subscribed') - row['subscribed'], 0))
+
+    @classmethod
+    def record(cls, signature, created=False, confirmed=False):
+        if created:
+            cls.increment(signature.petition_id, signature.date, new=1,
+                          subscribed=1 if signature.subscribed_to_mailinglist else 0)
+        if confirmed:
+            # Confirmations are accounted for at the time they happen
+            cls.increment(signature.petition_id, timezone.now(), confirmed=1)
+
+    @property
+    def to_json(self):
+        return {'hour': self.hour.isoformat(),
+                'new': self.new,
+                'confirmed': self.confirmed,
+                'subscribed': self.subscribed}
+
+    def __str__(self):
+        return "[{}:{}] +{}".format(self.petition_id, self.hour.isoformat(), self.new)
+
+    def __repr__(self):
+        return self.__str__()
+
+
 #------------------------------- PetitionTemplate -----------------------------
-class PetitionTemplate(models.Model):
+class PetitionTemplate(DirtyFieldsMixin, models.Model):
     NO =           "no gradient"
     RIGHT =        "to right"
     BOTTOM =       "to bottom"
@@ -549,9 +903,9 @@ class PetitionTemplate(models.Model):
             return "user"
 
     def save(self, *args, **kwargs):
-        if (self.org is None and self.user is None):
+        if (self.org_id is None and self.user_id is None):
             raise Exception("You need to provide a user or org as owner")
-        elif (self.org is not None and self.user is not None):
+        elif (self.org_id is not None and self.user_id is not None):
             raise Exception("A petition can have only one owner")
         else:
             super(PetitionTemplate, self).save(*args, **kwargs)
@@ -561,6 +915,17 @@ class PetitionTemplate(models.Model):
 class SlugModel(models.Model):
     slug = models.SlugField(max_length=200)
     petition = models.ForeignKey(Petition, on_delete=models.CASCADE)
+    # Owner of the petition, for the slugs to be unique per owner
+    user = models.ForeignKey(PytitionUser, on_delete=models.CASCADE, null=True, blank=True)
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        unique_together = [('user', 'slug'), ('org', 'slug')]
+
+    def save(self, *args, **kwargs):
+        self.user_id = self.petition.user_id
+        self.org_id = self.petition.org_id
+        super(SlugModel, self).save(*args, **kwargs)
 
     def clean(self, *args, **kwargs):
         if self.slug == "" or self.slug is None:
@@ -635,12 +1000,59 @@ def pre_save_petition(sender, instance, **kwargs):
         instance.creation_date = timezone.now()
 
 @receiver(post_save, sender=Petition)
-def save_petition(sender, instance, **kwargs):
-    if instance.slugmodel_set.count() == 0:
-        instance.slugify()
-    if kwargs['created']:
-        instance.creation_date = timezone.now()
-        instance.save()
+def save_petition(sender, instance, created, update_fields=None, **kwargs):
+    # The slugs are made from the title, creation_date is set by pre_save_petition
+    if created or update_fields is None or 'title' in update_fields:
+        if instance.slugmodel_set.count() == 0:
+            instance.slugify()
+    if created and not instance.canonical_url:
+        instance.update_canonical_url()
+    elif not created and (update_fields is None or {'user', 'org'} & set(update_fields)):
+        instance.move_slugs()
+    # Unpublished petitions are in no sitemap nor feed, unless they just were
+    if instance.published or (not created and (update_fields is None or 'published' in update_fields)):
+        sitemaps.invalidate_petition(instance, update_fields)
+        publisher.schedule(instance.id)
+
+
+@receiver(post_save, sender=SlugModel)
+@receiver(post_delete, sender=SlugModel)
+def update_petition_url(sender, instance, **kwargs):
+    clear_slug_cache()
+    try:
+        petition = instance.petition
+    except Petition.DoesNotExist:
+        return
+    petition.update_canonical_url()
+    # Its pages are written at the paths of its slugs
+    publisher.schedule(petition.id)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def update_owner_urls(sender, instance, created, update_fields=None, **kwargs):
+    # The URLs of the petitions of a renamed organization or user
+    if created or (update_fields is not None and not {'slugname', 'username'} & set(update_fields)):
+        return
+    if isinstance(instance, Organization):
+        petitions = Petition.objects.filter(org=instance)
+        prefix = reverse("slug_show_petition", kwargs={"orgslugname": instance.slugname, "petitionname": "p"})
+    else:
+        petitions = Petition.objects.filter(user__user=instance)
+        prefix = reverse("slug_show_petition", kwargs={"username": instance.username, "petitionname": "p"})
+    renamed = petitions.filter(slugmodel__isnull=False).exclude(canonical_url__startswith=prefix[:-1]).distinct()
+    for petition in renamed.select_related('user__user', 'org'):
+        clear_slug_cache()
+        petition.update_canonical_url()
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def update_autocomplete(sender, instance, update_fields=None, **kwargs):
+    # Logins only update last_login
+    if update_fields is None or set(update_fields) & {'username', 'first_name', 'last_name', 'name', 'slugname'}:
+        autocomplete.invalidate('orgs' if isinstance(instance, Organization) else 'users')
 
 @receiver(post_delete, sender=PytitionUser)
 def post_delete_user(sender, instance, *args, **kwargs):
@@ -655,4 +1067,67 @@ class ModerationReason(models.Model):
 
 class Moderation(models.Model):
     petition = models.ForeignKey(Petition, on_delete=models.CASCADE)
-    reason = models.ForeignKey(ModerationReason, blank=True, null=True, on_delete=models.SET_NULL)
\ No newline at end of file
+    reason = models.ForeignKey(ModerationReason, blank=True, null=True, on_delete=models.SET_NULL)
+
+# ------------------------------------ MediaReference -----------------------------
+
+class MediaReference(models.Model):
+    """
+    A file of MEDIA_ROOT used by a petition or a template, updated when they are saved.
+    Files which are not referenced are orphans, see the ``medias_orphan`` command.
+    """
+    media = models.CharField(max_length=500, db_index=True)
+    petition = models.ForeignKey(Petition, on_delete=models.CASCADE, null=True, blank=True)
+    template = models.ForeignKey(PetitionTemplate, on_delete=models.CASCADE, null=True, blank=True)
+
+    @classmethod
+    def update_references(cls, instance):
+        owner = 'petition' if isinstance(instance, Petition) else 'template'
+        references = cls.objects.filter(**{owner: instance})
+        names = instance_names(instance)
+        existing = set(references.values_list('media', flat=True))
+        if existing - names:
+            references.filter(media__in=existing - names).delete()
+        cls.objects.bulk_create([cls(media=name, **{owner: instance}) for name in names - existing])
+
+
+@receiver(post_save, sender=Petition)
+@receiver(post_save, sender=PetitionTemplate)
+def update_media_references(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(REFERENCE_FIELDS):
+        MediaReference.update_references(instance)
+
+# ------------------------------------ RequestProfile -----------------------------
+
+class RequestProfile(models.Model):
+    """
+    Profile of a request done by a staff user with the ``profile`` query parameter
+    or the ``X-Pytition-Profile`` header, see settings.PROFILING_ENABLED.
+    Only the last settings.PROFILING_RETENTION profiles are kept.
+    """
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.SET_NULL)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    view = models.CharField(max_length=200, blank=True)
+    status = models.IntegerField()
+    duration = models.FloatField()
+    sql_count = models.IntegerField()
+    sql_duration = models.FloatField()
+    # pstats report sorted by cumulative time
+    report = models.TextField()
+    # JSON list of the SQL queries, with their duration
+    queries = models.TextField()
+    # Raw profile, as written by pstats.Stats.dump_stats()
+    stats = models.BinaryField()
+
+    class Meta:
+        ordering = ['-date']
+
+    @classmethod
+    def prune(cls):
+        kept = cls.objects.order_by('-date', '-id').values_list('id', flat=True)[:settings.PROFILING_RETENTION]
+        cls.objects.exclude(pk__in=list(kept)).delete()
+
+    def __str__(self):
+        return "{} {} ({:.0f} ms)".format(self.method, self.path, self.duration * 1000)
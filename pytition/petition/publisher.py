@@ -0,0 +1,178 @@
+"""
+Pre-rendered petition pages
+
+When settings.STATIC_PETITIONS_ROOT is set, the pages of the published
+petitions are rendered as seen by anonymous visitors to
+<STATIC_PETITIONS_ROOT><path>/index.html, along with their signature counter
+(the JSON answered to ``Accept: application/json``) in index.json, for all the
+paths of the petition: /petition/<id>/ and its slugs. The web server serves
+them directly to anonymous visitors, see the installation documentation.
+
+The pages are rendered again in the background when their petition is saved,
+moderated or its slugs change, and removed when it is not visible anymore.
+``manage.py publish_petitions`` renders them all, or only those recently signed
+to update their counters. The sign form of the pages gets its CSRF token from
+the csrf_token view, and still posts to create_signature.
+"""
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = '.manifest'
+
+
+class PageRequest(HttpRequest):
+    """The request of an anonymous visitor of settings.STATIC_PETITIONS_SITE_URL"""
+    def __init__(self, path):
+        super().__init__()
+        site = urlsplit(settings.STATIC_PETITIONS_SITE_URL)
+        self._scheme = site.scheme
+        self._host = site.netloc
+        self.method = 'GET'
+        self.path = self.path_info = path
+        self.META = {'HTTP_HOST': site.netloc, 'SERVER_NAME': site.hostname,
+                     'SERVER_PORT': site.port or (443 if site.scheme == 'https' else 80)}
+        self.user = AnonymousUser()
+
+    def _get_scheme(self):
+        return self._scheme
+
+    def get_host(self):
+        return self._host
+
+
+def is_enabled():
+    return bool(settings.STATIC_PETITIONS_ROOT)
+
+
+def is_visible(petition):
+    return petition.published and not petition.is_moderated and not petition.deleted \
+        and not petition.archived
+
+
+def petition_paths(petition):
+    paths = [reverse('detail', args=[petition.id])]
+    for slug in petition.slugmodel_set.order_by('id').values_list('slug', flat=True):
+        if petition.org_id is not None:
+            kwargs = {'orgslugname': petition.org.slugname, 'petitionname': slug}
+        else:
+            kwargs = {'username': petition.user.username, 'petitionname': slug}
+        paths.append(reverse('slug_show_petition', kwargs=kwargs))
+    return paths
+
+
+def render_page(petition):
+    from .forms import SignatureForm
+    from .helpers import petition_detail_meta
+    from .models import ModerationReason
+    request = PageRequest(reverse('detail', args=[petition.id]))
+    ctx = {'user': None, 'petition': petition, 'form': SignatureForm(petition=petition),
+           'meta': petition_detail_meta(request, petition.id),
+           'moderation_reasons': ModerationReason.objects.all(), 'static_page': True}
+    return render_to_string('petition/petition_detail.html', ctx, request=request)
+
+
+def _path(relative):
+    root = os.path.abspath(settings.STATIC_PETITIONS_ROOT)
+    path = os.path.abspath(os.path.join(root, relative.strip('/')))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("{} is outside of STATIC_PETITIONS_ROOT".format(relative))
+    return path
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    # Replaced at once, not to serve a partially written page
+    os.replace(tmp_path, path)
+
+
+def _manifest_path(petition_id):
+    return os.path.join(_path(MANIFEST_DIR), '{}.json'.format(petition_id))
+
+
+def _read_manifest(petition_id):
+    try:
+        with open(_manifest_path(petition_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _remove(paths):
+    for relative in paths:
+        directory = _path(relative)
+        for name in ('index.html', 'index.json'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+        try:
+            os.removedirs(directory)
+        except OSError:
+            # Not empty
+            pass
+
+
+def publish(petition):
+    """Write the pages and counters of a visible petition"""
+    paths = petition_paths(petition)
+    html = render_page(petition)
+    counter = json.dumps(petition.to_json)
+    for relative in paths:
+        directory = _path(relative)
+        _write(os.path.join(directory, 'index.html'), html)
+        _write(os.path.join(directory, 'index.json'), counter)
+    _remove(set(_read_manifest(petition.id)) - set(paths))
+    _write(_manifest_path(petition.id), json.dumps(paths))
+
+
+def unpublish(petition_id):
+    """Remove the pages and counters of a petition"""
+    _remove(_read_manifest(petition_id))
+    try:
+        os.remove(_manifest_path(petition_id))
+    except FileNotFoundError:
+        pass
+
+
+def update(petition_id):
+    from .models import Petition
+    petition = Petition.all_objects.select_related('user__user', 'org').filter(pk=petition_id).first()
+    try:
+        if petition is not None and is_visible(petition):
+            publish(petition)
+        else:
+            unpublish(petition_id)
+    except Exception:
+        logger.exception("Cannot update the static page of petition %d", petition_id)
+
+
+def schedule(petition_id):
+    """Update the pages of this petition in the background, once the transaction is committed"""
+    from .helpers import run_in_background
+    if not is_enabled():
+        return
+    transaction.on_commit(lambda: run_in_background(update, petition_id))
+
+
+def published_ids():
+    """The ids of the petitions having static pages"""
+    try:
+        names = os.listdir(_path(MANIFEST_DIR))
+    except FileNotFoundError:
+        return set()
+    return {int(name[:-len('.json')]) for name in names if name.endswith('.json')}
@@ -0,0 +1,63 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Applications which must always be read from the primary database
+# Sessions need read-your-writes consistency
+PRIMARY_ONLY_APPS = ['sessions']
+
+_state = threading.local()
+
+
+def replica_reads_enabled():
+    return getattr(_state, 'use_replica', False)
+
+
+def enable_replica_reads(enabled=True):
+    _state.use_replica = enabled
+
+
+# Route the reads done in this thread to the replicas
+@contextmanager
+def read_from_replica(enabled=True):
+    previous = replica_reads_enabled()
+    enable_replica_reads(enabled)
+    try:
+        yield
+    finally:
+        enable_replica_reads(previous)
+
+
+class ReplicaRouter:
+    """
+    Send reads to one of the settings.DATABASE_REPLICAS when they are allowed
+    for the current request (see read_from_replica()), everything else goes
+    to the primary database.
+    Without replicas configured this router does not take any decision.
+    """
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return None
+        if replica_reads_enabled() and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not settings.DATABASE_REPLICAS:
+            return None
+        # Objects read from a replica must still be written to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set(settings.DATABASE_REPLICAS) | {DEFAULT_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,164 @@
+"""
+Write-behind signature buffer
+
+When settings.SIGNATURE_BUFFER is set, create_signature validates the form then
+only appends the signature to this SQLite file, which is committed to disk
+(WAL journal, full synchronous mode) before the signer gets an answer, and is
+shared by all the processes of the host. ``manage.py flush_signatures`` moves
+the buffered signatures to the database by batches: the signatures already
+confirmed, already pending or signed again in the same batch are not written,
+the other ones are written with a single bulk insert along with their hourly
+statistics, then they are removed from the buffer and their confirmation
+emails are sent. Their date is the time they are written to the database.
+
+A signature leaves the buffer only once it is in the database, and is
+recognized as pending when a crashed flush is replayed: no accepted signature
+is lost nor written twice. The buffered signatures count towards the
+settings.SIGNATURE_THROTTLE of their IP address. As for direct signing, a single confirmation email
+is sent per email address and petition every settings.SIGNATURE_EMAIL_WINDOW
+seconds. An email which cannot be sent is logged and does not hold the batch
+back, the signer can sign again to get it.
+"""
+import fcntl
+import json
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('petition_id', 'first_name', 'last_name', 'phone', 'email', 'subscribed_to_mailinglist',
+          'confirmation_hash', 'ipaddress')
+
+_local = threading.local()
+
+
+def is_enabled():
+    return bool(settings.SIGNATURE_BUFFER)
+
+
+def buffer_connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None or getattr(_local, 'path', None) != settings.SIGNATURE_BUFFER:
+        connection = sqlite3.connect(settings.SIGNATURE_BUFFER, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.execute('CREATE TABLE IF NOT EXISTS signature (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT)')
+        _local.connection, _local.path = connection, settings.SIGNATURE_BUFFER
+    return connection
+
+
+def append(signature, url):
+    """Buffer this unsaved signature, whose confirmation link is url"""
+    entry = {field: getattr(signature, field) for field in FIELDS}
+    entry['url'] = url
+    buffer_connection().execute('INSERT INTO signature (data) VALUES (?)', (json.dumps(entry),))
+
+
+def count(petition_id, ipaddress):
+    """Number of buffered signatures of this petition from this (hashed) IP address"""
+    return buffer_connection().execute(
+        "SELECT COUNT(*) FROM signature WHERE json_extract(data, '$.petition_id') = ? "
+        "AND json_extract(data, '$.ipaddress') = ?", (petition_id, ipaddress)).fetchone()[0]
+
+
+def pending():
+    return buffer_connection().execute('SELECT COUNT(*) FROM signature').fetchone()[0]
+
+
+@contextmanager
+def flush_lock():
+    # A single flush at a time, the buffer being shared by the processes of the host
+    with open(settings.SIGNATURE_BUFFER + '.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def flush(batch_size=1000):
+    """Move the oldest batch_size buffered signatures to the database, return how many were read"""
+    with flush_lock() as locked:
+        if not locked:
+            return 0
+        rows = buffer_connection().execute('SELECT id, data FROM signature ORDER BY id LIMIT ?',
+                                           (batch_size,)).fetchall()
+        if rows:
+            signatures, new = write([json.loads(data) for id, data in rows])
+            buffer_connection().execute('DELETE FROM signature WHERE id <= ?', (rows[-1][0],))
+            notify(signatures, new)
+        return len(rows)
+
+
+def write(entries):
+    """
+    Write the signatures of these buffer entries to the database, return the signatures to
+    confirm along with their confirmation links, and those which were not written yet
+    """
+    from .helpers import bulk_create
+    from .models import Petition, Signature, SignatureStat
+    # The first signature of an email wins, as when signing directly
+    first = {}
+    for entry in entries:
+        first.setdefault((entry['petition_id'], entry['email']), entry)
+    petitions = Petition.objects.in_bulk({petition_id for petition_id, email in first})
+    written = Signature.objects.filter(petition_id__in=petitions, email__in={email for _, email in first})
+    signed = set(written.filter(confirmed=True).values_list('petition_id', 'email'))
+    pending = {(signature.petition_id, signature.email): signature for signature in written.filter(confirmed=False)}
+    signatures, new = [], []
+    for key, entry in first.items():
+        if entry['petition_id'] not in petitions or key in signed:
+            continue
+        if key in pending:
+            # Written by a previous flush, or replayed: its data and confirmation link are kept
+            signature = pending[key]
+            url = entry['url'][:-len(entry['confirmation_hash'])] + signature.confirmation_hash
+        else:
+            signature = Signature(**{field: entry[field] for field in FIELDS})
+            url = entry['url']
+            new.append(signature)
+        signature.petition = petitions[entry['petition_id']]
+        signatures.append((signature, url))
+    stats = Counter()
+    for signature in new:
+        stats[signature.petition_id, 'new'] += 1
+        stats[signature.petition_id, 'subscribed'] += signature.subscribed_to_mailinglist
+    now = timezone.now()
+    with transaction.atomic():
+        bulk_create(Signature, new)
+        for petition_id in {signature.petition_id for signature in new}:
+            SignatureStat.increment(petition_id, now, new=stats[petition_id, 'new'],
+                                    subscribed=stats[petition_id, 'subscribed'])
+    logger.info("%d buffered signatures written, %d already written, %d dropped", len(new),
+                len(signatures) - len(new), len(entries) - len(signatures))
+    return signatures, new
+
+
+def notify(signatures, new):
+    """Send the confirmation emails of the written signatures and subscribe the new ones to the newsletters"""
+    from .helpers import confirmation_email, confirmation_email_is_due, confirmation_email_key, run_in_background, \
+        send_email_message, subscribe_to_newsletter
+    for signature, url in signatures:
+        if not confirmation_email_is_due(signature):
+            continue
+        try:
+            send_email_message(confirmation_email(signature, url))
+        except Exception:
+            logger.exception("Cannot send a confirmation email for petition %d", signature.petition_id)
+            # Not to hold back the email of the next signature of this address
+            cache.delete(confirmation_email_key(signature))
+    for signature in new:
+        if signature.petition.has_newsletter and signature.subscribed_to_mailinglist:
+            run_in_background(subscribe_to_newsletter, signature.petition, signature.email)
@@ -0,0 +1,138 @@
+"""
+Sitemaps and Atom feeds
+
+The published petitions are listed in sitemaps of settings.SITEMAP_SHARD_SIZE
+petition ids each, themselves listed in /sitemap.xml, and the latest published
+ones in the Atom feeds of the instance and of each organization. Crawlers thus
+find the petitions without going through the paginated lists.
+
+Each sitemap and feed is cached, for settings.SITEMAP_CACHE_TIMEOUT seconds at
+most, under a version key. When a petition is published, unpublished, moderated
+or changed, the versions of its sitemap, of the index and of the feeds it appears
+in are dropped, so only these are generated again on the next request. With a
+cache shared by the processes (see Django's CACHES setting), all of them see the
+new versions at once.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import F, Max
+from django.db.models.functions import Floor
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.translation import ugettext as _
+
+# Changes of these petition fields are visible in the sitemaps or the feeds
+FEED_FIELDS = {'title', 'twitter_description', 'published', 'moderated', 'deleted', 'user', 'org',
+               'canonical_url', 'publication_date'}
+
+
+def visible_petitions():
+    from .helpers import remove_user_moderated
+    from .models import Petition
+    return remove_user_moderated(Petition.objects.filter(published=True))
+
+
+def shard_of(petition_id):
+    return petition_id // settings.SITEMAP_SHARD_SIZE
+
+
+def _version(name):
+    key = 'crawl:version:' + name
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(key, version, None)
+    return version
+
+
+def invalidate(*names):
+    cache.delete_many(['crawl:version:' + name for name in names])
+
+
+def invalidate_all():
+    invalidate('all')
+
+
+def invalidate_petition(petition, update_fields=None):
+    """Drop the cached sitemap and feeds showing this petition"""
+    names = ['index', 'sitemap:{}'.format(shard_of(petition.id))]
+    if update_fields is None or FEED_FIELDS & set(update_fields):
+        names.append('feed')
+        if update_fields is not None and {'user', 'org'} & set(update_fields):
+            # The previous organization is not known anymore
+            names.append('feed:org')
+        elif petition.org_id is not None:
+            names.append('feed:org:{}'.format(petition.org_id))
+    invalidate(*names)
+
+
+def cached_response(request, names, build, content_type):
+    """The response built by build() if none is cached for these version names"""
+    versions = '-'.join(_version(name) for name in ('all',) + names)
+    key = 'crawl:{}:{}:{}:{}'.format(request.scheme, request.get_host(), '-'.join(names), versions)
+    content = cache.get(key)
+    if content is None:
+        content = build()
+        cache.set(key, content, settings.SITEMAP_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type=content_type)
+
+
+def render_sitemap_index(request):
+    shards = visible_petitions().annotate(shard=Floor(F('id') / settings.SITEMAP_SHARD_SIZE))\
+        .values('shard').annotate(lastmod=Max('last_modification_date')).order_by('shard')
+    sitemaps = [{'location': request.build_absolute_uri(reverse('sitemap', args=[int(shard['shard'])])),
+                 'lastmod': shard['lastmod']} for shard in shards]
+    return render_to_string('petition/sitemap_index.xml', {'sitemaps': sitemaps})
+
+
+def render_sitemap(request, shard):
+    size = settings.SITEMAP_SHARD_SIZE
+    petitions = visible_petitions().filter(id__gte=shard * size, id__lt=(shard + 1) * size)\
+        .order_by('id').values_list('id', 'canonical_url', 'last_modification_date')
+    urls = [{'location': request.build_absolute_uri(url or reverse('detail', args=[id])),
+             'lastmod': lastmod} for id, url, lastmod in petitions]
+    return render_to_string('petition/sitemap.xml', {'urls': urls})
+
+
+class PetitionFeed(Feed):
+    """The latest published petitions of the instance, or of an organization"""
+    feed_type = Atom1Feed
+
+    def get_object(self, request, orgslugname=None):
+        from .models import Organization
+        if orgslugname is None:
+            return None
+        return Organization.objects.get(slugname=orgslugname)
+
+    def title(self, org):
+        if org is None:
+            return _("Latest petitions of {}").format(settings.SITE_NAME)
+        return _("Latest petitions of {}").format(org.name)
+
+    def link(self, org):
+        return reverse('org_profile', args=[org.slugname]) if org else reverse('index')
+
+    def items(self, org):
+        petitions = visible_petitions()
+        if org is not None:
+            petitions = petitions.filter(org=org)
+        return petitions.only('id', 'title', 'twitter_description', 'publication_date', 'canonical_url', 'user', 'org')\
+            .order_by('-publication_date')[:settings.FEED_SIZE]
+
+    def item_title(self, petition):
+        return petition.title
+
+    def item_description(self, petition):
+        return petition.twitter_description
+
+    def item_link(self, petition):
+        return petition.url
+
+    def item_pubdate(self, petition):
+        return petition.publication_date
+
@@ -0,0 +1,109 @@
+"""
+Slow SQL queries log
+
+Queries longer than settings.SLOW_QUERY_THRESHOLD_MS are written as JSON lines
+to the rotating settings.SLOW_QUERY_LOG file, with the view, the petition or
+organization being served and the Pytition call site. See SlowQueryMiddleware
+and the slow_queries management command.
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import traceback
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.utils import timezone
+
+STACK_DEPTH = 8
+IGNORED_FILES = (__file__, os.path.join(os.path.dirname(__file__), 'middleware.py'))
+
+_logger = None
+_logger_lock = threading.Lock()
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+LIST_RE = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+SPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize a SQL query so that queries differing only by their values are the same"""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def get_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            _logger = logging.getLogger(__name__)
+            _logger.propagate = False
+            _logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(settings.SLOW_QUERY_LOG, maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                                          backupCount=settings.SLOW_QUERY_LOG_BACKUP_COUNT)
+            _logger.addHandler(handler)
+    return _logger
+
+
+def reset_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is not None:
+            for handler in list(_logger.handlers):
+                _logger.removeHandler(handler)
+                handler.close()
+        _logger = None
+
+
+def call_site():
+    # The innermost frames of Pytition code, leaving Django and this module out
+    frames = []
+    for frame in traceback.extract_stack()[:-2]:
+        if not frame.filename.startswith(settings.BASE_DIR) or 'site-packages' in frame.filename:
+            continue
+        if frame.filename in IGNORED_FILES:
+            continue
+        frames.append("{}:{} in {}".format(os.path.relpath(frame.filename, settings.BASE_DIR), frame.lineno,
+                                           frame.name))
+    return frames[-STACK_DEPTH:]
+
+
+def record(sql, duration, request=None):
+    entry = {
+        'date': timezone.now().isoformat(),
+        'duration_ms': round(duration * 1000, 3),
+        'sql': sql,
+        'fingerprint': fingerprint(sql),
+        'stack': call_site(),
+    }
+    if request is not None:
+        match = request.resolver_match
+        entry.update({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'petition_id': match.kwargs.get('petition_id') if match else None,
+            'org': match.kwargs.get('orgslugname') if match else None,
+        })
+    get_logger().info(json.dumps(entry))
+
+
+def read_log(path):
+    """Yield the entries of the log and of its rotated files, oldest first"""
+    backups = [name for name in glob.glob(path + '.*') if name.rsplit('.', 1)[1].isdigit()]
+    backups.sort(key=lambda name: int(name.rsplit('.', 1)[1]), reverse=True)
+    for filename in backups + [path]:
+        if not os.path.exists(filename):
+            continue
+        with open(filename) as log:
+            for line in log:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
@@ -0,0 +1,74 @@
+"""
+Petition slugs
+
+Petitions are shown at /org/<orgslugname>/<slug> and /user/<username>/<slug>.
+The slugs are unique per owner, which is stored along with them (see SlugModel),
+so resolve_slug() finds the petition of such a URL in a single indexed query.
+Its answers are kept in an in-process LRU cache of settings.SLUG_CACHE_SIZE
+entries, cleared when a slug is added, moved or deleted, or an owner renamed.
+The entries expire after settings.SLUG_CACHE_TIMEOUT seconds, so that the
+changes made by the other processes are seen too.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class LRUCache:
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not settings.SLUG_CACHE_SIZE:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + settings.SLUG_CACHE_TIMEOUT)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.SLUG_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = LRUCache()
+
+
+def resolve_slug(slug, orgslugname=None, username=None):
+    """The id of the petition of this organization or user at this slug, None if there is none"""
+    key = (orgslugname, username, slug)
+    petition_id = _cache.get(key)
+    if petition_id is None:
+        from .models import SlugModel
+        if orgslugname:
+            slugs = SlugModel.objects.filter(slug=slug, org__slugname=orgslugname)
+        else:
+            slugs = SlugModel.objects.filter(slug=slug, user__user__username=username)
+        petition_id = slugs.values_list('petition_id', flat=True).first()
+        # Unknown slugs are not cached, they may be added by another process
+        if petition_id is not None:
+            _cache.set(key, petition_id)
+    return petition_id
+
+
+def clear_slug_cache():
+    _cache.clear()
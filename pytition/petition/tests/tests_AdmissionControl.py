@@ -0,0 +1,118 @@
+import tempfile
+import threading
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import include, path, resolve, reverse
+
+from petition import metrics
+from petition.middleware import AdmissionControlMiddleware
+from petition.models import Petition, Signature
+from .utils import add_default_data
+
+
+@override_settings(ADMISSION_CONTROL_CONCURRENCY=1, ADMISSION_CONTROL_QUEUE_TIMEOUT=0,
+                   ADMISSION_CONTROL_RETRY_AFTER=7)
+class AdmissionControlTest(TestCase):
+    """Test the admission control of the public write views"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        metrics.admission_shed_total.clear()
+        self.lock_dir = tempfile.TemporaryDirectory()
+        self.override = override_settings(ADMISSION_CONTROL_LOCK_DIR=self.lock_dir.name)
+        self.override.enable()
+        self.addCleanup(self.lock_dir.cleanup)
+        self.addCleanup(self.override.disable)
+        self.petition = Petition.objects.filter(published=True).first()
+        self.middleware = AdmissionControlMiddleware(lambda request: HttpResponse())
+
+    def request(self, path, user=None):
+        request = RequestFactory().post(path)
+        request.resolver_match = resolve(path)
+        request.user = user or AnonymousUser()
+        return request
+
+    def process_view(self, request):
+        match = request.resolver_match
+        return self.middleware.process_view(request, match.func, match.args, match.kwargs)
+
+    def test_shed_when_busy(self):
+        sign = reverse('create_signature', args=[self.petition.id])
+        first = self.request(sign)
+        self.assertIsNone(self.process_view(first))
+        response = self.process_view(self.request(sign))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertContains(response, "Please retry", status_code=503)
+        self.assertEqual(metrics.admission_shed_total.get(view='create_signature'), 1)
+        # Authenticated users and the other views are not limited
+        julia = User.objects.get(username='julia')
+        self.assertIsNone(self.process_view(self.request(sign, julia)))
+        self.assertIsNone(self.process_view(self.request(reverse('detail', args=[self.petition.id]))))
+        # The slot is given back once the request is processed
+        self.middleware.slots.release(first._admission_slot)
+        self.assertIsNone(self.process_view(self.request(sign)))
+
+    def test_release_after_response(self):
+        sign = reverse('create_signature', args=[self.petition.id])
+        middleware = AdmissionControlMiddleware(lambda request: self.process_view(request) or HttpResponse())
+        self.middleware = middleware
+        for i in range(3):
+            self.assertEqual(middleware(self.request(sign)).status_code, 200)
+
+    def test_signing(self):
+        data = {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}
+        response = self.client.post(reverse('create_signature', args=[self.petition.id]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Signature.objects.filter(email='alan@john.org').exists())
+
+
+slow_view_entered = threading.Event()
+slow_view_release = threading.Event()
+
+
+def slow_view(request):
+    slow_view_entered.set()
+    slow_view_release.wait(5)
+    return HttpResponse("done")
+
+
+urlpatterns = [
+    path('slow', slow_view, name='slow'),
+    path('', include('pytition.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, ADMISSION_CONTROL_CONCURRENCY=1, ADMISSION_CONTROL_VIEWS=['slow'],
+                   ADMISSION_CONTROL_QUEUE_TIMEOUT=0.1, ADMISSION_CONTROL_RETRY_AFTER=7)
+class ConcurrentAdmissionControlTest(SimpleTestCase):
+    """Test the admission control through the middleware stacks of several workers"""
+    def setUp(self):
+        slow_view_entered.clear()
+        slow_view_release.clear()
+        self.lock_dir = tempfile.TemporaryDirectory()
+        self.override = override_settings(ADMISSION_CONTROL_LOCK_DIR=self.lock_dir.name)
+        self.override.enable()
+        self.addCleanup(self.lock_dir.cleanup)
+        self.addCleanup(self.override.disable)
+
+    def test_limit_is_shared_by_workers(self):
+        # Each client has its own middleware stack, as a uwsgi process
+        responses = []
+        worker = threading.Thread(target=lambda: responses.append(Client().get('/slow')))
+        worker.start()
+        try:
+            self.assertTrue(slow_view_entered.wait(5))
+            response = Client().get('/slow')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '7')
+        finally:
+            slow_view_release.set()
+            worker.join()
+        self.assertEqual(responses[0].status_code, 200)
+        # The slot was released with the response
+        self.assertEqual(Client().get('/slow').status_code, 200)
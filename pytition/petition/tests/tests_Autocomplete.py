@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition import autocomplete
+from petition.models import Organization
+from .utils import add_default_data
+
+
+class AutocompleteTest(TestCase):
+    """Test the user and organization autocomplete"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.invalidate()
+
+    def test_prefix_ranking(self):
+        User = get_user_model()
+        User.objects.create_user('jules', password='jules', first_name='Julien', last_name='Verne')
+        User.objects.create_user('verne', password='verne', first_name='Jules')
+        User.objects.create_user('ajulia', password='ajulia')
+        usernames = [user['username'] for user in autocomplete.search('users', 'jul')]
+        self.assertEqual(usernames, ['jules', 'julia', 'verne'])
+        usernames = [user['username'] for user in autocomplete.search('users', 'JULES')]
+        self.assertEqual(usernames, ['jules', 'verne'])
+        self.assertEqual(autocomplete.search('users', 'jul', limit=1)[0],
+                         {'username': 'jules', 'first_name': 'Julien', 'last_name': 'Verne'})
+        self.assertEqual(autocomplete.search('users', ' '), [])
+
+    def test_orgs(self):
+        orgs = autocomplete.search('orgs', 'terre')
+        self.assertEqual(orgs, [{'slugname': 'les-amis-de-la-terre', 'name': 'Les Amis de la Terre'}])
+        # Names first, then the other words of the names
+        self.assertEqual([org['name'] for org in autocomplete.search('orgs', 'a')],
+                         ['Alternatiba', 'Attac', 'Les Amis de la Terre'])
+
+    @override_settings(AUTOCOMPLETE_LIMIT=2)
+    def test_limit_and_index_invalidation(self):
+        User = get_user_model()
+        for i in range(5):
+            User.objects.create_user('many{}'.format(i), password='many')
+        self.assertEqual(len(autocomplete.search('users', 'many')), 2)
+        Organization.objects.create(name='Newly created')
+        cache.clear()
+        self.assertEqual(autocomplete.search('orgs', 'newly')[0]['name'], 'Newly created')
+        with self.assertNumQueries(0):
+            autocomplete.search('orgs', 'newly')
+
+    def test_views(self):
+        self.client.login(username='julia', password='julia')
+        response = self.client.get(reverse('search_users_and_orgs') + '?q=ja')
+        self.assertEqual(response.json(), {'orgs': [], 'users': []})
+        response = self.client.get(reverse('search_users_and_orgs') + '?q=rap')
+        self.assertEqual(response.json()['orgs'], [{'slugname': 'rap', 'name': 'RAP'}])
+        response = self.client.get(reverse('get_user_list') + '?q=ma')
+        self.assertEqual(response.json()['values'], ['max'])
@@ -0,0 +1,19 @@
+from django.test import TestCase
+
+from petition.benchmarks import BENCHMARKS, compare, load_baseline, run_benchmarks
+
+
+class BenchmarksTest(TestCase):
+    """Check the query budgets of the view benchmarks, see ./manage.py bench_views"""
+    def test_query_budgets(self):
+        results = run_benchmarks(repeat=1)
+        self.assertEqual(set(results), set(BENCHMARKS))
+        self.assertEqual(compare(results, load_baseline(), only_queries=True), [])
+
+    def test_compare(self):
+        baseline = {'detail': {'queries': 5, 'time_ms': 10, 'memory_kb': 100}}
+        results = {'detail': {'queries': 6, 'time_ms': 14, 'memory_kb': 200}}
+        self.assertEqual(compare(results, baseline), ["detail: 6 queries, budget is 5",
+                                                      "detail: 200 kB, budget is 150.0 kB"])
+        self.assertEqual(compare(results, baseline, only_queries=True), ["detail: 6 queries, budget is 5"])
+        self.assertEqual(compare({'index': results['detail']}, baseline), ["index: no baseline"])
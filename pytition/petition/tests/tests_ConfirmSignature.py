@@ -0,0 +1,102 @@
+import threading
+import uuid
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from petition.models import Petition, Signature, SignatureStat
+from .utils import add_default_data
+
+THREADS = 8
+
+
+class ConfirmSignatureTest(TestCase):
+    """Test the outcomes of Petition.confirm_signature"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def sign(self, petition, email):
+        return Signature.objects.create(petition=petition, first_name='Alan', last_name='John', email=email,
+                                        confirmation_hash=str(uuid.uuid4()))
+
+    def test_outcomes(self):
+        petition = Petition.objects.filter(published=True).first()
+        signature = self.sign(petition, 'alan@john.org')
+        self.assertEqual(petition.confirm_signature('unknown'), Signature.INVALID)
+        self.assertEqual(petition.confirm_signature(signature.confirmation_hash), Signature.CONFIRMED)
+        self.assertEqual(petition.confirm_signature(signature.confirmation_hash), Signature.ALREADY_CONFIRMED)
+        other = Petition.objects.filter(published=True).exclude(pk=petition.pk).first()
+        self.assertEqual(other.confirm_signature(signature.confirmation_hash), Signature.INVALID)
+
+    def test_already_signed(self):
+        petition = Petition.objects.filter(published=True).first()
+        first = self.sign(petition, 'alan@john.org')
+        second = self.sign(petition, 'other@john.org')
+        # Signed again while the first signature was being confirmed
+        Signature.objects.filter(pk=first.pk).update(confirmed=True)
+        Signature.objects.filter(pk=second.pk).update(email='alan@john.org')
+        self.assertEqual(petition.confirm_signature(second.confirmation_hash), Signature.ALREADY_SIGNED)
+        self.assertFalse(Signature.objects.get(pk=second.pk).confirmed)
+
+    def test_confirmation_race(self):
+        petition = Petition.objects.filter(published=True).first()
+        signature = self.sign(petition, 'alan@john.org')
+        raced, outcomes = [], []
+
+        def confirm_concurrently(execute, sql, params, many, context):
+            # Another request confirms the signature between the read and the UPDATE of this one
+            if sql.startswith('UPDATE') and not raced:
+                raced.append(sql)
+                outcomes.append(petition.confirm_signature(signature.confirmation_hash))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(confirm_concurrently):
+            outcomes.append(petition.confirm_signature(signature.confirmation_hash))
+        self.assertEqual(outcomes, [Signature.CONFIRMED, Signature.ALREADY_CONFIRMED])
+        self.assertEqual(SignatureStat.objects.get(petition=petition).confirmed, 1)
+
+    def test_queries(self):
+        petition = Petition.objects.filter(published=True).first()
+        signature = self.sign(petition, 'alan@john.org')
+        # Read, savepoint, update, release of the savepoint and statistics
+        with self.assertNumQueries(5):
+            petition.confirm_signature(signature.confirmation_hash)
+
+
+class ConcurrentConfirmationTest(TransactionTestCase):
+    """Confirm signatures from many threads at once"""
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("The connections to an in-memory SQLite database fail instead of waiting for locks")
+        add_default_data()
+        self.petition = Petition.objects.filter(published=True).first()
+
+    def hammer(self, hashes):
+        barrier = threading.Barrier(len(hashes))
+        outcomes = []
+
+        def confirm(conf_hash):
+            try:
+                barrier.wait()
+                outcomes.append(self.petition.confirm_signature(conf_hash))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm, args=[conf_hash]) for conf_hash in hashes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(outcomes)
+
+    def sign(self, email):
+        return Signature.objects.create(petition=self.petition, first_name='Alan', last_name='John', email=email,
+                                        confirmation_hash=str(uuid.uuid4())).confirmation_hash
+
+    def test_same_hash(self):
+        conf_hash = self.sign('alan@john.org')
+        outcomes = self.hammer([conf_hash] * THREADS)
+        self.assertEqual(outcomes, [Signature.ALREADY_CONFIRMED] * (THREADS - 1) + [Signature.CONFIRMED])
+        self.assertTrue(Signature.objects.get(confirmation_hash=conf_hash).confirmed)
+        self.assertEqual(SignatureStat.objects.get(petition=self.petition).confirmed, 1)
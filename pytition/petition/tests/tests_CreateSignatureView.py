@@ -1,9 +1,19 @@
-from django.test import TestCase
+import threading
+from unittest import mock
+
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.core import mail
+from django.core.cache import cache
 
 from .utils import add_default_data
 
+from petition.forms import SignatureForm
 from petition.models import Petition, Signature
+from petition.helpers import shutdown_background_executor
+
+THREADS = 8
 
 
 class CreateSignatureViewTest(TestCase):
@@ -13,6 +23,9 @@ class CreateSignatureViewTest(TestCase):
     def setUpTestData(cls):
         add_default_data()
 
+    def setUp(self):
+        cache.clear()
+
     def test_CreateSignaturePOSTOk(self):
         data = {
             'first_name': 'Alan',
@@ -34,3 +47,130 @@ class CreateSignatureViewTest(TestCase):
         petition = Petition.objects.filter(published=True).first()
         response = self.client.get(reverse('create_signature', args=[petition.id]), follow=True)
         self.assertRedirects(response, petition.url)
+
+    def test_CreateSignatureSendsConfirmationEmail(self):
+        data = {
+            'first_name': 'Alan',
+            'last_name': 'John',
+            'email': 'alan@john.org',
+        }
+        petition = Petition.objects.filter(published=True).first()
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['alan@john.org'])
+        signature = Signature.objects.get(petition=petition)
+        self.assertIn(signature.confirmation_hash, mail.outbox[0].body)
+
+    @override_settings(BACKGROUND_IO_WORKERS=2)
+    def test_CreateSignatureBackgroundIO(self):
+        data = {
+            'first_name': 'Alan',
+            'last_name': 'John',
+            'email': 'alan@john.org',
+            'subscribed_to_mailinglist': True,
+        }
+        petition = Petition.objects.filter(published=True).first()
+        petition.has_newsletter = True
+        petition.newsletter_subscribe_method = "POST"
+        petition.newsletter_subscribe_http_url = "http://newsletter.example.org/subscribe"
+        petition.newsletter_subscribe_http_mailfield = "email"
+        petition.save()
+        with mock.patch('petition.helpers.requests.post') as post:
+            response = self.client.post(reverse('create_signature', args=[petition.id]), data)
+            self.assertEqual(response.status_code, 302)
+            shutdown_background_executor()
+        post.assert_called_once_with("http://newsletter.example.org/subscribe", {'email': 'alan@john.org'})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['alan@john.org'])
+
+    def test_CreateSignatureIsIdempotent(self):
+        data = {
+            'first_name': 'Alan',
+            'last_name': 'John',
+            'email': 'Alan@John.org',
+        }
+        petition = Petition.objects.filter(published=True).first()
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        # Sent again by someone else, the pending signature is left as its owner will confirm it
+        data['email'] = 'alan@john.org'
+        data['first_name'] = 'Mallory'
+        data['phone'] = '0123456789'
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        signature = Signature.objects.get(petition=petition)
+        self.assertEqual(signature.email, 'alan@john.org')
+        self.assertEqual(signature.first_name, 'Alan')
+        self.assertEqual(signature.phone, '')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(signature.confirmation_hash, mail.outbox[0].body)
+
+        # Once the window is over, the same confirmation link is sent again
+        cache.clear()
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        self.assertEqual(Signature.objects.filter(petition=petition).count(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn(signature.confirmation_hash, mail.outbox[1].body)
+        self.client.get(reverse('confirm', args=[petition.id, signature.confirmation_hash]))
+        self.assertTrue(Signature.objects.get(petition=petition).confirmed)
+
+    def test_CreateSignatureEmailAlreadySent(self):
+        data = {
+            'first_name': 'Alan',
+            'last_name': 'John',
+            'email': 'alan@john.org',
+        }
+        petition = Petition.objects.filter(published=True).first()
+        response = self.client.post(reverse('create_signature', args=[petition.id]), data, follow=True)
+        self.assertContains(response, 'an email has just been sent to you')
+        # Signed again within the window, no new email is sent
+        response = self.client.post(reverse('create_signature', args=[petition.id]), data, follow=True)
+        self.assertContains(response, 'an email has already been sent to you lately')
+        self.assertNotContains(response, 'an email has just been sent to you')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_CreateSignatureRace(self):
+        data = {
+            'first_name': 'Alan',
+            'last_name': 'John',
+            'email': 'alan@john.org',
+        }
+        petition = Petition.objects.filter(published=True).first()
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        signature = Signature.objects.get(petition=petition)
+        # Sent again before the first one was written: both found no pending signature
+        with mock.patch.object(SignatureForm, 'pending_signature', autospec=True,
+                               side_effect=[None, signature]) as pending:
+            response = self.client.post(reverse('create_signature', args=[petition.id]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(pending.call_count, 2)
+        self.assertEqual(list(Signature.objects.filter(petition=petition)), [signature])
+
+
+class ConcurrentSignatureTest(TransactionTestCase):
+    """Sign a petition from many threads at once"""
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("The connections to an in-memory SQLite database fail instead of waiting for locks")
+        add_default_data()
+        cache.clear()
+
+    def test_same_email(self):
+        petition = Petition.objects.filter(published=True).first()
+        data = {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}
+        barrier = threading.Barrier(THREADS)
+        statuses = []
+
+        def sign():
+            try:
+                barrier.wait()
+                statuses.append(Client().post(reverse('create_signature', args=[petition.id]), data).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sign) for i in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [302] * THREADS)
+        self.assertEqual(Signature.objects.filter(petition=petition, email='alan@john.org').count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,97 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from petition.models import Petition, PetitionTemplate, PytitionUser
+from .utils import add_default_data
+
+
+class DirtyFieldsTest(TestCase):
+    """Test the saves of the changed columns only"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def updates(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+
+    def test_only_dirty_columns_are_written(self):
+        petition = Petition.objects.filter(title="Petition A0").first()
+        self.assertEqual(petition.get_dirty_fields(), [])
+        with CaptureQueriesContext(connection) as ctx:
+            petition.save()
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        date = petition.last_modification_date
+        petition.publish()
+        with CaptureQueriesContext(connection) as ctx:
+            petition.unpublish()
+        updates = self.updates(ctx.captured_queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"published"', updates[0])
+        self.assertIn('"last_modification_date"', updates[0])
+        self.assertNotIn('"text"', updates[0])
+        self.assertNotIn('"title"', updates[0])
+        # Neither the slugs nor the media references are looked at
+        self.assertNotIn('petition_slugmodel', ' '.join(q['sql'] for q in ctx.captured_queries))
+        self.assertNotIn('petition_mediareference', ' '.join(q['sql'] for q in ctx.captured_queries))
+        petition.refresh_from_db()
+        self.assertFalse(petition.published)
+        self.assertGreater(petition.last_modification_date, date)
+
+    def test_deferred_fields(self):
+        petition = Petition.objects.summary().filter(title="Petition A0").first()
+        petition.text = "<p>New text</p>"
+        self.assertEqual(petition.get_dirty_fields(), ['text'])
+        petition.side_text
+        self.assertEqual(petition.get_dirty_fields(), ['text'])
+        petition.save()
+        self.assertEqual(Petition.objects.get(pk=petition.pk).text, "<p>New text</p>")
+
+    def test_title_change_slugifies(self):
+        petition = Petition.objects.filter(title="Petition A0").first()
+        petition.slugmodel_set.all().delete()
+        petition.moderate()
+        self.assertEqual(petition.slugmodel_set.count(), 0)
+        petition.title = "Renamed"
+        petition.save()
+        self.assertEqual(list(petition.slugmodel_set.values_list('slug', flat=True)), ['renamed'])
+
+    def test_edit_petition_one_write(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        petition = julia.petition_set.first()
+        self.client.login(username='julia', password='julia')
+        data = {
+            'email_form_submitted': 'yes',
+            'confirmation_email_reply': 'julia@example.org',
+            'style_form_submitted': 'yes',
+            'bgcolor': '33ccff',
+            'linear_gradient_direction': 'to right',
+            'gradient_from': '0000ff',
+            'gradient_to': 'ff0000',
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse("edit_petition", args=[petition.id]), data)
+        self.assertEqual(response.status_code, 200)
+        updates = [sql for sql in self.updates(ctx.captured_queries) if 'petition_petition' in sql]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"confirmation_email_reply"', updates[0])
+        self.assertIn('"bgcolor"', updates[0])
+        self.assertNotIn('"text"', updates[0])
+        petition.refresh_from_db()
+        self.assertEqual(petition.confirmation_email_reply, 'julia@example.org')
+        self.assertEqual(petition.bgcolor, '#33ccff')
+
+    def test_template(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        template = PetitionTemplate.objects.create(name="Default", user=julia)
+        template = PetitionTemplate.objects.get(pk=template.pk)
+        template.name = "Renamed"
+        with CaptureQueriesContext(connection) as ctx:
+            template.save()
+            template.save()
+        updates = self.updates(ctx.captured_queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"name"', updates[0])
+        self.assertNotIn('"text"', updates[0])
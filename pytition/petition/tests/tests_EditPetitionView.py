@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
@@ -7,13 +7,24 @@ from petition.models import Organization, Petition, PytitionUser, Permission
 from .utils import add_default_data
 
 import os
+import shutil
+import tempfile
 
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class EditPetitionViewTest(TestCase):
     """Test index view"""
     @classmethod
     def setUpTestData(cls):
         add_default_data()
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
     def login(self, name):
         self.client.login(username=name, password=name)
         self.pu = PytitionUser.objects.get(user__username=name)
@@ -0,0 +1,57 @@
+import random
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from petition.models import Moderation, Organization, Petition, PytitionUser, Signature, SignatureStat, SlugModel
+from petition.management.commands.gen_dataset import signature_counts
+
+
+class GenDatasetTest(TestCase):
+    """Test the synthetic dataset generator"""
+    def generate(self, prefix, **options):
+        call_command('gen_dataset', '--prefix', prefix, '--users', '5', '--orgs', '2', '--petitions', '20',
+                     '--signatures', '500', '--reported-ratio', '0.5', '--batch-size', '64',
+                     *['--{}={}'.format(key, value) for key, value in options.items()])
+        petitions = Petition.objects.filter(title__startswith=prefix + ' ').order_by('id')
+        return [petition.signature_set.count() for petition in petitions]
+
+    def test_gen_dataset(self):
+        counts = self.generate('bench')
+        self.assertEqual(PytitionUser.objects.filter(user__username__startswith='bench-user-').count(), 5)
+        self.assertEqual(Organization.objects.filter(name__startswith='bench org ').count(), 2)
+        self.assertEqual(len(counts), 20)
+        self.assertEqual(sum(counts), 500)
+        self.assertEqual(SlugModel.objects.filter(petition__title__startswith='bench ').count(), 20)
+        self.assertTrue(Moderation.objects.exists())
+        # Power law: the most signed petition gets far more than the median one
+        self.assertGreater(max(counts), 5 * sorted(counts)[10])
+        stats = SignatureStat.objects.filter(petition__title__startswith='bench ')
+        self.assertEqual(sum(stats.values_list('new', flat=True)), 500)
+        self.assertTrue(self.client.login(username='bench-user-0', password='pytition'))
+        petition = Petition.objects.filter(title__startswith='bench ', signature__isnull=False).first()
+        self.assertLess(petition.creation_date, Signature.objects.filter(petition=petition).earliest('date').date)
+        published = Petition.objects.filter(title__startswith='bench ', published=True)
+        self.assertTrue(published.exists())
+        self.assertFalse(published.filter(publication_date__isnull=True).exists())
+        self.assertFalse(Petition.objects.filter(title__startswith='bench ', published=False,
+                                                 publication_date__isnull=False).exists())
+        petition = published.filter(signature__isnull=False).first()
+        self.assertLessEqual(petition.publication_date, Signature.objects.filter(petition=petition).earliest('date').date)
+
+    def test_gen_dataset_failure(self):
+        with mock.patch('petition.management.commands.gen_dataset.flush', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.generate('failed')
+        self.assertTrue(Signature._meta.get_field('date').auto_now_add)
+
+    def test_gen_dataset_is_reproducible(self):
+        counts = self.generate('first', seed=3)
+        self.assertEqual(counts, self.generate('second', seed=3))
+        self.assertNotEqual(counts, self.generate('third', seed=4))
+
+    def test_signature_counts(self):
+        counts = signature_counts(1000, 10, 1.0, random.Random(0))
+        self.assertEqual(sum(counts), 1000)
+        self.assertEqual(max(counts), 342)
@@ -0,0 +1,141 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from petition.images import add_srcset, generate_variants, variant_name
+from petition.media import content_name
+from petition.models import Petition, PytitionUser
+from .utils import add_default_data
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg(width=1200, height=800, exif=True):
+    image = Image.new('RGB', (width, height), 'red')
+    data = io.BytesIO()
+    if exif:
+        metadata = Image.Exif()
+        metadata[0x010F] = "Camera maker"
+        image.save(data, 'JPEG', exif=metadata)
+    else:
+        image.save(data, 'JPEG')
+    return SimpleUploadedFile('photo.jpg', data.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageUploadTest(TestCase):
+    """Test the processing of the images uploaded from the editor"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'uploads'), ignore_errors=True)
+        self.client.login(username='julia', password='julia')
+
+    def test_upload(self):
+        upload = jpeg()
+        name = content_name(hashlib.sha256(upload.read()).hexdigest(), '.jpg')
+        stem = '/mediaroot/' + name[:-len('.jpg')]
+        upload.seek(0)
+        julia = PytitionUser.objects.get(user__username='julia')
+        text = '<p>Look</p><img src="/mediaroot/{}" width="600" />'.format(name)
+        petition = Petition.objects.create(title="Images", text=text, user=julia)
+        response = self.client.post(reverse('image_upload'), {'file': upload})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['location'], '/mediaroot/' + name)
+
+        with Image.open(os.path.join(MEDIA_ROOT, name)) as image:
+            self.assertEqual(len(image.getexif()), 0)
+        # Without background workers, the variants are left to the process_images command
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, '{}-480w.webp'.format(stem[len('/mediaroot/'):]))))
+        with mock.patch('petition.models.MediaReference.update_references') as update_references:
+            call_command('process_images')
+        # The petition is saved with its receivers
+        update_references.assert_called_once_with(petition)
+        for width in [480, 960, 1200]:
+            with Image.open(os.path.join(MEDIA_ROOT, '{}-{}w.webp'.format(stem[len('/mediaroot/'):], width))) as image:
+                self.assertEqual(image.size, (width, width * 2 // 3))
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, '{}-1920w.webp'.format(stem[len('/mediaroot/'):]))))
+
+        # The petition saved before the upload was processed now uses the variants
+        petition.refresh_from_db()
+        self.assertIn('srcset="{0}-480w.webp 480w, {0}-960w.webp 960w, {0}-1200w.webp 1200w"'.format(stem),
+                      petition.text)
+        self.assertIn('sizes="(max-width: 600px) 100vw, 600px" />', petition.text)
+        self.assertEqual(petition.text, add_srcset(petition.text))
+        response = self.client.get(reverse('detail', args=[petition.id]))
+        self.assertContains(response, 'srcset="{}-480w.webp 480w'.format(stem))
+
+    @override_settings(BACKGROUND_IO_WORKERS=1)
+    def test_upload_background_variants(self):
+        with mock.patch('petition.views.run_in_background') as run_in_background:
+            location = self.client.post(reverse('image_upload'), {'file': jpeg()}).json()['location']
+        name = location[len('/mediaroot/'):]
+        with Image.open(os.path.join(MEDIA_ROOT, name)) as image:
+            self.assertEqual(len(image.getexif()), 0)
+        func, *args = run_in_background.call_args[0]
+        self.assertIs(func, generate_variants)
+        self.assertEqual(len(func(*args)), 3)
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, variant_name(name, 480))))
+        self.assertEqual([path for path in os.listdir(os.path.dirname(os.path.join(MEDIA_ROOT, name)))
+                          if path.endswith('.tmp')], [])
+
+    def test_deduplication(self):
+        first = self.client.post(reverse('image_upload'), {'file': jpeg()}).json()['location']
+        self.client.login(username='max', password='max')
+        second = self.client.post(reverse('image_upload'), {'file': jpeg()}).json()['location']
+        self.assertEqual(first, second)
+        other = self.client.post(reverse('image_upload'), {'file': jpeg(width=800)}).json()['location']
+        self.assertNotEqual(first, other)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1000)
+    def test_too_large(self):
+        response = self.client.post(reverse('image_upload'), {'file': jpeg()})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, 'uploads')))
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_invalid(self):
+        response = self.client.post(reverse('image_upload'), {'file': jpeg()})
+        self.assertEqual(response.status_code, 400)
+        script = SimpleUploadedFile('photo.svg', b'<svg><script>alert(1)</script></svg>', content_type='image/svg+xml')
+        response = self.client.post(reverse('image_upload'), {'file': script})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, 'uploads')))
+
+    def test_add_srcset_without_variants(self):
+        html = '<img src="/mediaroot/julia/missing.jpg"><img src="https://example.org/photo.jpg">'
+        self.assertEqual(add_srcset(html), html)
+        self.assertEqual(add_srcset('<img src="/mediaroot/../../etc/passwd">'), '<img src="/mediaroot/../../etc/passwd">')
+
+    def test_process_images_command(self):
+        os.makedirs(os.path.join(MEDIA_ROOT, 'uploads'))
+        for name, width in [('uploads/small.jpg', 300), ('uploads/large.jpg', 1000)]:
+            with open(os.path.join(MEDIA_ROOT, name), 'wb') as image:
+                image.write(jpeg(width=width).read())
+        call_command('process_images')
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, 'uploads/small-300w.webp')))
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, 'uploads/large-480w.webp')))
+        # Images narrower than the smallest variant width are not processed again
+        with mock.patch('petition.management.commands.process_images.process_image') as process_image:
+            call_command('process_images')
+        process_image.assert_not_called()
+        with mock.patch('petition.management.commands.process_images.process_image') as process_image:
+            call_command('process_images', '--force')
+        self.assertEqual(process_image.call_count, 2)
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from petition.models import MediaReference, Petition, PetitionTemplate, PytitionUser
+from .utils import add_default_data
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_media(name, age=48 * 3600):
+    path = os.path.join(MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as media:
+        media.write(b'media')
+    os.utime(path, (time.time() - age, time.time() - age))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, ARCHIVE_ROOT=os.path.join(MEDIA_ROOT, 'archives'))
+class MediaReferenceTest(TestCase):
+    """Test the references to media and the orphan medias"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(MEDIA_ROOT)
+        os.makedirs(MEDIA_ROOT)
+        self.julia = PytitionUser.objects.get(user__username='julia')
+
+    def references(self, **kwargs):
+        return set(MediaReference.objects.filter(**kwargs).values_list('media', flat=True))
+
+    def test_references(self):
+        petition = Petition.objects.create(title="Media", user=self.julia,
+                                           text='<img src="/mediaroot/uploads/ab/ab12.jpg" />',
+                                           side_text='<a href="https://example.org/mediaroot/julia/a%20b.pdf">pdf</a>',
+                                           twitter_image='/mediaroot/uploads/cd/cd34.png')
+        self.assertEqual(self.references(petition=petition),
+                         {'uploads/ab/ab12.jpg', 'julia/a b.pdf', 'uploads/cd/cd34.png'})
+        petition.text = ''
+        petition.twitter_image = ''
+        petition.save()
+        self.assertEqual(self.references(petition=petition), {'julia/a b.pdf'})
+
+        template = PetitionTemplate.objects.create(name="Media", user=self.julia,
+                                                   footer_text='<img src="/mediaroot/uploads/ab/ab12.jpg">')
+        self.assertEqual(self.references(template=template), {'uploads/ab/ab12.jpg'})
+        template.delete()
+        self.assertEqual(self.references(media='uploads/ab/ab12.jpg'), set())
+
+    def test_orphans(self):
+        Petition.objects.create(title="Media", user=self.julia, text='<img src="/mediaroot/uploads/ab/used.jpg">')
+        for name in ['uploads/ab/used.jpg', 'uploads/ab/used-480w.webp', 'uploads/ab/orphan.jpg',
+                     'uploads/ab/orphan-480w.webp', 'uploads/ab/lost-480w.webp', 'archives/1-abc.csv.gz',
+                     '.gitignore', '.cache/ab.jpg', 'uploads/ab/processing.jpg.tmp']:
+            create_media(name)
+        create_media('uploads/ab/new.jpg', age=60)
+
+        out = StringIO()
+        call_command('medias_orphan', stdout=out)
+        self.assertEqual(out.getvalue().split(), ['uploads/ab/lost-480w.webp', 'uploads/ab/new.jpg',
+                                                  'uploads/ab/orphan-480w.webp', 'uploads/ab/orphan.jpg'])
+
+        call_command('medias_orphan', delete=True, batch_size=2)
+        self.assertEqual(sorted(os.listdir(os.path.join(MEDIA_ROOT, 'uploads', 'ab'))),
+                         ['new.jpg', 'processing.jpg.tmp', 'used-480w.webp', 'used.jpg'])
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, 'archives', '1-abc.csv.gz')))
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, '.gitignore')))
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, '.cache', 'ab.jpg')))
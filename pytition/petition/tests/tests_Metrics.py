@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition import metrics
+from petition.helpers import subscribe_to_newsletter
+from petition.models import Petition
+from .utils import add_default_data
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTest(TestCase):
+    """Test the Prometheus metrics"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        cache.clear()
+        for metric in metrics.REGISTRY:
+            metric.clear()
+
+    def test_request_metrics(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.client.get(reverse("detail", args=[petition.id]))
+        self.client.get(reverse("detail", args=[petition.id]))
+        self.client.get("/nowhere")
+        self.assertEqual(metrics.requests_total.get(view="detail", method="GET", status=200), 2)
+        self.assertEqual(metrics.requests_total.get(view="none", method="GET", status=404), 1)
+        self.assertEqual(metrics.request_duration.count(view="detail"), 2)
+        self.assertGreater(metrics.sql_queries_total.get(view="detail"), 0)
+        self.assertGreater(metrics.sql_duration_total.get(view="detail"), 0)
+
+    def test_mail_and_newsletter_metrics(self):
+        petition = Petition.objects.filter(published=True).first()
+        data = {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(metrics.mail_duration.count(), 1)
+        petition.newsletter_subscribe_method = Petition.POST
+        petition.newsletter_subscribe_http_url = "http://localhost/subscribe"
+        with mock.patch('petition.helpers.requests.post'):
+            subscribe_to_newsletter(petition, 'alan@john.org')
+        self.assertEqual(metrics.newsletter_duration.count(method="POST"), 1)
+
+    def test_metrics_view(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.client.get(reverse("detail", args=[petition.id]))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('pytition_requests_total{view="detail",method="GET",status="200"} 1', content)
+        self.assertIn('pytition_request_duration_seconds_bucket{view="detail",le="+Inf"} 1', content)
+        self.assertIn('# TYPE pytition_request_duration_seconds histogram', content)
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(response.status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=['192.0.2.0/24']):
+            response = self.client.get(reverse("metrics"), REMOTE_ADDR="192.0.2.1")
+            self.assertEqual(response.status_code, 200)
+        with self.settings(METRICS_ENABLED=False):
+            response = self.client.get(reverse("metrics"))
+            self.assertEqual(response.status_code, 404)
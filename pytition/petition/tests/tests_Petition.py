@@ -47,6 +47,8 @@ class PetitionTest(TestCase):
         # This should never happen but testing just in case
         s = SlugModel.objects.first()
         s.delete()
+        # The url is stored in the petition row
+        p.refresh_from_db()
         self.assertEqual(p.url, reverse('detail', args=[p.id]))
         # Create a slug
         #p.add_slug('foobar')
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.core.management import call_command
+from django.utils import timezone
+
+from petition.models import Petition, Signature
+from .utils import add_default_data
+
+
+class PetitionArchiveTest(TestCase):
+    """Test archiving the signatures of closed petitions"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.archive_root = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media_root.name, ARCHIVE_ROOT=self.archive_root.name)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        self.media_root.cleanup()
+        self.archive_root.cleanup()
+
+    def add_signatures(self, petition, number, confirmed=0):
+        Signature.objects.bulk_create([Signature(first_name="Alan", last_name="John", confirmation_hash=str(i),
+                                                 email="alan{}@john.org".format(i), petition=petition,
+                                                 confirmed=i < confirmed)
+                                       for i in range(number)])
+
+    def test_archive(self):
+        petition = Petition.objects.filter(user__user__username="julia").first()
+        self.add_signatures(petition, 12, confirmed=5)
+        self.assertTrue(petition.archive(batch_size=5))
+        petition = Petition.objects.get(pk=petition.id)
+        self.assertTrue(petition.archived)
+        self.assertTrue(os.path.exists(petition.archive_path))
+        # Never served with the media
+        self.assertEqual(os.path.dirname(petition.archive_path), self.archive_root.name)
+        self.assertEqual(Signature.objects.filter(petition=petition).count(), 0)
+        self.assertEqual(petition.get_signature_number(), 12)
+        self.assertEqual(petition.get_signature_number(confirmed=True), 5)
+        rows = list(petition.archived_signature_rows())
+        self.assertEqual(rows[0], Petition.ARCHIVE_FIELDS)
+        self.assertEqual(len(rows), 13)
+        self.assertEqual(len(list(petition.archived_signature_rows(only_confirmed=True))), 6)
+
+    def test_archived_csv_download(self):
+        petition = Petition.objects.filter(user__user__username="julia").first()
+        self.add_signatures(petition, 4, confirmed=1)
+        petition.archive()
+        self.client.login(username="max", password="max")
+        response = self.client.get(reverse("get_csv_signature", args=[petition.id]))
+        self.assertEqual(response.status_code, 403)
+        self.client.login(username="julia", password="julia")
+        response = self.client.get(reverse("get_csv_signature", args=[petition.id]))
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "first_name,last_name,phone,email,subscribed_to_mailinglist,confirmed")
+        self.assertEqual(len(lines), 5)
+        response = self.client.get(reverse("get_csv_confirmed_signature", args=[petition.id]))
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[1], "Alan,John,,alan0@john.org,False,True")
+        self.assertEqual(len(lines), 2)
+
+    def test_archived_petition_refuses_signatures(self):
+        petition = Petition.objects.filter(user__user__username="julia", published=True).first()
+        petition.archive()
+        data = {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}
+        response = self.client.post(reverse('create_signature', args=[petition.id]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Signature.objects.filter(petition=petition).count(), 0)
+
+    def test_archive_command_auto(self):
+        old = timezone.now() - timedelta(days=400)
+        petitions = list(Petition.objects.filter(user__user__username="max")[:3])
+        for petition in petitions:
+            self.add_signatures(petition, 3)
+        Petition.objects.filter(pk__in=[p.id for p in petitions]).update(published=False,
+                                                                          last_modification_date=old)
+        Signature.objects.filter(petition__in=petitions[:2]).update(date=old)
+        Petition.objects.filter(pk=petitions[1].id).update(published=True)
+        call_command('archive_petition', '--auto', '--older-than', '365', '--pause', '0')
+        archived = Petition.objects.filter(archived=True).values_list('id', flat=True)
+        self.assertEqual(list(archived), [petitions[0].id])
+        self.assertEqual(Signature.objects.filter(petition=petitions[0]).count(), 0)
+        self.assertEqual(Signature.objects.filter(petition=petitions[2]).count(), 3)
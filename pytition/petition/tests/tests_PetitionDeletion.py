@@ -0,0 +1,78 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.core.management import call_command
+
+from petition.models import Organization, Petition, PytitionUser, Signature, SlugModel
+from .utils import add_default_data
+
+
+class PetitionDeletionTest(TestCase):
+    """Test soft deletion and batched purge of petitions"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def add_signatures(self, petition, number):
+        Signature.objects.bulk_create([Signature(first_name="Alan", last_name="John", confirmation_hash=str(i),
+                                                 email="alan{}@john.org".format(i), petition=petition)
+                                       for i in range(number)])
+
+    def test_soft_delete_hides_petition(self):
+        petition = Petition.objects.filter(user__user__username="julia", published=True).first()
+        slug = petition.slugmodel_set.first().slug
+        self.add_signatures(petition, 3)
+        petition.soft_delete()
+        self.assertFalse(Petition.objects.filter(pk=petition.id).exists())
+        self.assertFalse(PytitionUser.objects.get(user__username="julia").petition_set.filter(pk=petition.id).exists())
+        self.assertEqual(SlugModel.objects.filter(petition=petition).count(), 0)
+        self.assertEqual(Signature.objects.filter(petition_id=petition.id).count(), 3)
+        response = self.client.get(reverse("detail", args=[petition.id]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("slug_show_petition", args=["julia", slug]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_purge_by_batches(self):
+        petition = Petition.objects.filter(user__user__username="julia").first()
+        self.add_signatures(petition, 25)
+        with self.assertRaises(ValueError):
+            petition.purge()
+        petition.soft_delete()
+        batches = []
+        self.assertFalse(petition.purge(batch_size=10, max_batches=2, progress=lambda p, n: batches.append(n)))
+        self.assertEqual(batches, [10, 10])
+        self.assertEqual(Signature.objects.filter(petition_id=petition.id).count(), 5)
+        self.assertTrue(petition.purge(batch_size=10, progress=lambda p, n: batches.append(n)))
+        self.assertEqual(batches, [10, 10, 5])
+        self.assertFalse(Petition.all_objects.filter(pk=petition.id).exists())
+
+    def test_purge_deleted_command(self):
+        petitions = list(Petition.objects.filter(user__user__username="max")[:2])
+        for petition in petitions:
+            self.add_signatures(petition, 15)
+            petition.soft_delete()
+        call_command('purge_deleted', '--batch-size', '10', '--pause', '0', '--max-batches', '3')
+        self.assertEqual(Petition.all_objects.filter(deleted=True).count(), 1)
+        self.assertEqual(Signature.objects.filter(petition__in=[p.id for p in petitions]).count(), 5)
+        call_command('purge_deleted', '--pause', '0')
+        self.assertEqual(Petition.all_objects.filter(deleted=True).count(), 0)
+        self.assertEqual(Signature.objects.filter(petition__in=[p.id for p in petitions]).count(), 0)
+
+    def test_drop_user(self):
+        julia = PytitionUser.objects.get(user__username="julia")
+        petition_ids = list(julia.petition_set.values_list('id', flat=True))
+        rap_petition = Petition.objects.create(title="RAP petition", org=Organization.objects.get(name="RAP"))
+        self.add_signatures(rap_petition, 2)
+        julia.drop()
+        self.assertFalse(Organization.objects.filter(name="RAP").exists())
+        self.assertTrue(Organization.objects.filter(name="Alternatiba").exists())
+        deleted = Petition.all_objects.filter(deleted=True)
+        self.assertEqual(set(deleted.values_list('id', flat=True)), set(petition_ids + [rap_petition.id]))
+        self.assertEqual(Signature.objects.filter(petition=rap_petition).count(), 2)
+        call_command('purge_deleted', '--pause', '0')
+        self.assertEqual(Petition.all_objects.filter(deleted=True).count(), 0)
+
+    def test_moderate_delete_petition(self):
+        petition = Petition.objects.filter(org__name="Attac").first()
+        call_command('moderate', '-d', petition.id)
+        self.assertFalse(Petition.objects.filter(pk=petition.id).exists())
+        self.assertTrue(Petition.all_objects.filter(pk=petition.id, deleted=True).exists())
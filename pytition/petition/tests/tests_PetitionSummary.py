@@ -0,0 +1,50 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from petition.models import Petition, PytitionUser
+from .utils import add_default_data
+
+
+@override_settings(INDEX_PAGE='HOME')
+class PetitionSummaryTest(TestCase):
+    """Test the narrow loading of petitions in lists"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def test_summary(self):
+        petition = Petition.objects.summary().get(pk=Petition.objects.first().pk)
+        self.assertEqual(petition.get_deferred_fields(),
+                         {field.attname for field in Petition._meta.concrete_fields}
+                         - {'id', 'user_id', 'org_id'} - set(Petition.SUMMARY_FIELDS))
+        self.assertIn('text', petition.get_deferred_fields())
+        with self.assertNumQueries(0):
+            str(petition.owner)
+            petition.url
+            petition.is_moderated
+
+    def test_lists_do_not_load_texts(self):
+        max = PytitionUser.objects.get(user__username='max')
+        max.petition_set.update(text='<p>{}</p>'.format('x' * 10000))
+        self.client.login(username='max', password='max')
+        for url in [reverse('index'), reverse('search'), reverse('user_profile', args=['max']),
+                    reverse('user_dashboard')]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            petition_queries = [query['sql'] for query in queries if 'FROM "petition_petition"' in query['sql']]
+            self.assertTrue(petition_queries, url)
+            for sql in petition_queries:
+                self.assertNotIn('"petition_petition"."text"', sql, url)
+
+    def test_user_moderated_petitions_hidden(self):
+        max = PytitionUser.objects.get(user__username='max')
+        published = Petition.objects.filter(published=True, moderated=False)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['petitions'].paginator.count, published.count())
+        max.moderated = True
+        max.save()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['petitions'].paginator.count, published.exclude(user=max).count())
@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -8,13 +8,24 @@ from petition.models import Permission
 from .utils import add_default_data
 
 import os
+import shutil
+import tempfile
 
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class PetitionViewTest(TestCase):
     """Test index view"""
     @classmethod
     def setUpTestData(cls):
         add_default_data()
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
     def tearDown(self):
         # Clean up run after every test method.
         pass
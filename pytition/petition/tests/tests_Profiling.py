@@ -0,0 +1,53 @@
+import marshal
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition.models import Petition, RequestProfile
+from .utils import add_default_data
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTest(TestCase):
+    """Test the on-demand profiling of requests"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def test_profiling_is_for_staff(self):
+        self.client.login(username="julia", password="julia")
+        response = self.client.get(reverse("user_dashboard"), {'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Pytition-Profile', response)
+        self.assertEqual(RequestProfile.objects.count(), 0)
+
+    def test_profile_request(self):
+        self.client.login(username="admin", password="admin")
+        petition = Petition.objects.filter(published=True).first()
+        response = self.client.get(reverse("detail", args=[petition.id]))
+        self.assertNotIn('X-Pytition-Profile', response)
+        response = self.client.get(reverse("detail", args=[petition.id]), {'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Pytition-Profile'], reverse('admin:petition_requestprofile_change',
+                                                                 args=[profile.id]))
+        self.assertEqual(profile.view, "detail")
+        self.assertEqual(profile.status, 200)
+        self.assertGreater(profile.sql_count, 0)
+        self.assertIn("cumulative", profile.report)
+        self.assertIsInstance(marshal.loads(bytes(profile.stats)), dict)
+
+        response = self.client.get(reverse("admin:petition_requestprofile_changelist"))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("admin:petition_requestprofile_change", args=[profile.id]))
+        self.assertContains(response, "petition_petition")
+        response = self.client.get(reverse("admin:petition_requestprofile_download", args=[profile.id]))
+        self.assertEqual(response.content, bytes(profile.stats))
+
+    def test_profile_header_and_retention(self):
+        self.client.login(username="admin", password="admin")
+        with self.settings(PROFILING_RETENTION=2):
+            for _ in range(3):
+                response = self.client.get(reverse("user_dashboard"), HTTP_X_PYTITION_PROFILE="1")
+                self.assertIn('X-Pytition-Profile', response)
+        self.assertEqual(RequestProfile.objects.count(), 2)
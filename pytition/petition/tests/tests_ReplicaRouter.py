@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.sessions.models import Session
+
+from petition.models import Petition, Signature
+from petition.routers import ReplicaRouter, read_from_replica, replica_reads_enabled
+from petition.middleware import PRIMARY_PIN_COOKIE, ReplicaRoutingMiddleware
+from .utils import add_default_data
+
+
+# The replica is a mirror of the default database, so the routing decisions are
+# observed through the choice of a replica among DATABASE_REPLICAS
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaRouterTest(TestCase):
+    """Test read replicas routing"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def test_router_without_replica(self):
+        router = ReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=[]), read_from_replica():
+            self.assertIsNone(router.db_for_read(Petition))
+            self.assertIsNone(router.db_for_write(Petition))
+
+    def test_router(self):
+        router = ReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=['replica1', 'replica2']):
+            self.assertEqual(router.db_for_read(Petition), 'default')
+            with read_from_replica():
+                self.assertIn(router.db_for_read(Petition), ['replica1', 'replica2'])
+                self.assertEqual(router.db_for_read(Session), 'default')
+                self.assertEqual(router.db_for_write(Petition), 'default')
+            self.assertFalse(replica_reads_enabled())
+            self.assertFalse(router.allow_migrate('replica1', 'petition'))
+            self.assertIsNone(router.allow_migrate('default', 'petition'))
+
+    def get(self, url, **kwargs):
+        with mock.patch('petition.routers.random.choice', return_value='default') as choice:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(replica_reads_enabled())
+        return choice.called
+
+    def test_middleware_without_replica(self):
+        with self.settings(DATABASE_REPLICAS=[]), self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: None)
+
+    def test_anonymous_reads_use_replica(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.assertTrue(self.get(reverse("index")))
+        self.assertTrue(self.get(reverse("search")))
+        self.assertTrue(self.get(reverse("detail", args=[petition.id])))
+        self.assertTrue(self.get(reverse("detail", args=[petition.id]), HTTP_ACCEPT="application/json"))
+        self.assertTrue(self.get(reverse("user_profile", args=["julia"])))
+        self.assertTrue(self.get(reverse("org_profile", args=["attac"])))
+
+    def test_authenticated_reads_use_primary(self):
+        self.client.login(username="julia", password="julia")
+        self.assertFalse(self.get(reverse("index")))
+        self.assertFalse(self.get(reverse("user_dashboard")))
+
+    def test_read_your_writes(self):
+        petition = Petition.objects.filter(published=True).first()
+        data = {
+            'first_name': 'Alan',
+            'last_name': 'John',
+            'email': 'alan@john.org',
+        }
+        response = self.client.post(reverse('create_signature', args=[petition.id]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertEqual(Signature.objects.filter(petition=petition).count(), 1)
+        self.assertFalse(self.get(reverse("detail", args=[petition.id])))
+        self.client.cookies.pop(PRIMARY_PIN_COOKIE)
+        self.assertTrue(self.get(reverse("detail", args=[petition.id])))
+
+
+@contextmanager
+def replica_alias(alias='replica'):
+    """
+    A second database alias, with its own connection wrapper, reading the test
+    database through the DB-API connection of the default alias (so that it sees the
+    data of the current test transaction), to observe which alias serves each query
+    """
+    default = connections['default']
+    default.ensure_connection()
+    connections.databases[alias] = dict(default.settings_dict)
+    replica = connections[alias]
+    replica.connection, replica.autocommit = default.connection, True
+    try:
+        with override_settings(DATABASE_REPLICAS=[alias]), CaptureQueriesContext(replica) as queries:
+            yield queries
+    finally:
+        replica.connection = None
+        del connections[alias]
+        del connections.databases[alias]
+
+
+class ReplicaAliasTest(TestCase):
+    """Test read replicas routing with a second database alias"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def get(self, queries, url):
+        start = len(queries)
+        response = self.client.get(url)
+        self.assertIn(response.status_code, [200, 302])
+        return response, len(queries) - start
+
+    def test_routing(self):
+        petition = Petition.objects.filter(published=True).first()
+        with replica_alias() as queries:
+            response, count = self.get(queries, reverse("detail", args=[petition.id]))
+            self.assertGreater(count, 0)
+            self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+            self.client.login(username="julia", password="julia")
+            response, count = self.get(queries, reverse("index"))
+            self.assertEqual(count, 0)
+            self.assertFalse(any(query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) for query in queries))
+
+    def test_confirm_pins_to_primary(self):
+        petition = Petition.objects.filter(published=True).first()
+        signature = Signature.objects.create(petition=petition, first_name='Alan', last_name='John',
+                                             email='alan@john.org', confirmation_hash='1234')
+        with replica_alias() as queries:
+            # The confirmation is a GET which writes
+            response, count = self.get(queries, reverse("confirm", args=[petition.id, '1234']))
+            self.assertEqual(response.status_code, 302)
+            self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+            signature.refresh_from_db()
+            self.assertTrue(signature.confirmed)
+            response, count = self.get(queries, reverse("detail", args=[petition.id]))
+            self.assertEqual(count, 0)
+            self.client.cookies.pop(PRIMARY_PIN_COOKIE)
+            response, count = self.get(queries, reverse("detail", args=[petition.id]))
+            self.assertGreater(count, 0)
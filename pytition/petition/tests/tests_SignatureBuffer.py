@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition import helpers, signature_buffer
+from petition.models import Petition, Signature, SignatureStat
+from .utils import add_default_data
+
+
+class SignatureBufferTest(TestCase):
+    """Test the write-behind signature buffer"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(SIGNATURE_BUFFER=os.path.join(directory, 'signatures.sqlite3'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.petition = Petition.objects.filter(published=True).first()
+        # Other tests disable logging, the errors must be logged here
+        self.addCleanup(logging.disable, logging.root.manager.disable)
+        logging.disable(logging.NOTSET)
+
+    def sign(self, email, first_name='Alan'):
+        data = {'first_name': first_name, 'last_name': 'John', 'email': email}
+        return self.client.post(reverse('create_signature', args=[self.petition.id]), data)
+
+    def test_buffered_signing(self):
+        signatures = self.petition.signature_set.count()
+        response = self.sign('alan@john.org')
+        self.assertRedirects(response, self.petition.url, fetch_redirect_response=False)
+        self.assertEqual(self.petition.signature_set.count(), signatures)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(signature_buffer.pending(), 1)
+
+        call_command('flush_signatures')
+        self.assertEqual(signature_buffer.pending(), 0)
+        signature = Signature.objects.get(petition=self.petition, email='alan@john.org')
+        self.assertFalse(signature.confirmed)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('http://testserver/petition/{}/confirm/{}'.format(self.petition.id, signature.confirmation_hash),
+                      mail.outbox[0].body)
+        self.assertEqual(SignatureStat.objects.get(petition=self.petition, hour=SignatureStat.truncate(signature.date)).new, 1)
+        self.client.get(reverse('confirm', args=[self.petition.id, signature.confirmation_hash]))
+        signature.refresh_from_db()
+        self.assertTrue(signature.confirmed)
+
+    def test_deduplication(self):
+        self.sign('alan@john.org')
+        self.sign('alan@john.org', first_name='Alan2')
+        self.sign('bob@john.org')
+        Signature.objects.create(petition=self.petition, first_name='Carl', last_name='John', email='carl@john.org',
+                                 confirmed=True)
+        # Signed before its previous signature got confirmed
+        signature = Signature(petition=self.petition, first_name='Carl', last_name='John', email='carl@john.org',
+                              confirmation_hash='carl')
+        signature_buffer.append(signature, 'http://testserver/confirm/carl')
+        self.assertEqual(signature_buffer.flush(), 4)
+        self.assertEqual(Signature.objects.get(petition=self.petition, email='alan@john.org').first_name, 'Alan')
+        self.assertTrue(Signature.objects.filter(petition=self.petition, email='bob@john.org').exists())
+        self.assertEqual(Signature.objects.filter(petition=self.petition, email='carl@john.org').count(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_email_already_sent(self):
+        response = self.client.post(reverse('create_signature', args=[self.petition.id]),
+                                    {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}, follow=True)
+        self.assertContains(response, 'an email has just been sent to you')
+        signature_buffer.flush()
+        response = self.client.post(reverse('create_signature', args=[self.petition.id]),
+                                    {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}, follow=True)
+        self.assertContains(response, 'an email has already been sent to you lately')
+        signature_buffer.flush()
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(SIGNATURE_THROTTLE=1)
+    def test_throttle(self):
+        self.sign('alan@john.org')
+        self.sign('bob@john.org')
+        response = self.sign('carl@john.org')
+        self.assertContains(response, 'Too many signatures from your IP address')
+        self.assertEqual(signature_buffer.pending(), 2)
+        signature_buffer.flush()
+        response = self.sign('carl@john.org')
+        self.assertContains(response, 'Too many signatures from your IP address')
+        self.assertEqual(signature_buffer.pending(), 0)
+
+    def test_crashed_flush_is_replayed(self):
+        self.sign('alan@john.org')
+        rows = signature_buffer.buffer_connection().execute('SELECT data FROM signature').fetchall()
+        # The signatures were written, but the process died before removing them from the buffer
+        signature_buffer.write([json.loads(data) for data, in rows])
+        self.assertEqual(signature_buffer.flush(), 1)
+        self.assertEqual(Signature.objects.filter(petition=self.petition, email='alan@john.org').count(), 1)
+        self.assertEqual(sum(SignatureStat.objects.filter(petition=self.petition).values_list('new', flat=True)),
+                         self.petition.signature_set.count())
+        self.assertEqual(signature_buffer.pending(), 0)
+
+    def test_mail_failure(self):
+        self.sign('alan@john.org')
+        self.sign('bob@john.org')
+        send_email_message = helpers.send_email_message
+
+        def send(msg):
+            if msg.to == ['alan@john.org']:
+                raise ConnectionRefusedError
+            send_email_message(msg)
+
+        with mock.patch('petition.helpers.send_email_message', side_effect=send), \
+                self.assertLogs('petition.signature_buffer', 'ERROR'):
+            self.assertEqual(signature_buffer.flush(), 2)
+        # The batch is not replayed, the signature which mail failed can be sent again
+        self.assertEqual(signature_buffer.pending(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Signature.objects.filter(petition=self.petition, email='alan@john.org').count(), 1)
+        self.sign('alan@john.org')
+        signature_buffer.flush()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_loop_survives_errors(self):
+        self.sign('alan@john.org')
+        rounds = []
+
+        def sleep(interval):
+            rounds.append(interval)
+            if len(rounds) == 2:
+                raise KeyboardInterrupt
+
+        with mock.patch('petition.signature_buffer.write', side_effect=[ConnectionError, ([], [])]), \
+                mock.patch('petition.management.commands.flush_signatures.time.sleep', side_effect=sleep), \
+                mock.patch('petition.management.commands.flush_signatures.close_old_connections') as close, \
+                self.assertLogs('petition.management.commands.flush_signatures', 'ERROR'):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('flush_signatures', '--loop')
+        self.assertEqual(len(rounds), 2)
+        close.assert_called_once_with()
+        self.assertEqual(signature_buffer.pending(), 0)
@@ -0,0 +1,85 @@
+import logging
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from petition.models import Petition, Signature
+from .utils import add_default_data
+
+
+class SignaturePartitioningTest(TestCase):
+    """Test that signature queries are scoped to their petition"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def test_signature_writes_filter_on_petition(self):
+        petition = Petition.objects.filter(published=True).first()
+        signature = Signature.objects.create(first_name="Alan", last_name="John", email="alan@john.org",
+                                             petition=petition, confirmation_hash="1")
+        Signature.objects.create(first_name="Bob", last_name="John", email="bob@john.org",
+                                 petition=petition, confirmation_hash="2")
+        signature.confirm()
+        with CaptureQueriesContext(connection) as queries:
+            signature.save()
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'DELETE'))
+                  and 'petition_signature"' in q['sql'].split('WHERE')[0]]
+        self.assertEqual(len(writes), 2)
+        for sql in writes:
+            self.assertIn('"petition_id" = {}'.format(petition.id), sql)
+        self.assertEqual(Signature.objects.filter(petition=petition).count(), 2)
+
+    def test_delete_selected_signatures_of_other_petition(self):
+        julia_petition = Petition.objects.filter(user__user__username="julia").first()
+        max_petition = Petition.objects.filter(user__user__username="max").first()
+        signature = Signature.objects.create(first_name="Alan", last_name="John", email="alan@john.org",
+                                             petition=max_petition, confirmation_hash="1")
+        self.client.login(username="julia", password="julia")
+        response = self.client.post(reverse("show_signatures", args=[julia_petition.id]),
+                                    {'action': 'delete', 'signature_id': [signature.id]})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Signature.objects.filter(pk=signature.id).exists())
+
+
+class PartitionSignaturesCommandTest(TestCase):
+    """Test the SQL of the partition_signatures command"""
+    def setUp(self):
+        # Other tests disable logging, the errors must be logged here
+        self.addCleanup(logging.disable, logging.root.manager.disable)
+        logging.disable(logging.NOTSET)
+
+    def run_command(self, vendor, *args):
+        statements = []
+        with mock.patch('petition.management.commands.partition_signatures.connection') as command_connection, \
+                mock.patch('petition.management.commands.partition_signatures.Command.run_sql',
+                           side_effect=lambda sql, params=None: statements.append(' '.join(sql.split()))):
+            command_connection.vendor = vendor
+            call_command('partition_signatures', *args)
+        return statements
+
+    def test_requires_postgresql(self):
+        for vendor in ('sqlite', 'mysql'):
+            with self.assertLogs('petition.management.commands.partition_signatures', 'ERROR'):
+                self.assertEqual(self.run_command(vendor, 'prepare'), [])
+
+    def test_prepare(self):
+        statements = self.run_command('postgresql', 'prepare', '--partitions', '4')
+        self.assertIn("CREATE TABLE petition_signature_partitioned (LIKE petition_signature INCLUDING DEFAULTS) "
+                      "PARTITION BY HASH (petition_id)", statements)
+        self.assertIn("CREATE UNIQUE INDEX ON petition_signature_partitioned (petition_id, email, confirmed)",
+                      statements)
+        partitions = [sql for sql in statements if 'PARTITION OF petition_signature_partitioned' in sql]
+        self.assertEqual(len(partitions), 4)
+        self.assertIn("FOR VALUES WITH (MODULUS 4, REMAINDER 3)", partitions[-1])
+        mirror = next(sql for sql in statements
+                      if sql.startswith("CREATE FUNCTION petition_signature_partitioned_mirror()"))
+        self.assertIn("INSERT INTO petition_signature_partitioned SELECT NEW.*", mirror)
+        self.assertIn("DELETE FROM petition_signature_partitioned WHERE id = OLD.id AND petition_id = OLD.petition_id",
+                      mirror)
+        self.assertIn("CREATE TRIGGER petition_signature_partitioned_mirror AFTER INSERT OR UPDATE OR DELETE ON "
+                      "petition_signature FOR EACH ROW EXECUTE PROCEDURE petition_signature_partitioned_mirror()",
+                      statements)
@@ -0,0 +1,146 @@
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.core.management import call_command
+from django.utils import timezone
+
+from petition.models import Organization, Petition, PytitionUser, Signature, SignatureStat
+from .utils import add_default_data
+
+
+class SignatureStatTest(TestCase):
+    """Test the hourly signature statistics rollup"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def login(self, name):
+        self.client.login(username=name, password=name)
+        self.pu = PytitionUser.objects.get(user__username=name)
+        return self.pu
+
+    def sign(self, petition, email, subscribed=False):
+        return Signature.objects.create(first_name="Alan", last_name="John", email=email, petition=petition,
+                                        subscribed_to_mailinglist=subscribed)
+
+    def test_signature_creation_is_recorded(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.sign(petition, "alan@john.org")
+        self.sign(petition, "bob@john.org", subscribed=True)
+        stat = SignatureStat.objects.get(petition=petition)
+        self.assertEqual(stat.hour, SignatureStat.truncate(timezone.now()))
+        self.assertEqual(stat.new, 2)
+        self.assertEqual(stat.subscribed, 1)
+        self.assertEqual(stat.confirmed, 0)
+
+    def test_confirmation_is_recorded_once(self):
+        petition = Petition.objects.filter(published=True).first()
+        signature = self.sign(petition, "alan@john.org")
+        petition.confirm_signature(signature.confirmation_hash)
+        signature = Signature.objects.get(pk=signature.pk)
+        signature.confirm()
+        signature.save()
+        stat = SignatureStat.objects.get(petition=petition)
+        self.assertEqual(stat.new, 1)
+        self.assertEqual(stat.confirmed, 1)
+
+    def test_signature_deletion_is_recorded(self):
+        julia = self.login("julia")
+        petition = julia.petition_set.first()
+        signatures = [self.sign(petition, "{}@john.org".format(name), subscribed=True)
+                      for name in ("alan", "bob", "carl", "dan")]
+        petition.confirm_signature(signatures[0].confirmation_hash)
+        response = self.client.post(reverse("show_signatures", args=[petition.id]),
+                                    {'action': 'delete', 'signature_id': [signatures[0].id]})
+        self.assertEqual(response.status_code, 302)
+        stat = SignatureStat.objects.get(petition=petition)
+        self.assertEqual((stat.new, stat.subscribed, stat.confirmed), (3, 3, 1))
+        petition.delete_signatures(batch_size=2)
+        stat.refresh_from_db()
+        self.assertEqual((stat.new, stat.subscribed, stat.confirmed), (0, 0, 1))
+
+    def test_archived_signatures_are_counted(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.sign(petition, "alan@john.org")
+        with tempfile.TemporaryDirectory() as archive_root, self.settings(ARCHIVE_ROOT=archive_root):
+            petition.archive()
+        self.assertEqual(SignatureStat.objects.get(petition=petition).new, 1)
+
+    def test_signature_stats_range(self):
+        petition = Petition.objects.filter(published=True).first()
+        now = SignatureStat.truncate(timezone.now())
+        SignatureStat.objects.create(petition=petition, hour=now - timezone.timedelta(hours=10), new=3)
+        SignatureStat.objects.create(petition=petition, hour=now - timezone.timedelta(hours=2), new=5)
+        stats = petition.signature_stats(since=now - timezone.timedelta(hours=5))
+        self.assertEqual([s.new for s in stats], [5])
+        stats = petition.signature_stats(since=now - timezone.timedelta(hours=12), until=now - timezone.timedelta(hours=5))
+        self.assertEqual([s.new for s in stats], [3])
+
+    def test_signature_stats_view(self):
+        julia = self.login("julia")
+        petition = julia.petition_set.first()
+        self.sign(petition, "alan@john.org", subscribed=True)
+        response = self.client.get(reverse("signature_stats", args=[petition.id]))
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()['stats']
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['new'], 1)
+        self.assertEqual(stats[0]['subscribed'], 1)
+
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_signature_stats_view_range(self):
+        julia = self.login("julia")
+        petition = julia.petition_set.first()
+        hour = SignatureStat.truncate(timezone.now()) - timezone.timedelta(hours=10)
+        SignatureStat.objects.create(petition=petition, hour=hour, new=3)
+        # Naive datetimes are in the current time zone
+        since = timezone.localtime(hour).replace(tzinfo=None).isoformat()
+        response = self.client.get(reverse("signature_stats", args=[petition.id]), {'since': since})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([stat['new'] for stat in response.json()['stats']], [3])
+        response = self.client.get(reverse("signature_stats", args=[petition.id]),
+                                   {'since': since, 'until': (hour - timezone.timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.json()['stats'], [])
+
+    def test_signature_stats_view_invalid_range(self):
+        julia = self.login("julia")
+        petition = julia.petition_set.first()
+        for params in ({'since': '2020-13-45T00:00'}, {'until': '2020-02-30T10:00'}, {'since': 'yesterday'}):
+            response = self.client.get(reverse("signature_stats", args=[petition.id]), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+    def test_signature_stats_view_forbidden(self):
+        self.login("john")
+        petition = PytitionUser.objects.get(user__username="julia").petition_set.first()
+        response = self.client.get(reverse("signature_stats", args=[petition.id]))
+        self.assertEqual(response.status_code, 403)
+        petition = Petition.objects.create(title="Org petition", org=Organization.objects.get(name="RAP"))
+        response = self.client.get(reverse("signature_stats", args=[petition.id]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_dashboards_charts(self):
+        julia = self.login("julia")
+        petition = julia.petition_set.first()
+        self.sign(petition, "alan@john.org")
+        response = self.client.get(reverse("user_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "petition/signature_chart.html")
+        chart = response.context['signature_stats'][petition.id]
+        self.assertEqual(chart['total'], 1)
+        self.assertEqual(chart['bars'][-1]['height'], 100)
+        response = self.client.get(reverse("org_dashboard", args=["alternatiba"]))
+        self.assertEqual(response.status_code, 200)
+        org_petitions = Organization.objects.get(name="Alternatiba").petition_set.all()
+        self.assertEqual(set(response.context['signature_stats']), set(p.id for p in org_petitions))
+
+    def test_rollup_signatures_command(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.sign(petition, "alan@john.org")
+        self.sign(petition, "bob@john.org", subscribed=True)
+        SignatureStat.objects.all().delete()
+        call_command('rollup_signatures', petition.id)
+        stat = SignatureStat.objects.get(petition=petition)
+        self.assertEqual(stat.new, 2)
+        self.assertEqual(stat.subscribed, 1)
@@ -0,0 +1,91 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition.models import Organization, Petition, PytitionUser
+from .utils import add_default_data
+
+
+class SitemapsTest(TestCase):
+    """Test the sitemaps and the Atom feeds of the published petitions"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SITEMAP_SHARD_SIZE=5)
+    def test_sitemaps(self):
+        published = Petition.objects.filter(published=True, moderated=False).order_by('id')
+        response = self.client.get(reverse('sitemap_index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        shards = sorted({petition.id // 5 for petition in published})
+        for shard in shards:
+            self.assertContains(response, 'http://testserver/sitemap-{}.xml'.format(shard))
+        petition = published.first()
+        response = self.client.get(reverse('sitemap', args=[petition.id // 5]))
+        self.assertContains(response, '<loc>http://testserver{}</loc>'.format(petition.url))
+        unpublished = Petition.objects.filter(published=False).first()
+        response = self.client.get(reverse('sitemap', args=[unpublished.id // 5]))
+        self.assertNotContains(response, '<loc>http://testserver{}</loc>'.format(unpublished.url))
+
+    def test_feeds(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        org = Organization.objects.get(name='RAP')
+        petition = Petition.objects.create(title="Newest petition", user=julia, twitter_description="Read me")
+        self.assertIsNone(petition.publication_date)
+        response = self.client.get(reverse('petition_feed'))
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+        self.assertNotContains(response, "Newest petition")
+
+        petition.publish()
+        self.assertIsNotNone(petition.publication_date)
+        response = self.client.get(reverse('petition_feed'))
+        self.assertContains(response, "<title>Newest petition</title>")
+        self.assertContains(response, "Read me")
+        self.assertContains(response, 'href="http://testserver{}"'.format(petition.url))
+        self.assertNotContains(self.client.get(reverse('org_feed', args=[org.slugname])), "Newest petition")
+
+        petition.transfer_to(org=org)
+        self.assertContains(self.client.get(reverse('org_feed', args=[org.slugname])), "Newest petition")
+        petition.moderate()
+        self.assertNotContains(self.client.get(reverse('petition_feed')), "Newest petition")
+        self.assertNotContains(self.client.get(reverse('org_feed', args=[org.slugname])), "Newest petition")
+        self.assertEqual(self.client.get(reverse('org_feed', args=['unknown'])).status_code, 404)
+
+    def test_org_petition_slug_feed(self):
+        org = Organization.objects.get(name='RAP')
+        # Its slug is 'feed'
+        petition = Petition.objects.create(title="Feed", org=org, published=True)
+        self.assertEqual(petition.url, '/petition/org/{}/feed'.format(org.slugname))
+        response = self.client.get(petition.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['petition'], petition)
+        response = self.client.get(reverse('org_feed', args=[org.slugname]))
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+
+    def test_incremental_regeneration(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        self.client.get(reverse('petition_feed'))
+        self.client.get(reverse('sitemap_index'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('petition_feed'))
+            self.client.get(reverse('sitemap_index'))
+        # Changes of unpublished petitions do not regenerate anything
+        petition = Petition.objects.create(title="Draft", user=julia)
+        petition.text = "<p>Draft</p>"
+        petition.save()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('petition_feed'))
+        petition.publish()
+        self.assertContains(self.client.get(reverse('petition_feed')), "Draft")
+        self.assertContains(self.client.get(reverse('sitemap', args=[0])), petition.url)
+        # A content change only regenerates its sitemap
+        petition.text = "<p>Final</p>"
+        petition.save()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('petition_feed'))
+        julia.moderate()
+        self.assertNotContains(self.client.get(reverse('petition_feed')), "Draft")
@@ -0,0 +1,68 @@
+import logging
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition import slow_queries
+from petition.models import Petition
+from .utils import add_default_data
+
+LOG_DIR = tempfile.mkdtemp()
+LOG_FILE = os.path.join(LOG_DIR, 'slow_queries.log')
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=LOG_FILE)
+class SlowQueriesTest(TestCase):
+    """Test the slow SQL queries log"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(LOG_DIR, ignore_errors=True)
+
+    def setUp(self):
+        # Some tests disable logging globally
+        self.logging_disabled = logging.root.manager.disable
+        logging.disable(logging.NOTSET)
+        slow_queries.reset_logger()
+        if os.path.exists(LOG_FILE):
+            os.remove(LOG_FILE)
+
+    def tearDown(self):
+        slow_queries.reset_logger()
+        logging.disable(self.logging_disabled)
+
+    def test_fingerprint(self):
+        self.assertEqual(slow_queries.fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'"),
+                         "SELECT * FROM t WHERE id IN (...) AND name = ?")
+        self.assertEqual(slow_queries.fingerprint("SELECT *  FROM t LIMIT 21"),
+                         slow_queries.fingerprint("SELECT * FROM t\nLIMIT 3"))
+
+    def test_request_queries_logged(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.client.get(reverse("detail", args=[petition.id]))
+        entries = list(slow_queries.read_log(LOG_FILE))
+        self.assertGreater(len(entries), 0)
+        for entry in entries:
+            self.assertEqual(entry['view'], "detail")
+            self.assertEqual(entry['petition_id'], petition.id)
+            self.assertEqual(entry['method'], "GET")
+        self.assertTrue(any(frame.startswith(os.path.join("petition", "views.py"))
+                            for entry in entries for frame in entry['stack']))
+
+    def test_command(self):
+        petition = Petition.objects.filter(published=True).first()
+        self.client.get(reverse("detail", args=[petition.id]))
+        self.client.get(reverse("detail", args=[petition.id]))
+        out = StringIO()
+        call_command('slow_queries', log=LOG_FILE, sort='count', top=1, stdout=out)
+        self.assertIn("detail (2)", out.getvalue())
+        self.assertIn("from: petition", out.getvalue())
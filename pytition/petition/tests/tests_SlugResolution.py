@@ -0,0 +1,84 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from petition.models import Organization, Petition, PytitionUser, SlugModel
+from petition.slugs import clear_slug_cache, resolve_slug
+from .utils import add_default_data
+
+
+class SlugResolutionTest(TestCase):
+    """Test the slugs unique per owner, their resolution and the stored petition urls"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        clear_slug_cache()
+
+    def test_slugs_are_unique_per_owner(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        max = PytitionUser.objects.get(user__username='max')
+        org = Organization.objects.get(name='RAP')
+        p1 = Petition.objects.create(title="Same title", user=julia)
+        p2 = Petition.objects.create(title="Same title", user=max)
+        p3 = Petition.objects.create(title="Same title", org=org)
+        self.assertEqual(SlugModel.objects.filter(slug='same-title').count(), 3)
+        with self.assertRaises(ValueError):
+            p1.add_slug('same-title')
+        slug = p2.slugmodel_set.get()
+        self.assertEqual((slug.user, slug.org), (max, None))
+        slug = p3.slugmodel_set.get()
+        self.assertEqual((slug.user, slug.org), (None, org))
+
+    def test_resolve_slug(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        petition = Petition.objects.create(title="Resolved", user=julia, published=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_slug('resolved', username='julia'), petition.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_slug('resolved', username='julia'), petition.id)
+        self.assertIsNone(resolve_slug('resolved', username='max'))
+        self.assertIsNone(resolve_slug('resolved', orgslugname='rap'))
+        petition.add_slug('other')
+        petition.del_slug('resolved')
+        self.assertIsNone(resolve_slug('resolved', username='julia'))
+        self.assertEqual(resolve_slug('other', username='julia'), petition.id)
+
+        response = self.client.get(reverse('slug_show_petition', args=['julia', 'other']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['petition'], petition)
+        response = self.client.get(reverse('slug_show_petition', args=['julia', 'resolved']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_canonical_url(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        petition = Petition.objects.create(title="Stored", user=julia)
+        url = reverse('slug_show_petition', args=['julia', 'stored'])
+        self.assertEqual(Petition.objects.get(pk=petition.pk).canonical_url, url)
+        petitions = list(Petition.objects.summary().filter(user=julia))
+        with self.assertNumQueries(0):
+            self.assertIn(url, [p.url for p in petitions])
+
+    def test_transfer_moves_slugs(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        org = Organization.objects.get(name='RAP')
+        Petition.objects.create(title="Taken", org=org)
+        petition = Petition.objects.create(title="Moved", user=julia)
+        petition.add_slug('taken')
+        self.assertEqual(resolve_slug('moved', username='julia'), petition.id)
+        petition.transfer_to(org=org)
+        self.assertEqual(list(petition.slugmodel_set.values_list('slug', 'user', 'org')), [('moved', None, org.id)])
+        self.assertIsNone(resolve_slug('moved', username='julia'))
+        self.assertEqual(resolve_slug('moved', orgslugname=org.slugname), petition.id)
+        url = reverse('slug_show_petition', kwargs={'orgslugname': org.slugname, 'petitionname': 'moved'})
+        self.assertEqual(petition.url, url)
+        self.assertEqual(Petition.objects.get(pk=petition.pk).url, url)
+
+    def test_owner_rename(self):
+        org = Organization.objects.get(name='RAP')
+        petition = Petition.objects.create(title="Renamed org", org=org)
+        org.slugname = 'rap2'
+        org.save()
+        self.assertEqual(Petition.objects.get(pk=petition.pk).url,
+                         reverse('slug_show_petition', kwargs={'orgslugname': 'rap2', 'petitionname': 'renamed-org'}))
+        self.assertEqual(resolve_slug('renamed-org', orgslugname='rap2'), petition.id)
@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition import publisher
+from petition.models import Organization, Petition, PytitionUser
+from .utils import add_default_data
+
+
+class StaticPagesTest(TestCase):
+    """Test the pre-rendering of the published petition pages"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(STATIC_PETITIONS_ROOT=self.root,
+                                     STATIC_PETITIONS_SITE_URL='https://pytition.example.org')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # The test transaction is never committed
+        on_commit = mock.patch('petition.publisher.transaction.on_commit', lambda func: func())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+
+    def page(self, path, name='index.html'):
+        path = os.path.join(self.root, path.strip('/'), name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def test_publish_and_unpublish(self):
+        julia = PytitionUser.objects.get(user__username='julia')
+        petition = Petition.objects.create(title="Static petition", user=julia)
+        detail = reverse('detail', args=[petition.id])
+        self.assertIsNone(self.page(detail))
+        petition.publish()
+        html = self.page(detail)
+        self.assertIn("Static petition", html)
+        self.assertIn('id="csrf-token"', html)
+        self.assertIn(reverse('create_signature', args=[petition.id]), html)
+        self.assertIn('https://pytition.example.org', html)
+        self.assertEqual(self.page(petition.url), html)
+        self.assertEqual(json.loads(self.page(petition.url, 'index.json')), petition.to_json)
+
+        petition.unpublish()
+        self.assertIsNone(self.page(detail))
+        self.assertIsNone(self.page(petition.url))
+
+    def test_slug_and_owner_changes(self):
+        petition = Petition.objects.filter(published=True, user__isnull=False).first()
+        call_command('publish_petitions')
+        old_url = petition.url
+        self.assertIsNotNone(self.page(old_url))
+        petition.add_slug("static-slug")
+        slug_url = reverse('slug_show_petition', kwargs={'username': petition.user.username,
+                                                         'petitionname': 'static-slug'})
+        self.assertIsNotNone(self.page(slug_url))
+        org = Organization.objects.get(name='RAP')
+        petition.transfer_to(org=org)
+        self.assertIsNone(self.page(slug_url))
+        self.assertIsNone(self.page(old_url))
+        petition.refresh_from_db()
+        self.assertIsNotNone(self.page(petition.url))
+        petition.soft_delete()
+        self.assertIsNone(self.page(reverse('detail', args=[petition.id])))
+
+    def test_publish_petitions_command(self):
+        call_command('publish_petitions')
+        published = Petition.objects.filter(published=True, moderated=False).exclude(user__moderated=True)
+        self.assertEqual(publisher.published_ids(), set(published.values_list('id', flat=True)))
+        petition = published.first()
+        Petition.objects.filter(pk=petition.pk).update(published=False)
+        call_command('publish_petitions', active_since=10)
+        self.assertIn(petition.id, publisher.published_ids())
+        call_command('publish_petitions')
+        self.assertNotIn(petition.id, publisher.published_ids())
+        self.assertIsNone(self.page(reverse('detail', args=[petition.id])))
+
+    def test_csrf_token(self):
+        response = self.client.get(reverse('csrf_token'))
+        self.assertTrue(response.json()['token'])
+        self.assertIn('csrftoken', response.cookies)
+        self.assertIn('no-cache', response['Cache-Control'])
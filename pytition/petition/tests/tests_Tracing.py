@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from petition import tracing
+from petition.models import Petition
+from .utils import add_default_data
+
+TRACE_DIR = tempfile.mkdtemp()
+TRACE_FILE = os.path.join(TRACE_DIR, 'traces.jsonl')
+
+
+@override_settings(TRACING_ENABLED=True, TRACING_FILE=TRACE_FILE)
+class TracingTest(TestCase):
+    """Test the request traces"""
+    @classmethod
+    def setUpTestData(cls):
+        add_default_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TRACE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        if os.path.exists(TRACE_FILE):
+            os.remove(TRACE_FILE)
+
+    def test_signature_trace(self):
+        petition = Petition.objects.filter(published=True).first()
+        data = {'first_name': 'Alan', 'last_name': 'John', 'email': 'alan@john.org'}
+        self.client.post(reverse('create_signature', args=[petition.id]), data)
+        spans = list(tracing.read_traces(TRACE_FILE))
+        self.assertEqual(len({span['traceId'] for span in spans}), 1)
+        by_name = {span['name']: span for span in spans}
+        root = by_name['POST create_signature']
+        self.assertNotIn('parentSpanId', root)
+        for name in ['make_password', 'db.query', 'send_confirmation_email', 'smtp.send']:
+            self.assertIn(name, by_name)
+        self.assertEqual(by_name['send_confirmation_email']['parentSpanId'], root['spanId'])
+        self.assertEqual(by_name['smtp.send']['parentSpanId'], by_name['send_confirmation_email']['spanId'])
+
+        out = StringIO()
+        call_command('traces', root['traceId'], file=TRACE_FILE, stdout=out)
+        self.assertIn("POST create_signature", out.getvalue())
+        self.assertIn("smtp.send", out.getvalue())
+
+    def test_exception(self):
+        with self.assertRaises(ValueError):
+            with tracing.start_as_current_span('failing'):
+                raise ValueError("oops")
+        span, = tracing.read_traces(TRACE_FILE)
+        self.assertEqual(span['status']['code'], tracing.STATUS_ERROR)
+        self.assertEqual(span['events'][0]['name'], 'exception')
+
+    @override_settings(TRACING_ENABLED=False)
+    def test_disabled(self):
+        with tracing.start_as_current_span('nothing') as span:
+            self.assertFalse(span.is_recording())
+        self.assertFalse(os.path.exists(TRACE_FILE))
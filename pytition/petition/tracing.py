@@ -0,0 +1,241 @@
+"""
+Tracing
+
+Spans around requests, SQL queries, password hashing, emails and newsletter
+subscriptions, with the method names of the OpenTelemetry API
+(start_as_current_span, set_attribute, record_exception, set_status).
+
+Nothing is recorded unless settings.TRACING_ENABLED is set. Then, the spans of
+each request are appended to settings.TRACING_FILE as one OTLP/JSON line, which
+the OpenTelemetry collector can read with its otlpjsonfile receiver, or which
+can be browsed with the traces management command.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+SERVICE_NAME = 'pytition'
+
+_current_span = contextvars.ContextVar('pytition_current_span', default=None)
+_export_lock = threading.Lock()
+
+
+def new_id(length):
+    return os.urandom(length).hex()
+
+
+class Trace:
+    """The spans of a trace, exported together when its root span ends"""
+    def __init__(self):
+        self.trace_id = new_id(16)
+        self.lock = threading.Lock()
+        self.spans = []
+        self.exported = False
+
+    def add(self, span):
+        with self.lock:
+            if not self.exported:
+                self.spans.append(span)
+                return
+        # The root span already ended: a background task outlived its request
+        export([span])
+
+    def close(self):
+        with self.lock:
+            spans, self.spans = self.spans, []
+            self.exported = True
+        export(spans)
+
+
+class Span:
+    def __init__(self, name, parent=None, kind=KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace = parent.trace if parent else Trace()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = new_id(8)
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_description = None
+        self.start_time = time.time_ns()
+        self.end_time = None
+
+    def is_recording(self):
+        return self.end_time is None
+
+    def update_name(self, name):
+        self.name = name
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+    def set_status(self, status, description=None):
+        self.status = status
+        self.status_description = description
+
+    def record_exception(self, exception):
+        self.events.append({
+            'name': 'exception',
+            'time': time.time_ns(),
+            'attributes': {'exception.type': type(exception).__name__, 'exception.message': str(exception)},
+        })
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        self.trace.add(self)
+        if self.parent_id is None:
+            self.trace.close()
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_time),
+            'endTimeUnixNano': str(self.end_time),
+            'attributes': otlp_attributes(self.attributes),
+            'status': {'code': self.status},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.status_description:
+            span['status']['message'] = self.status_description
+        if self.events:
+            span['events'] = [{'name': event['name'], 'timeUnixNano': str(event['time']),
+                               'attributes': otlp_attributes(event['attributes'])} for event in self.events]
+        return span
+
+
+class NonRecordingSpan:
+    """Returned when tracing is disabled, all methods do nothing"""
+    def is_recording(self):
+        return False
+
+    def update_name(self, name):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_status(self, status, description=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+
+INVALID_SPAN = NonRecordingSpan()
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_attributes(attributes):
+    return [{'key': key, 'value': otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def export(spans):
+    if not spans:
+        return
+    payload = {'resourceSpans': [{
+        'resource': {'attributes': otlp_attributes({'service.name': SERVICE_NAME})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}],
+    }]}
+    line = json.dumps(payload) + '\n'
+    with _export_lock:
+        with open(settings.TRACING_FILE, 'a') as trace_file:
+            trace_file.write(line)
+
+
+def get_current_span():
+    return _current_span.get() or INVALID_SPAN
+
+
+def start_span(name, kind=KIND_INTERNAL, attributes=None):
+    if not settings.TRACING_ENABLED:
+        return INVALID_SPAN
+    return Span(name, _current_span.get(), kind, attributes)
+
+
+class start_as_current_span:
+    """Context manager running its block in a new child span of the current one
+
+    with tracing.start_as_current_span("send_mail", attributes={'mail.to': email}) as span:
+        ...
+    """
+    def __init__(self, name, kind=KIND_INTERNAL, attributes=None):
+        self.span = start_span(name, kind, attributes)
+        self.token = None
+
+    def __enter__(self):
+        if self.span is not INVALID_SPAN:
+            self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_value is not None:
+            self.span.record_exception(exc_value)
+            self.span.set_status(STATUS_ERROR, str(exc_value))
+        if self.token is not None:
+            _current_span.reset(self.token)
+        self.span.end()
+        return False
+
+
+def traced(name=None):
+    """Decorator running the function in a span named after it"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_as_current_span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_traces(path):
+    """Yield the spans of a trace file, as OTLP/JSON dicts"""
+    if not os.path.exists(path):
+        return
+    with open(path) as trace_file:
+        for line in trace_file:
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                continue
+            for resource_spans in payload.get('resourceSpans', []):
+                for scope_spans in resource_spans.get('scopeSpans', []):
+                    yield from scope_spans.get('spans', [])
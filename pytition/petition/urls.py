@@ -17,6 +17,7 @@ urlpatterns = [
     path('<int:petition_id>/confirm/<confirmation_hash>', views.confirm, name='confirm'),
     path('<int:petition_id>/get_csv_signature', views.get_csv_signature, {'only_confirmed': False}, name='get_csv_signature'),
     path('<int:petition_id>/get_csv_confirmed_signature', views.get_csv_signature, {'only_confirmed': True}, name='get_csv_confirmed_signature'),
+    path('<int:petition_id>/signature_stats', views.signature_stats, name='signature_stats'),
     path('resend/<int:signature_id>', views.go_send_confirmation_email, name='resend_confirmation_email'),
     path('<int:petition_id>/sign', views.create_signature, name='create_signature'),
     path('<int:petition_id>/show_signatures', views.show_signatures, name='show_signatures'),
@@ -29,11 +30,14 @@ urlpatterns = [
     path('<int:petition_id>/del_slug', views.del_slug, name="del_slug"),
     path('<int:petition_id>/report/<int:reason_id>', views.report_petition, name="report_petition"),
     path('<int:petition_id>/report/', views.report_petition, name="report_petition"),
+    path('feed', views.petition_feed, name='petition_feed'),
+    path('csrf_token', views.csrf_token, name='csrf_token'),
     path('all_petitions', RedirectView.as_view(pattern_name='index', permanent=False), name='all_petitions'),
     path('transfer_petition/<int:petition_id>', views.transfer_petition, name='transfer_petition'),
     # Organisation
     path('org/create', views.org_create, name="org_create"),
     path('org/<slug:orgslugname>', views.org_profile, name='org_profile'),
+    path('org/<slug:orgslugname>/feed.atom', views.petition_feed, name='org_feed'),
     path('org/<slug:orgslugname>/dashboard', views.org_dashboard, name='org_dashboard'),
     path('org/<slug:orgslugname>/leave_org', views.leave_org, name="leave_org"),
     path('org/<slug:orgslugname>/add_user', views.org_add_user, name='org_add_user'),
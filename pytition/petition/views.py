@@ -1,12 +1,12 @@
 import csv
+import itertools
 from datetime import timedelta
 import os
-import urllib.parse
 import random
 from time import time
 
 from django.shortcuts import render, redirect
-from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext as _
@@ -21,7 +21,11 @@ from django.contrib.auth.models import User
 from django.contrib.auth.forms import PasswordChangeForm
 from django.urls import reverse
 from django.utils.decorators import method_decorator
-from django.utils.timezone import now
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt, csrf_protect, ensure_csrf_cookie
+from django.middleware.csrf import get_token
+from django.utils.timezone import is_naive, make_aware, now
+from django.utils.dateparse import parse_datetime
 from django.core.files.storage import FileSystemStorage
 from django.core.paginator import Paginator
 from django.views.generic.edit import CreateView
@@ -29,16 +33,26 @@ from django.views.generic.edit import CreateView
 from formtools.wizard.views import SessionWizardView
 
 from .models import Petition, Signature, Organization, PytitionUser, PetitionTemplate, Permission
-from .models import SlugModel, ModerationReason, Moderation
+from .models import SlugModel, ModerationReason, Moderation, SignatureStat
 from .forms import SignatureForm, ContentFormPetition, EmailForm, NewsletterForm, SocialNetworkForm, ContentFormTemplate
 from .forms import StyleForm, PetitionCreationStep1, PetitionCreationStep2, PetitionCreationStep3, UpdateInfoForm
 from .forms import DeleteAccountForm, OrgCreationForm
 from .helpers import get_client_ip, get_session_user, petition_from_id
 from .helpers import check_petition_is_accessible
-from .helpers import send_confirmation_email, subscribe_to_newsletter, send_welcome_mail
+from .helpers import confirmation_email_is_due, confirmation_email_was_sent, confirmation_url, send_confirmation_email, subscribe_to_newsletter, send_welcome_mail
+from .helpers import run_in_background
 from .helpers import get_update_form, petition_detail_meta
 from .helpers import sanitize_html
 from .helpers import remove_user_moderated
+from .images import EXTENSIONS, InvalidImage, MaxSizeUploadHandler, add_srcset, check_image, generate_variants, \
+    strip_metadata
+from .media import store as store_media
+from .metrics import is_allowed, render as render_metrics
+from .sitemaps import PetitionFeed, cached_response, render_sitemap, render_sitemap_index
+from .slugs import resolve_slug
+from . import autocomplete
+from . import signature_buffer
+from . import tracing
 
 
 #------------------------------------ Views -----------------------------------
@@ -78,7 +92,7 @@ def index(request):
             user = request.user
         sort = request.GET.get('sort', 'desc')
         creation_date = '-creation_date' if sort == 'desc' else 'creation_date'
-        all_petitions = Petition.objects.filter(published=True, moderated=False).order_by(creation_date)
+        all_petitions = Petition.objects.summary().filter(published=True, moderated=False).order_by(creation_date)
         all_petitions = remove_user_moderated(all_petitions)
         paginator = Paginator(all_petitions, settings.PAGINATOR_COUNT)
         page = request.GET.get('page')
@@ -130,12 +144,12 @@ def show_sympa_subscribe_bloc(request, petition_id):
 def search(request):
     q = request.GET.get('q', '')
     if q != "":
-        petitions = Petition.objects.filter(Q(title__icontains=q) | Q(text__icontains=q)).filter(published=True,
-                                                                                                 moderated=False)[:15]
-        petitions = remove_user_moderated(petitions)
+        petitions = Petition.objects.summary().filter(Q(title__icontains=q) | Q(text__icontains=q))\
+            .filter(published=True, moderated=False)
+        petitions = remove_user_moderated(petitions)[:15]
         orgs = Organization.objects.filter(name__icontains=q)
     else:
-        petitions = Petition.objects.filter(published=True, moderated=False).order_by('-id')
+        petitions = Petition.objects.summary().filter(published=True, moderated=False).order_by('-id')
         petitions = remove_user_moderated(petitions)
         paginator = Paginator(petitions, settings.PAGINATOR_COUNT)
         page = request.GET.get('page')
@@ -192,18 +206,15 @@ def detail(request, petition_id):
 # /<int:petition_id>/confirm/<confirmation_hash>
 # Confirm signature to a petition
 def confirm(request, petition_id, confirmation_hash):
-    petition = petition_from_id(petition_id)
+    petition = petition_from_id(petition_id, summary=True)
     check_petition_is_accessible(request, petition)
-    try:
-        successmsg = petition.confirm_signature(confirmation_hash)
-        if successmsg is None:
-            messages.error(request, _("Error: This confirmation code is invalid. Maybe you\'ve already confirmed?"))
-        else:
-            messages.success(request, successmsg)
-            request.session['just_confirmed'] = True
-    except ValidationError as e:
-        messages.error(request, _(e.message))
-    except Signature.DoesNotExist:
+    outcome = petition.confirm_signature(confirmation_hash)
+    if outcome in (Signature.CONFIRMED, Signature.ALREADY_CONFIRMED):
+        messages.success(request, _("Thank you for confirming your signature!"))
+        request.session['just_confirmed'] = True
+    elif outcome == Signature.ALREADY_SIGNED:
+        messages.error(request, _("You already signed the petition"))
+    else:
         messages.error(request, _("Error: This confirmation code is invalid."))
     return redirect(petition.url)
 
@@ -225,6 +236,8 @@ def get_csv_signature(request, petition_id, only_confirmed):
             return JsonResponse({}, status=403)
 
     filename = '{}.csv'.format(petition)
+    if petition.archived and petition.archive_file:
+        return get_csv_archived_signature(petition, filename, only_confirmed)
     signatures = Signature.objects.filter(petition = petition)
     if only_confirmed:
         signatures = signatures.filter(confirmed = True)
@@ -241,6 +254,97 @@ def get_csv_signature(request, petition_id, only_confirmed):
     return response
 
 
+# Stream the CSV export of an archived petition from its archive file
+class Echo:
+    def write(self, value):
+        return value
+
+
+def get_csv_archived_signature(petition, filename, only_confirmed):
+    attrs = ['first_name', 'last_name', 'phone', 'email', 'subscribed_to_mailinglist', 'confirmed']
+    writer = csv.writer(Echo())
+    rows = petition.archived_signature_rows(only_confirmed)
+    header = next(rows)
+    columns = [header.index(attr) for attr in attrs]
+    lines = (writer.writerow([row[i] for i in columns]) for row in rows)
+    response = StreamingHttpResponse(itertools.chain([writer.writerow(attrs)], lines), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment;filename={}'.format(filename).replace('\r\n', '').replace(' ', '%20')
+    return response
+
+
+# /metrics
+# Prometheus metrics, see settings.METRICS_ENABLED
+def metrics(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404(_("Metrics are disabled"))
+    if not is_allowed(request.META.get('REMOTE_ADDR', ''), settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# An aware datetime from an ISO 8601 query parameter, None if it is empty, ValueError if it is invalid
+def parse_stats_datetime(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError("{} is not an ISO 8601 datetime".format(value))
+    if is_naive(parsed):
+        # In the current time zone, the hours skipped or repeated by DST changes are not an error
+        parsed = make_aware(parsed, is_dst=False)
+    return parsed
+
+
+# <int:petition_id>/signature_stats?since=<iso datetime>&until=<iso datetime>
+# returns the hourly signature statistics of a petition
+@login_required
+def signature_stats(request, petition_id):
+    user = get_session_user(request)
+    try:
+        petition = Petition.objects.get(pk=petition_id)
+    except Petition.DoesNotExist:
+        return JsonResponse({}, status=404)
+
+    if petition.owner_type == "org" and not petition.org.is_allowed_to(user, "can_view_signatures"):
+        return JsonResponse({}, status=403)
+    elif petition.owner_type == "user" and petition.owner != user:
+        return JsonResponse({}, status=403)
+
+    try:
+        since = parse_stats_datetime(request.GET.get('since', ''))
+        until = parse_stats_datetime(request.GET.get('until', ''))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if since is None:
+        since = now() - timedelta(hours=settings.SIGNATURE_STATS_HOURS)
+    stats = petition.signature_stats(since, until)
+    return JsonResponse({'petition': petition.id,
+                         'stats': [stat.to_json for stat in stats]})
+
+
+# Build the per-petition hourly charts displayed on the dashboards
+# Only the SignatureStat rollup table is read, in a single query
+def dashboard_signature_stats(petitions):
+    nb_hours = settings.SIGNATURE_STATS_HOURS
+    last_hour = SignatureStat.truncate(now())
+    first_hour = last_hour - timedelta(hours=nb_hours - 1)
+    charts = {petition.id: [0] * nb_hours for petition in petitions}
+    stats = SignatureStat.objects.filter(petition__in=list(charts), hour__gte=first_hour)\
+        .values_list('petition_id', 'hour', 'new')
+    for petition_id, hour, new in stats:
+        index = int((hour - first_hour).total_seconds() // 3600)
+        if 0 <= index < nb_hours:
+            charts[petition_id][index] += new
+    for petition_id, hours in charts.items():
+        highest = max(hours) or 1
+        bars = []
+        for i, value in enumerate(hours):
+            height = 100 * value // highest
+            bars.append({'x': i, 'y': 100 - height, 'height': height, 'value': value})
+        charts[petition_id] = {'total': sum(hours), 'bars': bars}
+    return charts
+
+
 # resend/<int:signature_id>
 # resend the signature confirmation email
 @login_required
@@ -257,36 +361,61 @@ def create_signature(request, petition_id):
     petition = petition_from_id(petition_id)
     check_petition_is_accessible(request, petition)
 
+    if request.method == "POST" and petition.archived:
+        messages.error(request, _("This petition is closed, it does not accept signatures anymore."))
+        return redirect(petition.url)
+
     if request.method == "POST":
         form = SignatureForm(petition=petition, data=request.POST)
         if not form.is_valid():
             return render(request, 'petition/petition_detail.html', {'petition': petition, 'form': form, 'meta': petition_detail_meta(request, petition_id)})
 
-        ipaddr = make_password(
-                get_client_ip(request),
-                salt=petition.salt.encode('utf-8'))
+        with tracing.start_as_current_span('make_password'):
+            ipaddr = make_password(
+                    get_client_ip(request),
+                    salt=petition.salt.encode('utf-8'))
         since = now() - timedelta(seconds=settings.SIGNATURE_THROTTLE_TIMING)
         signatures = Signature.objects.filter(
             petition=petition,
             ipaddress=ipaddr,
-            date__gt=since)
-        if signatures.count() > settings.SIGNATURE_THROTTLE:
+            date__gt=since).count()
+        if signature_buffer.is_enabled():
+            # Not in the database yet, but signed within the throttle timing
+            signatures += signature_buffer.count(petition.id, ipaddr)
+        if signatures > settings.SIGNATURE_THROTTLE:
             messages.error(request, _("Too many signatures from your IP address, please try again later."))
             return render(request, 'petition/petition_detail.html', {'petition': petition, 'form': form, 'meta': petition_detail_meta(request, petition_id)})
         else:
-            signature = form.save()
-            signature.ipaddress = ipaddr
-            signature.save()
-            send_confirmation_email(request, signature)
-            messages.success(request,
-                format_html(_("Thank you for signing this petition, an email has just been sent to you at your address \'{}\'" \
-                " in order to confirm your signature.<br>" \
-                "You will need to click on the confirmation link in the email.<br>" \
-                "If you cannot find the email in your Inbox, please have a look in your Spam box.")\
-                , signature.email))
-
-        if petition.has_newsletter and signature.subscribed_to_mailinglist:
-            subscribe_to_newsletter(petition, signature.email)
+            form.instance.ipaddress = ipaddr
+            if signature_buffer.is_enabled():
+                signature = form.save(commit=False)
+            else:
+                signature = form.save()
+            if signature.pk is None:
+                # Written and confirmed by mail by the flush_signatures command, unless an email was sent lately
+                email_sent = not confirmation_email_was_sent(signature)
+                signature_buffer.append(signature, confirmation_url(request, signature))
+            else:
+                email_sent = confirmation_email_is_due(signature)
+                if email_sent:
+                    send_confirmation_email(request, signature, background=True)
+            if email_sent:
+                messages.success(request,
+                    format_html(_("Thank you for signing this petition, an email has just been sent to you at your address \'{}\'" \
+                    " in order to confirm your signature.<br>" \
+                    "You will need to click on the confirmation link in the email.<br>" \
+                    "If you cannot find the email in your Inbox, please have a look in your Spam box.")\
+                    , signature.email))
+            else:
+                messages.success(request,
+                    format_html(_("Thank you for signing this petition, an email has already been sent to you lately at your address \'{}\'" \
+                    " in order to confirm your signature.<br>" \
+                    "You will need to click on the confirmation link in the email.<br>" \
+                    "If you cannot find the email in your Inbox, please have a look in your Spam box.")\
+                    , signature.email))
+
+        if petition.has_newsletter and signature.subscribed_to_mailinglist and not signature_buffer.is_enabled():
+            run_in_background(subscribe_to_newsletter, petition, signature.email)
 
     return redirect(petition.url)
 
@@ -317,12 +446,13 @@ def org_dashboard(request, orgslugname):
         return redirect("user_dashboard")
 
     can_create_petition = org.is_allowed_to(pytitionuser, "can_create_petitions")
-    petitions = org.petition_set.all()
+    petitions = org.petition_set.summary()
     other_orgs = pytitionuser.organization_set.filter(~Q(name=org.name)).all()
     return render(request, 'petition/org_dashboard.html',
             {'org': org, 'user': pytitionuser, "other_orgs": other_orgs,
             'petitions': petitions, 'user_permissions': permissions,
-             'can_create_petition': can_create_petition})
+             'can_create_petition': can_create_petition,
+             'signature_stats': dashboard_signature_stats(petitions)})
 
 
 # /user/dashboard
@@ -330,12 +460,13 @@ def org_dashboard(request, orgslugname):
 @login_required
 def user_dashboard(request):
     user = get_session_user(request)
-    petitions = user.petition_set.all()
+    petitions = user.petition_set.summary()
 
     return render(
         request,
         'petition/user_dashboard.html',
-        {'user': user, 'petitions': petitions, 'can_create_petition': True}
+        {'user': user, 'petitions': petitions, 'can_create_petition': True,
+         'signature_stats': dashboard_signature_stats(petitions)}
     )
 
 
@@ -348,7 +479,7 @@ def user_profile(request, user_name):
         raise Http404(_("not found"))
     sort = request.GET.get('sort', 'desc')
     creation_date = '-creation_date' if sort == 'desc' else 'creation_date'
-    petitions = user.petition_set.filter(published=True, moderated=False).order_by(creation_date)
+    petitions = user.petition_set.summary().filter(published=True, moderated=False).order_by(creation_date)
     petitions = remove_user_moderated(petitions)
     paginator = Paginator(petitions, settings.PAGINATOR_COUNT)
     page = request.GET.get('page')
@@ -400,7 +531,7 @@ def org_profile(request, orgslugname):
 
     sort = request.GET.get('sort', 'desc')
     creation_date = '-creation_date' if sort == 'desc' else 'creation_date'
-    petitions = org.petition_set.filter(published=True, moderated=False).order_by(creation_date)
+    petitions = org.petition_set.summary().filter(published=True, moderated=False).order_by(creation_date)
     petitions = remove_user_moderated(petitions)
     paginator = Paginator(petitions, settings.PAGINATOR_COUNT)
     page = request.GET.get('page')
@@ -422,14 +553,10 @@ def org_profile(request, orgslugname):
 @login_required
 def get_user_list(request):
     q = request.GET.get('q', '')
-    if q != "":
-        users = PytitionUser.objects.filter(Q(user__username__contains=q) | Q(user__first_name__icontains=q) |
-                                            Q(user__last_name__icontains=q)).all()
-    else:
-        users =  []
+    users = autocomplete.search('users', q)
 
     userdict = {
-        "values": [user.user.username for user in users],
+        "values": [user['username'] for user in users],
     }
     return JsonResponse(userdict)
 
@@ -631,12 +758,11 @@ def edit_template(request, template_id):
             submitted_ctx['content_form_submitted'] = True
             if content_form.is_valid():
                 template.name = content_form.cleaned_data['name']
-                template.text = content_form.cleaned_data['text']
+                template.text = add_srcset(content_form.cleaned_data['text'])
                 template.side_text = content_form.cleaned_data['side_text']
                 template.footer_text = content_form.cleaned_data['footer_text']
                 template.footer_links = content_form.cleaned_data['footer_links']
                 template.sign_form_footer = content_form.cleaned_data['sign_form_footer']
-                template.save()
         else:
             content_form = ContentFormTemplate({f: getattr(template, f) for f in ContentFormTemplate.base_fields})
 
@@ -646,7 +772,6 @@ def edit_template(request, template_id):
             submitted_ctx['email_form_submitted'] = True
             if email_form.is_valid():
                 template.confirmation_email_reply = email_form.cleaned_data['confirmation_email_reply']
-                template.save()
         else:
             email_form = EmailForm({f: getattr(template, f) for f in EmailForm.base_fields})
 
@@ -654,18 +779,14 @@ def edit_template(request, template_id):
             social_network_form = SocialNetworkForm(request.POST, request.FILES)
             submitted_ctx['social_network_form_submitted'] = True
             if social_network_form.is_valid():
-                storage = FileSystemStorage()
                 file = social_network_form.cleaned_data['twitter_image']
                 if file:
-                    path = os.path.join(storage.location, pytitionuser.username, file.name)
-                    name = storage._save(path, file)
-                    newrelpath = os.path.relpath(name, storage.location)
-                    template.twitter_image = urllib.parse.urljoin(settings.MEDIA_URL, newrelpath)
+                    name = store_media(file, os.path.splitext(file.name)[1])[0]
+                    template.twitter_image = FileSystemStorage().url(name)
                 if social_network_form.cleaned_data['remove_twitter_image']:
                     template.twitter_image = ""
                 template.twitter_description = social_network_form.cleaned_data['twitter_description']
                 template.org_twitter_handle = social_network_form.cleaned_data['org_twitter_handle']
-                template.save()
         else:
             remove_fields = ["twitter_image", "remove_twitter_image"]
             fields = dict((k, v) for k,v in SocialNetworkForm.base_fields.items() if k not in remove_fields)
@@ -690,7 +811,6 @@ def edit_template(request, template_id):
                 template.newsletter_subscribe_mail_smtp_password = newsletter_form.cleaned_data['newsletter_subscribe_mail_smtp_password']
                 template.newsletter_subscribe_mail_smtp_tls = newsletter_form.cleaned_data['newsletter_subscribe_mail_smtp_tls']
                 template.newsletter_subscribe_mail_smtp_starttls = newsletter_form.cleaned_data['newsletter_subscribe_mail_smtp_starttls']
-                template.save()
         else:
             newsletter_form = NewsletterForm({f: getattr(template, f) for f in NewsletterForm.base_fields})
 
@@ -702,9 +822,10 @@ def edit_template(request, template_id):
                 template.linear_gradient_direction = style_form.cleaned_data['linear_gradient_direction']
                 template.gradient_from = style_form.cleaned_data['gradient_from']
                 template.gradient_to = style_form.cleaned_data['gradient_to']
-                template.save()
         else:
             style_form = StyleForm({f: getattr(template, f) for f in StyleForm.base_fields})
+        # One write for all the submitted forms, of the changed columns only
+        template.save()
     else:
         remove_fields = ["twitter_image", "remove_twitter_image"]
         fields = dict((k, v) for k, v in SocialNetworkForm.base_fields.items() if k not in remove_fields)
@@ -1111,7 +1232,7 @@ class PetitionCreationWizard(SessionWizardView):
             context.update({'org': org,
                             'user_permissions': permissions})
         else:
-            petitions = pytitionuser.petition_set.all()
+            petitions = pytitionuser.petition_set.summary()
             context.update({'petitions': petitions})
 
         if self.steps.current == "step3":
@@ -1129,14 +1250,14 @@ def petition_delete(request, petition_id):
 
     if petition.owner_type == "user":
         if petition.user == pytitionuser:
-            petition.delete()
+            petition.soft_delete()
             return JsonResponse({})
         else:
             return JsonResponse({}, status=403)
     else:  # an organization owns the petition
         userperms = Permission.objects.get(organization=petition.org, user=pytitionuser)
         if userperms.can_delete_petitions:
-            petition.delete()
+            petition.soft_delete()
             return JsonResponse({})
         else:
             return JsonResponse({}, status=403)
@@ -1221,12 +1342,11 @@ def edit_petition(request, petition_id):
                 petition.title = content_form.cleaned_data['title']
                 petition.target = content_form.cleaned_data['target']
                 petition.paper_signatures = content_form.cleaned_data['paper_signatures']
-                petition.text = content_form.cleaned_data['text']
+                petition.text = add_srcset(content_form.cleaned_data['text'])
                 petition.side_text = content_form.cleaned_data['side_text']
                 petition.footer_text = content_form.cleaned_data['footer_text']
                 petition.footer_links = content_form.cleaned_data['footer_links']
                 petition.sign_form_footer = content_form.cleaned_data['sign_form_footer']
-                petition.save()
         else:
             content_form = ContentFormPetition({f: getattr(petition, f) for f in ContentFormPetition.base_fields})
 
@@ -1235,7 +1355,6 @@ def edit_petition(request, petition_id):
             email_form = EmailForm(request.POST)
             if email_form.is_valid():
                 petition.confirmation_email_reply = email_form.cleaned_data['confirmation_email_reply']
-                petition.save()
         else:
             email_form = EmailForm({f: getattr(petition, f) for f in EmailForm.base_fields})
 
@@ -1243,18 +1362,14 @@ def edit_petition(request, petition_id):
             submitted_ctx['social_network_form_submitted'] = True
             social_network_form = SocialNetworkForm(request.POST, request.FILES)
             if social_network_form.is_valid():
-                storage = FileSystemStorage()
                 file = social_network_form.cleaned_data['twitter_image']
                 if file:
-                    path = os.path.join(storage.location, pytitionuser.username, file.name)
-                    name = storage._save(path, file)
-                    newrelpath = os.path.relpath(name, storage.location)
-                    petition.twitter_image = urllib.parse.urljoin(settings.MEDIA_URL, newrelpath)
+                    name = store_media(file, os.path.splitext(file.name)[1])[0]
+                    petition.twitter_image = FileSystemStorage().url(name)
                 if social_network_form.cleaned_data['remove_twitter_image']:
                     petition.twitter_image = ""
                 petition.twitter_description = social_network_form.cleaned_data['twitter_description']
                 petition.org_twitter_handle = social_network_form.cleaned_data['org_twitter_handle']
-                petition.save()
         else:
             data = {'twitter_description': petition.twitter_description,
                     'org_twitter_handle': petition.org_twitter_handle}
@@ -1280,7 +1395,6 @@ def edit_petition(request, petition_id):
                 petition.newsletter_subscribe_mail_smtp_password = newsletter_form.cleaned_data['newsletter_subscribe_mail_smtp_password']
                 petition.newsletter_subscribe_mail_smtp_tls = newsletter_form.cleaned_data['newsletter_subscribe_mail_smtp_tls']
                 petition.newsletter_subscribe_mail_smtp_starttls = newsletter_form.cleaned_data['newsletter_subscribe_mail_smtp_starttls']
-                petition.save()
         else:
             newsletter_form = NewsletterForm({f: getattr(petition, f) for f in NewsletterForm.base_fields})
 
@@ -1292,9 +1406,10 @@ def edit_petition(request, petition_id):
                 petition.linear_gradient_direction = style_form.cleaned_data['linear_gradient_direction']
                 petition.gradient_from = style_form.cleaned_data['gradient_from']
                 petition.gradient_to = style_form.cleaned_data['gradient_to']
-                petition.save()
         else:
             style_form = StyleForm({f: getattr(petition, f) for f in StyleForm.base_fields})
+        # One write for all the submitted forms, of the changed columns only
+        petition.save()
     else:
         data = {'twitter_description': petition.twitter_description,
                 'org_twitter_handle': petition.org_twitter_handle}
@@ -1379,7 +1494,7 @@ def show_signatures(request, petition_id):
         selected_signature_ids = request.POST.getlist('signature_id', '')
         failed = False
         if selected_signature_ids and action:
-            selected_signatures = Signature.objects.filter(pk__in=selected_signature_ids)
+            selected_signatures = petition.signature_set.filter(pk__in=selected_signature_ids)
             if action == "delete":
                 for s in selected_signatures:
                     pet = s.petition
@@ -1531,22 +1646,10 @@ def slug_show_petition(request, orgslugname=None, username=None, petitionname=No
     except:
         pytitionuser = None
 
-    if orgslugname:
-        try:
-            org = Organization.objects.get(slugname=orgslugname)
-            slug = SlugModel.objects.get(slug=petitionname, petition__org=org)
-        except (Organization.DoesNotExist, SlugModel.DoesNotExist):
-            raise Http404(_("Sorry, we are not able to find this petition"))
-        petition = slug.petition
-    else:
-        try:
-            user = PytitionUser.objects.get(user__username=username)
-            slug = SlugModel.objects.get(slug=petitionname, petition__user=user)
-        except PytitionUser.DoesNotExist:
-            raise Http404(_("Sorry, we are not able to find this petition"))
-        except SlugModel.DoesNotExist:
-            raise Http404(_("Sorry, we are not able to find this petition"))
-        petition = slug.petition
+    petition_id = resolve_slug(petitionname, orgslugname=orgslugname, username=username)
+    if petition_id is None:
+        raise Http404(_("Sorry, we are not able to find this petition"))
+    petition = petition_from_id(petition_id)
     check_petition_is_accessible(request, petition)
     sign_form = SignatureForm(petition=petition)
 
@@ -1567,6 +1670,44 @@ def slug_show_petition(request, orgslugname=None, username=None, petitionname=No
         return render(request, "petition/petition_detail.html", ctx)
 
 
+# GET /sitemap.xml
+# Index of the sitemaps of the published petitions
+def sitemap_index(request):
+    return cached_response(request, ('index',), lambda: render_sitemap_index(request), 'application/xml')
+
+
+# GET /sitemap-<int:shard>.xml
+# Sitemap of the published petitions of a range of ids
+def sitemap(request, shard):
+    shard = int(shard)
+    return cached_response(request, ('sitemap:{}'.format(shard),), lambda: render_sitemap(request, shard),
+                           'application/xml')
+
+
+# GET /petition/feed
+# GET /petition/org/<slug:orgslugname>/feed.atom
+# Atom feed of the latest published petitions
+def petition_feed(request, orgslugname=None):
+    if orgslugname is None:
+        names = ('feed',)
+    else:
+        try:
+            org = Organization.objects.only('id').get(slugname=orgslugname)
+        except Organization.DoesNotExist:
+            raise Http404(_("not found"))
+        names = ('feed:org', 'feed:org:{}'.format(org.id))
+    return cached_response(request, names, lambda: PetitionFeed()(request, orgslugname=orgslugname).content,
+                           'application/atom+xml; charset=utf-8')
+
+
+# GET /petition/csrf_token
+# CSRF token of the sign form of the pre-rendered petition pages
+@never_cache
+@ensure_csrf_cookie
+def csrf_token(request):
+    return JsonResponse({'token': get_token(request)})
+
+
 # /<int:petition_id>/add_new_slug
 # Add a new slug for a petition
 @login_required
@@ -1629,23 +1770,43 @@ def del_slug(request, petition_id):
     return redirect(reverse("edit_petition", args=[petition_id]) + "#tab_social_network_form")
 
 
+# The upload is streamed through MaxSizeUploadHandler, which must be installed
+# before the CSRF middleware reads the request body
 @login_required
+@csrf_exempt
 def image_upload(request):
-    pytitionuser = get_session_user(request)
+    request.upload_handlers.insert(0, MaxSizeUploadHandler(request))
+    return _image_upload(request)
 
+
+@csrf_protect
+def _image_upload(request):
     if request.method != "POST":
         return HttpResponseForbidden()
 
     file = request.FILES.get('file', '')
+    if request.upload_handlers[0].too_large:
+        return JsonResponse({'error': _("This image is too large, the maximum size is {} MB.")
+                            .format(settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024))}, status=413)
     if file == '':
         return HttpResponseForbidden()
+    try:
+        image_format = check_image(file)
+    except InvalidImage as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-    storage = FileSystemStorage()
-    path = os.path.join(storage.location, pytitionuser.username, file.name)
-    name = storage._save(path, file)
-    newrelpath = os.path.relpath(name, storage.location)
+    name, created = store_media(file, EXTENSIONS[image_format])
+    if created:
+        # The metadata must not be served, the variants can wait for process_images
+        try:
+            image = strip_metadata(name)
+        except (OSError, ValueError):
+            FileSystemStorage().delete(name)
+            return JsonResponse({'error': _("This file is not an image.")}, status=400)
+        if image is not None and settings.BACKGROUND_IO_WORKERS:
+            run_in_background(generate_variants, name, image)
 
-    return JsonResponse({'location': storage.base_url + newrelpath})
+    return JsonResponse({'location': FileSystemStorage().url(name)})
 
 
 # /transfer_petition/<int:petition_id>
@@ -1721,20 +1882,15 @@ def transfer_petition(request, petition_id):
 @login_required
 def search_users_and_orgs(request):
     query = request.GET.get('q', '')
-    if query != "":
-        users = PytitionUser.objects.filter(Q(user__username__contains=query) | Q(user__first_name__icontains=query) |
-                                            Q(user__last_name__icontains=query)).all()
-        orgs = Organization.objects.filter(name__icontains=query).all()
-    else:
-        users = []
-        orgs = []
+    users = autocomplete.search('users', query)
+    orgs = autocomplete.search('orgs', query)
 
     result = {
-        "orgs": [{'slugname': org.slugname,
-                  'name': org.name} for org in orgs],
-        "users": [{'username': user.user.username,
-                   'firstname': user.user.first_name,
-                   'lastname': user.user.last_name} for user in users]
+        "orgs": [{'slugname': org['slugname'],
+                  'name': org['name']} for org in orgs],
+        "users": [{'username': user['username'],
+                   'firstname': user['first_name'],
+                   'lastname': user['last_name']} for user in users]
     }
     return JsonResponse(result)
 
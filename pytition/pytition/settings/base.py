@@ -40,15 +40,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'petition.middleware.MetricsMiddleware',
+    'petition.middleware.TracingMiddleware',
+    'petition.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'petition.middleware.AdmissionControlMiddleware',
+    'petition.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'maintenance_mode.middleware.MaintenanceModeMiddleware',
+    'petition.middleware.ReplicaRoutingMiddleware',
 ]
 
 PASSWORD_HASHERS = [
@@ -84,8 +90,28 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'pytition.wsgi.application'
 
+#:| Aliases (keys of ``DATABASES``) of read-only replicas of the ``default`` database.
+#:| When set, anonymous GET requests to the views listed in ``DATABASE_REPLICA_VIEWS``
+#:| (public petition pages, listings, profiles and JSON counters) read from a randomly
+#:| chosen replica, every other request and every write go to ``default``.
+#:| A client whose request wrote to the database (signing, confirming, editing...), whatever
+#:| its method, reads from ``default`` during ``DATABASE_REPLICA_PIN_SECONDS`` so that it sees
+#:| its own writes.
+#:
+#: Example::
+#:
+#:   DATABASES = {
+#:       'default': {...},
+#:       'replica1': {..., 'TEST': {'MIRROR': 'default'}},
+#:   }
+#:   DATABASE_REPLICAS = ['replica1']
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_VIEWS = ['index', 'search', 'detail', 'slug_show_petition', 'user_profile', 'org_profile']
+DATABASE_REPLICA_PIN_SECONDS = 60
+DATABASE_ROUTERS = ['petition.routers.ReplicaRouter']
+
 if os.environ.get('USE_POSTGRESQL'):
-    from .pgsql import DATABASES
+    from .pgsql import DATABASES, DATABASE_REPLICAS
 
 #:| Set it to ``True`` if you want email sending to retry upon failure.
 #:| Email transmition naturally have retries *if the first SMTP server accepts it*
@@ -106,6 +132,15 @@ USE_MAIL_QUEUE = False
 # set it to True if you use the 'mailer' backend, and a external Crontab has been set
 MAIL_EXTERNAL_CRON_SET = False
 
+#:| Number of threads used to send the signature confirmation and welcome emails and to
+#:| subscribe signatories to newsletters once the response has been computed.
+#:| With the default ``0``, this I/O is done synchronously and a slow SMTP server or
+#:| newsletter endpoint holds a whole worker during each signature.
+#:| If you use uwsgi, threads must be enabled (``enable-threads = true``).
+#:| Emails sent in the background are not retried on failure, only logged: combine it with
+#:| ``USE_MAIL_QUEUE`` if you need retries.
+BACKGROUND_IO_WORKERS = 0
+
 # number of seconds to wait before sending emails. This will be usefull only if USE_MAIL_QUEUE=True and uwsgi is used
 UWSGI_WAIT_FOR_MAIL_SEND_IN_S = 10
 # number of seconds to wait before retrying emails. This will be usefull only if USE_MAIL_QUEUE=True and uwsgi is used
@@ -114,6 +149,91 @@ UWSGI_WAIT_FOR_RETRY_IN_S = 1 * 60
 UWSGI_WAIT_FOR_PURGE_IN_S = 1 * 24 * 60 * 60
 UWSGI_NB_DAYS_TO_KEEP = 3
 
+#:| Expose Prometheus metrics at ``/metrics``: requests count and duration, SQL queries count
+#:| and duration per view, emails and newsletter subscriptions duration.
+#:| Only the addresses or networks listed in ``METRICS_ALLOWED_IPS`` can read them.
+#:| Metrics are kept per process: with several uwsgi processes, each one exposes its own.
+METRICS_ENABLED = False
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+#:| Log the SQL queries lasting more than ``SLOW_QUERY_THRESHOLD_MS`` milliseconds, with the view,
+#:| the petition or organization and the Pytition code which issued them, as JSON lines in
+#:| ``SLOW_QUERY_LOG``. It is rotated every ``SLOW_QUERY_LOG_MAX_BYTES`` bytes and
+#:| ``SLOW_QUERY_LOG_BACKUP_COUNT`` old files are kept.
+#:| ``manage.py slow_queries`` reports them grouped by query. ``None`` disables the log.
+SLOW_QUERY_THRESHOLD_MS = None
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+
+#:| Process at most ``ADMISSION_CONTROL_CONCURRENCY`` anonymous requests to the public write views
+#:| of ``ADMISSION_CONTROL_VIEWS`` at once on the host, all uwsgi processes and threads together,
+#:| the other ones waiting ``ADMISSION_CONTROL_QUEUE_TIMEOUT`` seconds at most for their turn before
+#:| being answered a "please retry" page with the 503 status and a ``Retry-After`` of
+#:| ``ADMISSION_CONTROL_RETRY_AFTER`` seconds. Set it below the number of uwsgi workers (``processes``
+#:| times ``threads``) so that authenticated users, which are never limited, still get served when a
+#:| petition goes viral. The slots are locks on files of ``ADMISSION_CONTROL_LOCK_DIR``, which must be
+#:| local to the host and distinct for each Pytition instance.
+#:| The refused requests are counted in the ``pytition_admission_shed_total`` metric.
+#:| ``None`` disables the limit.
+ADMISSION_CONTROL_CONCURRENCY = None
+ADMISSION_CONTROL_VIEWS = ['create_signature', 'confirm', 'report_petition']
+ADMISSION_CONTROL_QUEUE_TIMEOUT = 2
+ADMISSION_CONTROL_RETRY_AFTER = 10
+ADMISSION_CONTROL_LOCK_DIR = os.path.join(BASE_DIR, 'admission')
+
+#:| A signature sent again for a petition by the same email address (double click, retried request)
+#:| leaves its pending unconfirmed signature unchanged, whose confirmation link is sent again. A single
+#:| confirmation email is sent per email address and petition every ``SIGNATURE_EMAIL_WINDOW`` seconds.
+SIGNATURE_EMAIL_WINDOW = 300
+
+#:| Path of a SQLite file where the signatures are buffered instead of being written to the database
+#:| by the signing requests, to absorb extreme spikes. ``./manage.py flush_signatures --loop`` must then
+#:| run on each host serving Pytition to write them by batches of ``SIGNATURE_BUFFER_BATCH_SIZE``
+#:| and send their confirmation emails. ``None`` writes them right away.
+SIGNATURE_BUFFER = None
+SIGNATURE_BUFFER_BATCH_SIZE = 1000
+
+#:| Record a trace of each request, with spans for its SQL queries, password hashing, emails
+#:| and newsletter subscriptions. Traces are appended to ``TRACING_FILE`` in the OTLP/JSON format,
+#:| which the OpenTelemetry collector can import with its ``otlpjsonfile`` receiver.
+#:| ``manage.py traces`` shows the timeline of the last ones.
+TRACING_ENABLED = False
+TRACING_FILE = os.path.join(BASE_DIR, 'traces.jsonl')
+
+#:| Let staff users profile a request by adding ``?profile=1`` to its URL or by sending
+#:| an ``X-Pytition-Profile`` header. The profile and the SQL queries of the request are
+#:| stored and listed in the admin site, only the last ``PROFILING_RETENTION`` ones are kept.
+#:| Profiling slows the request down a lot, it is meant for diagnosing a given page.
+PROFILING_ENABLED = False
+PROFILING_RETENTION = 100
+
+#:| Deleted petitions are hidden right away, their signatures are then deleted by batches
+#:| of ``PURGE_BATCH_SIZE`` rows, with a pause of ``PURGE_PAUSE_S`` seconds between batches,
+#:| by the ``purge_deleted`` management command.
+#:| When served through uwsgi, this command runs every ``UWSGI_WAIT_FOR_PETITION_PURGE_IN_S``
+#:| seconds for at most ``PURGE_MAX_BATCHES`` batches.
+#:| Otherwise, you must set a cron job such as
+#:| ``*/5 * * * * (/path/to/your/python /path/to/your/manage.py purge_deleted)``
+PURGE_BATCH_SIZE = 1000
+PURGE_PAUSE_S = 0.1
+PURGE_MAX_BATCHES = 50
+UWSGI_WAIT_FOR_PETITION_PURGE_IN_S = 5 * 60
+
+#:| Signatures of archived petitions are moved out of the database into gzipped CSV files
+#:| stored in this directory by the ``archive_petition`` management command.
+#:| Those files contain personal data: this directory must be outside of ``MEDIA_ROOT`` and must
+#:| **not** be served by your web server, owners download them through Pytition which checks
+#:| their permissions.
+ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archives')
+
+#:| When set to a number of days, unpublished petitions which did not receive any signature
+#:| during that many days are archived automatically by ``archive_petition --auto``.
+#:| When served through uwsgi, this runs once a day. Otherwise you must set a cron job such as
+#:| ``0 3 * * * (/path/to/your/python /path/to/your/manage.py archive_petition --auto)``
+ARCHIVE_AFTER_DAYS = None
+UWSGI_WAIT_FOR_ARCHIVE_IN_S = 24 * 60 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -237,6 +357,9 @@ PAGINATOR_COUNT = 12
 SIGNATURE_THROTTLE = 5 # 5 signatures from same IP allowed
 SIGNATURE_THROTTLE_TIMING = 60*60*24 # in a 1 day time frame
 
+# Number of hours of signature statistics shown on the dashboards charts
+SIGNATURE_STATS_HOURS = 48
+
 LANGUAGES = [
     ('en', gettext_lazy('English')),
     ('es', gettext_lazy('Spanish')),
@@ -260,6 +383,61 @@ MEDIA_URL = "/mediaroot/"
 FILE_UPLOAD_PERMISSIONS = 0o640
 FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o750
 
+#:| Uploaded files are stored in this directory, relative to ``MEDIA_ROOT``, named after the hash
+#:| of their content, so that a file uploaded several times is stored once.
+#:| ``manage.py medias_orphan --delete`` removes the files which are not used anymore.
+MEDIA_UPLOAD_DIR = 'uploads'
+
+#:| Images uploaded from the petition editor larger than ``IMAGE_UPLOAD_MAX_SIZE`` bytes
+#:| or ``IMAGE_UPLOAD_MAX_PIXELS`` pixels are refused, and their metadata is stripped. Then
+#:| variants ``IMAGE_VARIANT_WIDTHS`` pixels wide (and one at their own width) are generated
+#:| in ``IMAGE_VARIANT_FORMAT`` (``'WEBP'``, or ``'AVIF'`` if Pillow supports it), in the
+#:| background with ``BACKGROUND_IO_WORKERS``, otherwise by ``manage.py process_images``
+#:| which should then run from cron every few minutes.
+#:| The petitions then offer them to browsers through the ``srcset`` attribute of their images.
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_VARIANT_WIDTHS = [480, 960, 1920]
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
+#: ``sizes`` attribute of the images which have no ``width`` attribute
+IMAGE_SIZES = '(max-width: 800px) 100vw, 800px'
+
+
+#:| The petitions found from their URL (organization or user, and slug) are kept in an
+#:| in-memory LRU cache of ``SLUG_CACHE_SIZE`` entries per process, 0 to disable it.
+#:| The cache is cleared when slugs change, the entries expire after ``SLUG_CACHE_TIMEOUT``
+#:| seconds for these changes to reach the other processes.
+SLUG_CACHE_SIZE = 1024
+SLUG_CACHE_TIMEOUT = 60
+
+#:| The user and organization searches of the invite and transfer dialogs return at most
+#:| ``AUTOCOMPLETE_LIMIT`` results, cached ``AUTOCOMPLETE_CACHE_TIMEOUT`` seconds. They use trigram
+#:| indexes on PostgreSQL (the ``pg_trgm`` extension is created by the migrations), and elsewhere
+#:| an in-memory prefix index of the names, rebuilt at least every ``AUTOCOMPLETE_INDEX_TIMEOUT`` seconds.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+AUTOCOMPLETE_INDEX_TIMEOUT = 300
+
+#:| The published petitions are listed for search engines in ``/sitemap.xml``, which points to
+#:| sitemaps of ``SITEMAP_SHARD_SIZE`` petition ids each, and the ``FEED_SIZE`` latest published
+#:| ones in the Atom feeds ``/petition/feed`` and ``/petition/org/<orgslugname>/feed.atom``.
+#:| They are cached ``SITEMAP_CACHE_TIMEOUT`` seconds at most, and generated again when petitions
+#:| are published, unpublished, moderated or changed. Use a cache shared by the processes
+#:| (see Django's ``CACHES`` setting) for them to be regenerated in all processes at once.
+SITEMAP_SHARD_SIZE = 10000
+SITEMAP_CACHE_TIMEOUT = 3600
+FEED_SIZE = 20
+
+#:| If set, the pages of the published petitions are rendered, as seen by anonymous visitors, to
+#:| ``<STATIC_PETITIONS_ROOT>/petition/<id>/index.html`` and to the paths of their slugs, along with
+#:| their signature counter in ``index.json``, for the web server to serve them directly
+#:| (see the nginx configuration of the installation documentation).
+#:| They are rendered again when petitions change, and ``./manage.py publish_petitions`` renders them all.
+#:| ``STATIC_PETITIONS_SITE_URL`` is the scheme and host of the links of these pages.
+STATIC_PETITIONS_ROOT = None
+STATIC_PETITIONS_SITE_URL = 'https://localhost'
+
 
 #:| If set to True, users won't be able to create petitions in their name, but only for an organization
 DISABLE_USER_PETITION = False
@@ -1,3 +1,4 @@
+import os
 
 DATABASES = {
     'default': {
@@ -9,3 +10,10 @@ DATABASES = {
         'PORT': 5432,
     }
 }
+
+# Comma separated list of read replica hosts, e.g. POSTGRESQL_REPLICA_HOSTS=db-replica1,db-replica2
+DATABASE_REPLICAS = []
+for i, host in enumerate(filter(None, os.environ.get('POSTGRESQL_REPLICA_HOSTS', '').split(','))):
+    alias = 'replica{}'.format(i + 1)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
@@ -15,12 +15,15 @@ Including another URLconf
 """
 from django.conf.urls import url, include
 from django.contrib import admin
-from petition.views import index
+from petition.views import index, metrics, sitemap, sitemap_index
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
     url(r'^$', index, name="index"),
+    url(r'^metrics$', metrics, name="metrics"),
+    url(r'^sitemap\.xml$', sitemap_index, name="sitemap_index"),
+    url(r'^sitemap-(?P<shard>[0-9]+)\.xml$', sitemap, name="sitemap"),
     url(r'^petition/', include('petition.urls')),
     url(r'^admin/', admin.site.urls),
     url(r'^tinymce/', include('tinymce.urls')),
@@ -49,4 +49,21 @@ If you want some mails, you should set MAIL_EXTERNAL_CRON_SET=True and setup the
 """)
             sys.exit(1)
 
+try:
+    import uwsgidecorators
+    from django.core.management import call_command
+
+    @uwsgidecorators.timer(settings.UWSGI_WAIT_FOR_PETITION_PURGE_IN_S)
+    def purge_deleted_petitions(num):
+        """Purge deleted petitions by batches"""
+        call_command('purge_deleted', '--max-batches', settings.PURGE_MAX_BATCHES)
+
+    if settings.ARCHIVE_AFTER_DAYS:
+        @uwsgidecorators.timer(settings.UWSGI_WAIT_FOR_ARCHIVE_IN_S)
+        def archive_petitions(num):
+            """Archive petitions according to ARCHIVE_AFTER_DAYS"""
+            call_command('archive_petition', '--auto')
+except ImportError:
+    pass
+
 application = get_wsgi_application()
\ No newline at end of file